@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import json
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Optional, Sequence
+
+from benchmarks.faults import (
+    FaultConfig,
+    add_fault_arguments,
+    fault_config_from_args,
+)
+from benchmarks.micro import (
+    compare_results,
+    format_comparison,
+    load_results,
+    run_micro,
+    save_results,
+)
+from benchmarks.replay import record, run_replay
+from benchmarks.scenarios import SCENARIOS, ScenarioOptions, run_isolated
+from core.cassette import MEDIA_MODES, MEDIA_MODE_TRUNCATED
+from core.defs.common import AuthToken
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Boosty downloader benchmarks against a local API/CDN stub",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="run end-to-end scenarios")
+    run.add_argument(
+        "scenarios",
+        nargs="*",
+        metavar="scenario",
+        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)",
+    )
+    run.add_argument(
+        "--size-scale",
+        type=float,
+        default=ScenarioOptions.size_scale,
+        help="multiplier for media sizes, 1.0 reproduces full sizes",
+    )
+    add_download_arguments(run)
+    add_fault_arguments(run)
+
+    rec = subparsers.add_parser(
+        "record", help="download posts from Boosty and record the traffic"
+    )
+    rec.add_argument("links", nargs="+", help="post links")
+    rec.add_argument("--cassette", type=Path, required=True)
+    rec.add_argument(
+        "--media",
+        choices=MEDIA_MODES,
+        default=MEDIA_MODE_TRUNCATED,
+        help="how much of media bodies to keep",
+    )
+    rec.add_argument("--auth-token", help="token exported from the app settings")
+    rec.add_argument("--api-base-url", default="https://api.boosty.to")
+    add_download_arguments(rec)
+
+    replay = subparsers.add_parser(
+        "replay", help="run recorded posts through the downloader offline"
+    )
+    replay.add_argument("cassette", type=Path)
+    add_download_arguments(replay)
+    add_fault_arguments(replay)
+
+    micro = subparsers.add_parser("micro", help="run microbenchmarks of hot functions")
+    micro.add_argument("-k", "--keyword", help="only benchmarks containing this text")
+    micro.add_argument("--repeat", type=int, default=5)
+    micro.add_argument(
+        "--save",
+        metavar="NAME",
+        help="store results as .benchmarks/NAME.json (or at the given .json path)",
+    )
+    micro.add_argument(
+        "--compare",
+        metavar="BASELINE",
+        help="compare with a stored baseline and fail on regressions",
+    )
+    micro.add_argument("--threshold", type=float, default=0.15)
+
+    compare = subparsers.add_parser(
+        "compare", help="compare two stored microbenchmark results"
+    )
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument(
+        "--threshold",
+        type=float,
+        default=0.15,
+        help="allowed slowdown of the median, 0.15 = 15%%",
+    )
+    return parser
+
+
+def add_download_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--parallelism", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=153600)
+    parser.add_argument(
+        "--auto-chunk", action="store_true", help="autotune read size per transfer"
+    )
+    parser.add_argument(
+        "--buffer-pool", action="store_true", help="receive into pooled buffers"
+    )
+    parser.add_argument("--workdir", default=None, help="where to put downloaded files")
+    parser.add_argument("-o", "--output", type=Path, help="write the JSON report here")
+
+
+def options_from_args(args: argparse.Namespace) -> ScenarioOptions:
+    return ScenarioOptions(
+        size_scale=getattr(args, "size_scale", ScenarioOptions.size_scale),
+        faults=fault_config_from_args(args) if hasattr(args, "seed") else FaultConfig(),
+        parallelism=args.parallelism,
+        chunk_size=args.chunk_size,
+        auto_chunk=args.auto_chunk,
+        buffer_pool=args.buffer_pool,
+        workdir=args.workdir,
+    )
+
+
+def print_report(report: dict, output: Optional[Path]) -> None:
+    text = json.dumps(report, indent=2)
+    if output:
+        output.write_text(text, encoding="utf-8")
+    print(text)
+
+
+def report_comparison(baseline: dict, current: dict, threshold: float) -> int:
+    rows = compare_results(baseline, current, threshold)
+    print(format_comparison(rows))
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {threshold:.0%}")
+        return 1
+    return 0
+
+
+def run_microbenchmarks(args: argparse.Namespace) -> int:
+    results = run_micro(keyword=args.keyword, repeat=args.repeat)
+    if args.save:
+        print(f"Saved to {save_results(results, args.save)}", file=sys.stderr)
+    if args.compare:
+        return report_comparison(load_results(args.compare), results, args.threshold)
+    for bench in results["benchmarks"]:
+        print(f"{bench['name']:<40} {bench['median'] * 1e6:>12.2f}us")
+    return 0
+
+
+def run_scenarios(args: argparse.Namespace) -> int:
+    options = options_from_args(args)
+    results = []
+    for name in args.scenarios or SCENARIOS.keys():
+        print(f"Running {name}...", file=sys.stderr)
+        results.append(run_isolated(name, options))
+    print_report({"results": results}, args.output)
+    return 0
+
+
+def record_cassette(args: argparse.Namespace) -> int:
+    auth_token = AuthToken.from_str(args.auth_token) if args.auth_token else None
+    folder = Path(tempfile.mkdtemp(prefix="bench_record_", dir=args.workdir))
+    try:
+        result = asyncio.run(
+            record(
+                args.links,
+                args.cassette,
+                args.media,
+                folder,
+                auth_token=auth_token,
+                options=options_from_args(args),
+                api_base_url=args.api_base_url,
+            )
+        )
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    print_report(result, args.output)
+    return 0
+
+
+def replay_cassette(args: argparse.Namespace) -> int:
+    print_report(run_replay(args.cassette, options_from_args(args)), args.output)
+    return 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        # choices не сочетается с пустым nargs="*": имена проверяются здесь
+        unknown = [name for name in args.scenarios if name not in SCENARIOS]
+        if unknown:
+            parser.error(
+                f"unknown scenario(s): {', '.join(unknown)} "
+                f"(choose from {', '.join(SCENARIOS)})"
+            )
+    if getattr(args, "workdir", None):
+        Path(args.workdir).mkdir(parents=True, exist_ok=True)
+    match args.command:
+        case "run":
+            return run_scenarios(args)
+        case "record":
+            return record_cassette(args)
+        case "replay":
+            return replay_cassette(args)
+        case "micro":
+            return run_microbenchmarks(args)
+        case "compare":
+            return report_comparison(
+                load_results(args.baseline), load_results(args.current), args.threshold
+            )
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
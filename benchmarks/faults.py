@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import random
+from dataclasses import dataclass
+
+from aiohttp import web
+
+STREAM_CHUNK = 64 * 1024
+
+
+@dataclass
+class FaultConfig:
+    latency: float = 0.0  # секунды перед каждым ответом
+    bandwidth: int = 0  # байт/с на один ответ, 0 - без ограничения
+    error_rate: float = 0.0  # доля ответов с кодом 500
+    throttle_rate: float = 0.0  # вероятность начала серии ответов 429
+    throttle_burst: int = 5  # длина серии 429
+    retry_after: int = 1
+    reset_rate: float = 0.0  # доля соединений, оборванных посреди тела
+    stall_rate: float = 0.0  # доля ответов с зависанием посреди тела
+    stall_time: float = 5.0
+    seed: int = 1
+
+
+class FaultInjector:
+    """
+    Общая для заглушки и replay-сервера логика сбоев: задержки,
+    ограничение полосы, 500, серии 429, обрывы и зависания тела ответа.
+    """
+
+    def __init__(self, config: FaultConfig):
+        self.config = config
+        self._random = random.Random(config.seed)
+        self._throttled_left = 0
+        self.stats = {
+            "requests": 0,
+            "errors_injected": 0,
+            "throttled": 0,
+            "resets": 0,
+            "stalls": 0,
+            "bytes_sent": 0,
+        }
+
+    def _chance(self, rate: float) -> bool:
+        return bool(rate) and self._random.random() < rate
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        if request.path == "/_stats":
+            return await handler(request)
+        self.stats["requests"] += 1
+        if self.config.latency:
+            await asyncio.sleep(self.config.latency)
+        if not self._throttled_left and self._chance(self.config.throttle_rate):
+            self._throttled_left = self.config.throttle_burst
+        if self._throttled_left:
+            self._throttled_left -= 1
+            self.stats["throttled"] += 1
+            raise web.HTTPTooManyRequests(
+                headers={"Retry-After": str(self.config.retry_after)}
+            )
+        if self._chance(self.config.error_rate):
+            self.stats["errors_injected"] += 1
+            raise web.HTTPInternalServerError()
+        return await handler(request)
+
+    async def stream_body(
+        self, request: web.Request, response: web.StreamResponse, body, size: int
+    ):
+        """
+        Отдает size байт, запрашивая чанки у body(offset, length),
+        соблюдая полосу и вставляя обрывы и зависания
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        reset_at = (
+            self._random.randrange(size)
+            if size and self._chance(self.config.reset_rate)
+            else None
+        )
+        stall_at = (
+            self._random.randrange(size)
+            if size and self._chance(self.config.stall_rate)
+            else None
+        )
+        sent = 0
+        while sent < size:
+            chunk = body(sent, min(STREAM_CHUNK, size - sent))
+            if reset_at is not None and sent + len(chunk) > reset_at:
+                self.stats["resets"] += 1
+                request.transport.abort()
+                return
+            if stall_at is not None and sent + len(chunk) > stall_at:
+                stall_at = None
+                self.stats["stalls"] += 1
+                await asyncio.sleep(self.config.stall_time)
+                started += self.config.stall_time
+            await response.write(chunk)
+            sent += len(chunk)
+            self.stats["bytes_sent"] += len(chunk)
+            if self.config.bandwidth:
+                delay = sent / self.config.bandwidth - (loop.time() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        await response.write_eof()
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("fault injection")
+    group.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per response"
+    )
+    group.add_argument(
+        "--bandwidth", type=int, default=0, help="bytes/s per response, 0 = unlimited"
+    )
+    group.add_argument("--error-rate", type=float, default=0.0, help="share of 500s")
+    group.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=0.0,
+        help="chance that a request starts a burst of 429 responses",
+    )
+    group.add_argument("--throttle-burst", type=int, default=5)
+    group.add_argument("--retry-after", type=int, default=1)
+    group.add_argument(
+        "--reset-rate",
+        type=float,
+        default=0.0,
+        help="share of media responses cut off mid-stream",
+    )
+    group.add_argument(
+        "--stall-rate",
+        type=float,
+        default=0.0,
+        help="share of media responses that stall mid-stream",
+    )
+    group.add_argument("--stall-time", type=float, default=5.0)
+    group.add_argument("--seed", type=int, default=1)
+
+
+def fault_config_from_args(args: argparse.Namespace) -> FaultConfig:
+    return FaultConfig(
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        throttle_burst=args.throttle_burst,
+        retry_after=args.retry_after,
+        reset_rate=args.reset_rate,
+        stall_rate=args.stall_rate,
+        stall_time=args.stall_time,
+        seed=args.seed,
+    )
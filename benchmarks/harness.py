@@ -0,0 +1,64 @@
+import asyncio
+import statistics
+import sys
+from typing import List, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Пиковый RSS текущего процесса (на Windows недоступен)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS - байты
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class LoopLagSampler:
+    """Замеряет, насколько позже запланированного просыпается event loop"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> dict:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        return self.summary()
+
+    def summary(self) -> dict:
+        samples_ms = [s * 1000 for s in self.samples]
+        return {
+            "samples": len(samples_ms),
+            "mean_ms": round(statistics.fmean(samples_ms), 3) if samples_ms else 0.0,
+            "p50_ms": round(percentile(samples_ms, 0.5), 3),
+            "p99_ms": round(percentile(samples_ms, 0.99), 3),
+            "max_ms": round(max(samples_ms, default=0.0), 3),
+        }
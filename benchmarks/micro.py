@@ -0,0 +1,295 @@
+import asyncio
+import inspect
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import core.json_backend as json_backend
+from core.boosty.client import BoostyClient
+from core.boosty.defs import BoostyLinkDto, BoostyListDto, BoostyTextDto
+from core.downloads_manager import DownloadManager
+from core.draftjs_converter import DraftJsConverter
+from core.progress_counter import ProgressCounter
+from core.utils import (
+    parse_image_link,
+    parse_post_link,
+    sign_url,
+    validate_windows_dir_name,
+)
+
+STORAGE_DIR = Path(".benchmarks")
+
+
+@dataclass
+class MicroBenchmark:
+    name: str
+    group: str
+    setup: Callable[[], Callable[[], object]]
+
+
+BENCHMARKS: List[MicroBenchmark] = []
+
+
+def benchmark(name: str, group: str):
+    """
+    Регистрирует фабрику замера: она готовит данные и возвращает замеряемую
+    функцию. Фабрика с ресурсами (например, event loop) отдает ее через
+    yield и освобождает их после yield.
+    """
+
+    def decorator(setup: Callable[[], Callable[[], object]]):
+        BENCHMARKS.append(MicroBenchmark(name=name, group=group, setup=setup))
+        return setup
+
+    return decorator
+
+
+def _text_block(text: str, block_type: str = "unstyled") -> BoostyTextDto:
+    styles = [[0, 0, 5], [2, 6, 10], [4, 20, 8]]
+    return BoostyTextDto(
+        content=json_backend.dumps([text, block_type, styles]).decode("utf-8"),
+        modificator="",
+    )
+
+
+def _sample_post_text(blocks: int = 200) -> list:
+    block_end = BoostyTextDto(content="", modificator="BLOCK_END")
+    item = {
+        "data": [{"type": "text", "content": '["list item text","unstyled",[]]'}],
+        "items": [],
+    }
+    data = []
+    for i in range(blocks):
+        match i % 4:
+            case 0:
+                data.append(_text_block("Heading of the section", "header"))
+            case 1:
+                data.append(
+                    BoostyLinkDto(
+                        content='["a link to somewhere","unstyled",[[0,0,6]]]',
+                        url="https://boosty.to/author/posts/link",
+                    )
+                )
+            case 2:
+                data.append(BoostyListDto(style="unordered", items=[item] * 5))
+            case _:
+                data.append(_text_block("Some paragraph text with styles. " * 8))
+        data.append(block_end)
+    return data
+
+
+@benchmark("draftjs.to_markdown[200 blocks]", "draftjs")
+def bench_to_markdown():
+    data = _sample_post_text()
+    return lambda: DraftJsConverter(data).to_markdown()
+
+
+@benchmark("draftjs.to_plain_text[200 blocks]", "draftjs")
+def bench_to_plain_text():
+    data = _sample_post_text()
+    return lambda: DraftJsConverter(data).to_plain_text()
+
+
+@benchmark("client.wrap_media_item[mixed]", "client")
+def bench_wrap_media_item():
+    media = [
+        {
+            "type": "image",
+            "id": "i",
+            "url": "https://images.boosty.to/image/i",
+            "width": 1920,
+            "height": 1080,
+            "size": 500000,
+        },
+        {
+            "type": "ok_video",
+            "id": "v",
+            "title": "video",
+            "playerUrls": [
+                {"type": t, "url": f"https://vd.okcdn.ru/{t}"}
+                for t in ("low", "medium", "high", "full_hd", "ultra_hd", "hls")
+            ],
+        },
+        {"type": "audio_file", "id": "a", "url": "u", "size": 1, "title": "a.mp3"},
+        {"type": "file", "id": "f", "url": "u", "size": 1, "title": "f.zip"},
+        {"type": "text", "content": '["text","unstyled",[]]', "modificator": ""},
+        {"type": "link", "content": '["text","unstyled",[]]', "url": "u"},
+    ]
+
+    def run():
+        for item in media:
+            BoostyClient._wrap_media_item(item)
+
+    return run
+
+
+@benchmark("utils.sign_url", "utils")
+def bench_sign_url():
+    url = "https://cdn.boosty.to/audio/1234?existing=1&other=2"
+    query = "?expires=1700000000&sign=abcdef0123456789&user=42"
+    return lambda: sign_url(url, query)
+
+
+@benchmark("utils.validate_windows_dir_name", "utils")
+def bench_validate_windows_dir_name():
+    name = 'Пост: "Новый" <выпуск> 2024/05 | часть 1?*. '
+    return lambda: validate_windows_dir_name(name)
+
+
+@benchmark("utils.parse_post_link", "utils")
+def bench_parse_post_link():
+    link = (
+        "https://boosty.to/author/posts/dba61f8b-d6dd-4105-9d00-db1c46f13946"
+        "?share=post_link"
+    )
+    return lambda: parse_post_link(link)
+
+
+@benchmark("utils.parse_image_link", "utils")
+def bench_parse_image_link():
+    link = (
+        "https://boosty.to/app/messages/media/12345/"
+        "9b981067-9854-4af0-aed4-6b5efe3ad96f?x=1"
+    )
+    return lambda: parse_image_link(link)
+
+
+@benchmark("progress.update[file->task->global]", "progress")
+def bench_progress_update():
+    # Так Task обновляет прогресс на каждый чанк
+    pbar = ProgressCounter(
+        total=None, parent=ProgressCounter(total=None, parent=ProgressCounter(None))
+    )
+    return lambda: pbar.update(153600)
+
+
+def _manager_get_tasks(count: int):
+    def setup():
+        loop = asyncio.new_event_loop()
+        try:
+            manager = DownloadManager()
+
+            async def fill():
+                for i in range(count):
+                    await manager.add_task("author", f"post-{i}")
+
+            loop.run_until_complete(fill())
+            # Так downloads center запрашивает первую страницу
+            yield lambda: loop.run_until_complete(
+                manager.get_tasks(10, offset=0, reverse=True)
+            )
+        finally:
+            loop.close()
+
+    return setup
+
+
+for _count in (10, 1_000, 100_000):
+    benchmark(f"manager.get_tasks[{_count} tasks]", "manager")(
+        _manager_get_tasks(_count)
+    )
+
+
+@contextmanager
+def _prepared(bench: MicroBenchmark) -> Iterator[Callable[[], object]]:
+    """Замеряемая функция. Фабрика-генератор освобождает ресурсы после замера"""
+    made = bench.setup()
+    if not inspect.isgenerator(made):
+        yield made
+        return
+    try:
+        yield next(made)
+    finally:
+        made.close()
+
+
+def measure(bench: MicroBenchmark, repeat: int = 5) -> dict:
+    with _prepared(bench) as func:
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        runs = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "name": bench.name,
+        "group": bench.group,
+        "rounds": repeat,
+        "iterations": number,
+        "min": min(runs),
+        "median": statistics.median(runs),
+        "mean": statistics.fmean(runs),
+        "stddev": statistics.stdev(runs) if len(runs) > 1 else 0.0,
+    }
+
+
+def run_micro(keyword: Optional[str] = None, repeat: int = 5) -> dict:
+    results = []
+    for bench in BENCHMARKS:
+        if keyword and keyword not in bench.name:
+            continue
+        print(f"{bench.name}...", file=sys.stderr)
+        results.append(measure(bench, repeat=repeat))
+    return {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "json_backend": json_backend.backend,
+        },
+        "datetime": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "benchmarks": results,
+    }
+
+
+def resolve_storage_path(name_or_path: str) -> Path:
+    path = Path(name_or_path)
+    if path.suffix == ".json" or path.parent != Path("."):
+        return path
+    return STORAGE_DIR / f"{name_or_path}.json"
+
+
+def save_results(results: dict, name_or_path: str) -> Path:
+    path = resolve_storage_path(name_or_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return path
+
+
+def load_results(name_or_path: str) -> dict:
+    return json.loads(resolve_storage_path(name_or_path).read_text(encoding="utf-8"))
+
+
+def compare_results(baseline: dict, current: dict, threshold: float) -> List[dict]:
+    """Сравнивает медианы; регрессия - замедление больше порога (0.1 = 10%)"""
+    baseline_by_name: Dict[str, dict] = {b["name"]: b for b in baseline["benchmarks"]}
+    rows = []
+    for bench in current["benchmarks"]:
+        base = baseline_by_name.get(bench["name"])
+        if not base:
+            continue
+        change = bench["median"] / base["median"] - 1 if base["median"] else 0.0
+        rows.append(
+            {
+                "name": bench["name"],
+                "baseline": base["median"],
+                "current": bench["median"],
+                "change": change,
+                "regression": change > threshold,
+            }
+        )
+    return rows
+
+
+def format_comparison(rows: List[dict]) -> str:
+    lines = [f"{'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>9}"]
+    for row in rows:
+        mark = "  REGRESSION" if row["regression"] else ""
+        lines.append(
+            f"{row['name']:<40} {row['baseline'] * 1e6:>10.2f}us "
+            f"{row['current'] * 1e6:>10.2f}us {row['change'] * 100:>8.1f}%{mark}"
+        )
+    return "\n".join(lines)
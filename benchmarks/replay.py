@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import re
+import shutil
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+from benchmarks.faults import FaultConfig, FaultInjector
+from benchmarks.harness import peak_rss_bytes
+from benchmarks.scenarios import ScenarioOptions, build_settings, download_posts
+from benchmarks.stub_server import ServerProcess, start_server
+from core.cassette import get_recorder, load_cassette
+from core.defs.common import AuthToken
+from core.downloads_manager import DownloadManager
+from core.http_pool import http_pool
+from core.logger import set_log_level
+from core.utils import parse_post_link
+
+REPLAY_PREFIX = "/_r"
+API_HOST = "api.boosty.to"
+post_path_re = re.compile(r"^/v1/blog/([^/]+)/post/([^/]+)$")
+
+RequestKey = Tuple[str, str, str, str]
+
+
+def _request_key(method: str, url: str) -> RequestKey:
+    parts = urlsplit(url)
+    return method, parts.netloc, parts.path, parts.query
+
+
+class ReplayServer:
+    """
+    Отдает ответы из кассеты по адресам вида /_r/<host>/<path>.
+    Абсолютные ссылки в JSON переписываются на сам сервер, обрезанные
+    медиа дополняются нулями до исходного размера.
+    """
+
+    def __init__(self, cassette: Path, faults: FaultConfig):
+        self.cassette = cassette
+        self.base_url = ""
+        self.faults = FaultInjector(faults)
+        self.stats = self.faults.stats
+        self.stats.update(replayed=0, misses=0)
+        self._entries: Dict[RequestKey, dict] = {}
+        self._by_path: Dict[Tuple[str, str, str], dict] = {}
+        self._bodies: Dict[str, bytes] = {}
+        self._hosts = set()
+        self.api_host = API_HOST
+        # Последняя запись побеждает: повторные попытки при записи перезаписывают
+        # неудачные ответы
+        for entry in load_cassette(cassette):
+            key = _request_key(entry["method"], entry["url"])
+            self._entries[key] = entry
+            self._by_path[key[:3]] = entry
+            self._hosts.add(key[1])
+            if post_path_re.match(key[2]):
+                self.api_host = key[1]
+
+    def build_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.faults.middleware])
+        app.router.add_route("*", REPLAY_PREFIX + "/{host}/{tail:.*}", self.handle)
+        app.router.add_get("/_stats", self.handle_stats)
+        return app
+
+    def posts(self) -> List[Tuple[str, str]]:
+        """Посты, запрошенные при записи, в порядке записи"""
+        result = []
+        for method, host, path, _ in self._entries:
+            match = post_path_re.match(path)
+            if method == "GET" and host == self.api_host and match:
+                result.append((match.group(1), match.group(2)))
+        return list(dict.fromkeys(result))
+
+    def _find(self, method: str, host: str, path: str, query: str) -> Optional[dict]:
+        entry = self._entries.get((method, host, path, query))
+        if entry is None:
+            entry = self._by_path.get((method, host, path))
+        if entry is None and method == "HEAD":
+            # При записи размер видео могли узнать только из GET
+            entry = self._find("GET", host, path, query)
+        return entry
+
+    def _body(self, entry: dict) -> bytes:
+        name = entry.get("body")
+        if not name:
+            return b""
+        if name not in self._bodies:
+            body = (self.cassette / name).read_bytes()
+            if entry["headers"].get("Content-Type", "").startswith("application/json"):
+                body = self._rewrite_links(body)
+            self._bodies[name] = body
+        return self._bodies[name]
+
+    def _rewrite_links(self, body: bytes) -> bytes:
+        for host in self._hosts:
+            target = f"{self.base_url}{REPLAY_PREFIX}/{host}"
+            for scheme in ("https://", "http://"):
+                body = body.replace(f"{scheme}{host}".encode(), target.encode())
+                escaped = f"{scheme}{host}".replace("/", "\\/")
+                body = body.replace(
+                    escaped.encode(), target.replace("/", "\\/").encode()
+                )
+        return body
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        host = request.match_info["host"]
+        path = "/" + request.match_info["tail"]
+        entry = self._find(request.method, host, path, request.query_string)
+        if entry is None:
+            self.stats["misses"] += 1
+            raise web.HTTPNotFound(text=f"Not in cassette: {request.method} {path}")
+        self.stats["replayed"] += 1
+        headers = {
+            k: v
+            for k, v in entry["headers"].items()
+            if k.lower() not in ("content-length", "content-range")
+        }
+        body = self._body(entry)
+        size = entry.get("size")
+        size = len(body) if size is None else max(size, len(body))
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(size)
+            return web.Response(status=entry["status"], headers=headers)
+        response = web.StreamResponse(status=entry["status"], headers=headers)
+        response.content_length = size
+        await response.prepare(request)
+        await self.faults.stream_body(
+            request,
+            response,
+            lambda offset, length: _padded(body, offset, length),
+            size,
+        )
+        return response
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+
+def _padded(body: bytes, offset: int, length: int) -> bytes:
+    chunk = body[offset : offset + length]
+    return chunk + bytes(length - len(chunk))
+
+
+async def serve_replay(
+    cassette: Path, faults: FaultConfig, host: str = "127.0.0.1", port: int = 0
+):
+    return await start_server(ReplayServer(cassette, faults), host, port)
+
+
+async def _replay(cassette: Path, options: ScenarioOptions, folder: Path) -> dict:
+    server = ReplayServer(cassette, options.faults)
+    posts = server.posts()
+    with ServerProcess(serve_replay, cassette, options.faults) as process:
+        api_base_url = f"{process.base_url}{REPLAY_PREFIX}/{server.api_host}"
+        result = await download_posts(
+            posts, options, process.base_url, folder, api_base_url=api_base_url
+        )
+    return {"posts": len(posts), **result}
+
+
+def run_replay(cassette: Path, options: ScenarioOptions) -> dict:
+    """Прогоняет записанные посты через Task против replay-сервера со сбоями"""
+    set_log_level(logging.WARNING)
+    folder = Path(tempfile.mkdtemp(prefix="bench_replay_", dir=options.workdir))
+    try:
+        result = asyncio.run(_replay(cassette, options, folder))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return {
+        "cassette": str(cassette),
+        **result,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "options": asdict(options),
+    }
+
+
+async def record(
+    links: List[str],
+    cassette: Path,
+    media_mode: str,
+    folder: Path,
+    auth_token: Optional[AuthToken] = None,
+    options: Optional[ScenarioOptions] = None,
+    api_base_url: str = "https://" + API_HOST,
+) -> dict:
+    """Скачивает посты с настоящего Boosty, записывая ответы в кассету"""
+    options = options or ScenarioOptions()
+    settings = build_settings(options, api_base_url, folder)
+    settings.record_dir = str(cassette)
+    settings.record_media = media_mode
+    get_recorder(settings.record_dir, media_mode)
+
+    async def settings_provider():
+        return settings
+
+    async def auth_provider():
+        return auth_token
+
+    manager = DownloadManager(
+        maximum_concurrency=options.parallelism,
+        settings_provider=settings_provider,
+        auth_provider=auth_provider,
+        poll_interval=0.05,
+    )
+    posts = [info for info in map(parse_post_link, links) if info]
+    started = time.perf_counter()
+    mainloop = asyncio.create_task(manager.mainloop())
+    for info in posts:
+        await manager.add_task(info.author, info.id)
+    while await manager.get_active_tasks_count() > 0:
+        await asyncio.sleep(0.05)
+    manager.close()
+    mainloop.cancel()
+    await http_pool.close()
+    tasks = await manager.get_tasks(limit=len(posts) or 1)
+    return {
+        "cassette": str(cassette),
+        "posts": len(posts),
+        "wall_time_s": round(time.perf_counter() - started, 3),
+        "tasks": {
+            task.post_id: task.error.value if task.error else "done" for task in tasks
+        },
+    }
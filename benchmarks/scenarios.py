@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import multiprocessing
+import shutil
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from benchmarks.faults import FaultConfig
+from benchmarks.harness import LoopLagSampler, peak_rss_bytes
+from benchmarks.stub_server import AuthorSpec, StubConfig, StubServerProcess
+from core.boosty.client import BoostyClient
+from core.defs.common import DownloadingSettingsDto
+from core.downloads_manager import DownloadManager
+from core.http_pool import http_pool
+from core.logger import set_log_level
+
+
+@dataclass
+class ScenarioOptions:
+    size_scale: float = 0.01  # 1.0 - полные размеры файлов из описания сценария
+    faults: FaultConfig = field(default_factory=FaultConfig)
+    parallelism: int = 5
+    chunk_size: int = 153600
+    auto_chunk: bool = False
+    buffer_pool: bool = False
+    workdir: Optional[str] = None
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    author: AuthorSpec
+    run: Callable
+
+
+def _scaled(author: AuthorSpec, scale: float) -> AuthorSpec:
+    return replace(
+        author,
+        image_size=max(1, int(author.image_size * scale)),
+        video_size=max(1, int(author.video_size * scale)),
+        file_size=max(1, int(author.file_size * scale)),
+    )
+
+
+def build_settings(
+    options: ScenarioOptions, base_url: str, folder: Path
+) -> DownloadingSettingsDto:
+    return DownloadingSettingsDto(
+        need_download_photos=True,
+        need_download_videos=True,
+        need_download_audios=True,
+        need_download_files=True,
+        chunk_size=options.chunk_size,
+        download_timeout=3600,
+        preferred_video_size="ultra_hd",
+        post_text_format="md",
+        downloads_folder=str(folder),
+        max_parallelism=options.parallelism,
+        api_base_url=base_url,
+        chunk_size_auto=options.auto_chunk,
+        receive_buffer_pool=options.buffer_pool,
+    )
+
+
+async def _no_auth():
+    return None
+
+
+async def _fetch_stats(base_url: str) -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(base_url + "/_stats") as response:
+            return await response.json()
+
+
+async def download_posts(
+    posts: List[Tuple[str, str]],
+    options: ScenarioOptions,
+    base_url: str,
+    folder: Path,
+    api_base_url: Optional[str] = None,
+) -> dict:
+    """Прогоняет посты через настоящие DownloadManager и Task"""
+    settings = build_settings(options, api_base_url or base_url, folder)
+
+    async def settings_provider():
+        return settings
+
+    manager = DownloadManager(
+        maximum_concurrency=options.parallelism,
+        settings_provider=settings_provider,
+        auth_provider=_no_auth,
+        poll_interval=0.05,
+    )
+    stats_before = await _fetch_stats(base_url)
+
+    sampler = LoopLagSampler()
+    sampler.start()
+    started = time.perf_counter()
+    mainloop = asyncio.create_task(manager.mainloop())
+    for author, post_id in posts:
+        await manager.add_task(author, post_id)
+    while await manager.get_active_tasks_count() > 0:
+        await asyncio.sleep(0.05)
+    wall_time = time.perf_counter() - started
+    loop_lag = await sampler.stop()
+    manager.close()
+    mainloop.cancel()
+
+    stats_after = await _fetch_stats(base_url)
+    tasks = await manager.get_tasks(limit=len(posts) or 1)
+    outcomes = Counter(task.error.value if task.error else "done" for task in tasks)
+    transferred = stats_after["bytes_sent"] - stats_before["bytes_sent"]
+    return {
+        "wall_time_s": round(wall_time, 3),
+        "bytes": transferred,
+        "throughput_mib_s": round(transferred / wall_time / 1024**2, 3),
+        "files": sum(task.count_files for task in tasks),
+        "tasks": dict(outcomes),
+        "requests": stats_after["requests"] - stats_before["requests"],
+        "faults": {
+            key: stats_after[key] - stats_before[key]
+            for key in ("errors_injected", "throttled", "resets", "stalls")
+        },
+        "loop_lag": loop_lag,
+    }
+
+
+async def run_download(
+    scenario: Scenario, options: ScenarioOptions, base_url: str, folder: Path
+) -> dict:
+    client = BoostyClient(
+        chunk_size=options.chunk_size, download_timeout=3600, base_url=base_url
+    )
+    author = scenario.author.name
+    post_ids = []
+    offset = None
+    while True:
+        post_list = await client.get_posts_list(author, limit=100, offset=offset)
+        post_ids.extend(post.id for post in post_list.data)
+        offset = post_list.extra.offset
+        if post_list.extra.is_last:
+            break
+    return await download_posts(
+        [(author, post_id) for post_id in post_ids], options, base_url, folder
+    )
+
+
+async def run_date_scan(
+    scenario: Scenario, options: ScenarioOptions, base_url: str, folder: Path
+) -> dict:
+    """Повторяет обход ленты автора со страницы загрузки нескольких постов"""
+    client = BoostyClient(
+        chunk_size=options.chunk_size, download_timeout=500, base_url=base_url
+    )
+    author = scenario.author.name
+    sampler = LoopLagSampler()
+    sampler.start()
+    started = time.perf_counter()
+    max_int_id = await client.get_max_int_id(author)
+    right_border = (
+        scenario.author.first_publish_time
+        + scenario.author.posts * scenario.author.post_interval
+    )
+    offset = f"{right_border}:{max_int_id + 1}"
+    found = 0
+    pages = 0
+    while True:
+        post_list = await client.get_posts_list(author, offset=offset)
+        pages += 1
+        found += sum(1 for post in post_list.data if post.has_access)
+        offset = post_list.extra.offset
+        if post_list.extra.is_last:
+            break
+    wall_time = time.perf_counter() - started
+    loop_lag = await sampler.stop()
+    stats = await _fetch_stats(base_url)
+    return {
+        "wall_time_s": round(wall_time, 3),
+        "pages": pages,
+        "posts_found": found,
+        "posts_per_s": round(found / wall_time, 1),
+        "bytes": stats["bytes_sent"],
+        "throughput_mib_s": round(stats["bytes_sent"] / wall_time / 1024**2, 3),
+        "loop_lag": loop_lag,
+    }
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario(
+            name="images_300",
+            description="1 post with 300 images",
+            author=AuthorSpec(posts=1, images_per_post=300, image_size=400 * 1024),
+            run=run_download,
+        ),
+        Scenario(
+            name="videos_50x2g",
+            description="50 posts with a 2 GB video each",
+            author=AuthorSpec(
+                posts=50, videos_per_post=1, video_size=2 * 1024**3, text_blocks=2
+            ),
+            run=run_download,
+        ),
+        Scenario(
+            name="date_scan_5000",
+            description="5,000-post date scan",
+            author=AuthorSpec(posts=5000, images_per_post=4, text_blocks=20),
+            run=run_date_scan,
+        ),
+    )
+}
+
+
+async def _closing_pool(run: Awaitable[dict]) -> dict:
+    """Пул соединений живет в event loop сценария: закрываем его вместе с ним"""
+    try:
+        return await run
+    finally:
+        await http_pool.close()
+
+
+def run_scenario(name: str, options: ScenarioOptions) -> dict:
+    """Выполняет сценарий в текущем процессе и возвращает отчет"""
+    set_log_level(logging.WARNING)
+    scenario = SCENARIOS[name]
+    scenario = replace(scenario, author=_scaled(scenario.author, options.size_scale))
+    config = StubConfig(authors=[scenario.author], faults=options.faults)
+    folder = Path(tempfile.mkdtemp(prefix=f"bench_{name}_", dir=options.workdir))
+    try:
+        with StubServerProcess(config) as server:
+            result = asyncio.run(
+                _closing_pool(scenario.run(scenario, options, server.base_url, folder))
+            )
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return {
+        "scenario": name,
+        "description": scenario.description,
+        **result,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "options": asdict(options),
+    }
+
+
+def run_isolated(name: str, options: ScenarioOptions) -> dict:
+    """Каждый сценарий в свежем процессе, чтобы пиковый RSS не смешивался"""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_scenario, name, options).result()
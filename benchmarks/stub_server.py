@@ -0,0 +1,277 @@
+import asyncio
+import json
+import multiprocessing
+import uuid
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from benchmarks.faults import STREAM_CHUNK, FaultConfig, FaultInjector
+
+_ZEROS = bytes(STREAM_CHUNK)
+
+
+@dataclass
+class AuthorSpec:
+    name: str = "bench"
+    posts: int = 1
+    images_per_post: int = 0
+    image_size: int = 200 * 1024
+    videos_per_post: int = 0
+    video_size: int = 0
+    files_per_post: int = 0
+    file_size: int = 0
+    text_blocks: int = 10
+    has_access: bool = True
+    first_publish_time: int = 1_600_000_000
+    post_interval: int = 3600
+
+
+@dataclass
+class StubConfig:
+    authors: List[AuthorSpec] = field(default_factory=lambda: [AuthorSpec()])
+    faults: FaultConfig = field(default_factory=FaultConfig)
+
+
+@dataclass
+class _Post:
+    author: AuthorSpec
+    index: int
+    id: str
+    int_id: int
+    publish_time: int
+
+
+class StubBoostyServer:
+    """
+    Локальная имитация API Boosty и CDN для воспроизводимых замеров.
+    Посты и медиа генерируются детерминированно из AuthorSpec.
+    """
+
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.base_url = ""
+        self.faults = FaultInjector(config.faults)
+        self._posts: Dict[str, List[_Post]] = {}
+        self._posts_by_id: Dict[Tuple[str, str], _Post] = {}
+        self._payload_cache: Dict[Tuple[str, str], dict] = {}
+        self.stats = self.faults.stats
+        self.stats.update(api_requests=0, media_requests=0)
+        for author in config.authors:
+            posts = []
+            for i in range(author.posts):
+                post = _Post(
+                    author=author,
+                    index=i,
+                    id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"{author.name}/{i}")),
+                    int_id=i + 1,
+                    publish_time=author.first_publish_time + i * author.post_interval,
+                )
+                posts.append(post)
+                self._posts_by_id[(author.name, post.id)] = post
+            # Новые посты первыми, как в ленте автора
+            posts.reverse()
+            self._posts[author.name] = posts
+
+    def build_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.faults.middleware])
+        app.router.add_get("/v1/blog/{author}/post/", self.handle_posts_list)
+        app.router.add_get("/v1/blog/{author}/post/{post_id}", self.handle_post)
+        app.router.add_route(
+            "*", "/media/{kind}/{author}/{index}/{n}", self.handle_media
+        )
+        app.router.add_get("/_stats", self.handle_stats)
+        return app
+
+    def _media_url(self, kind: str, post: _Post, n: int) -> str:
+        return f"{self.base_url}/media/{kind}/{post.author.name}/{post.index}/{n}"
+
+    def _text_block(self, post: _Post, n: int) -> dict:
+        text = f"Paragraph {n} of benchmark post {post.index}. " * 4
+        return {
+            "type": "text",
+            "modificator": "",
+            "content": json.dumps([text, "unstyled", [[0, 0, 9]]]),
+        }
+
+    def _post_payload(self, post: _Post) -> dict:
+        key = (post.author.name, post.id)
+        if key in self._payload_cache:
+            return self._payload_cache[key]
+        spec = post.author
+        data = []
+        for n in range(spec.text_blocks):
+            data.append(self._text_block(post, n))
+            data.append({"type": "text", "modificator": "BLOCK_END", "content": ""})
+        for n in range(spec.images_per_post):
+            data.append(
+                {
+                    "type": "image",
+                    "id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{post.id}/image/{n}")),
+                    "url": self._media_url("image", post, n),
+                    "width": 1920,
+                    "height": 1080,
+                    "size": spec.image_size,
+                }
+            )
+        for n in range(spec.videos_per_post):
+            data.append(
+                {
+                    "type": "ok_video",
+                    "id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{post.id}/video/{n}")),
+                    "title": f"video_{post.index}_{n}",
+                    "playerUrls": [
+                        {"type": "full_hd", "url": self._media_url("video", post, n)},
+                        {"type": "low", "url": ""},
+                    ],
+                }
+            )
+        for n in range(spec.files_per_post):
+            data.append(
+                {
+                    "type": "file",
+                    "id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{post.id}/file/{n}")),
+                    "url": self._media_url("file", post, n),
+                    "title": f"file_{post.index}_{n}.bin",
+                    "size": spec.file_size,
+                }
+            )
+        payload = {
+            "id": post.id,
+            "intId": post.int_id,
+            "title": f"Benchmark post {post.index}",
+            "publishTime": post.publish_time,
+            "hasAccess": spec.has_access,
+            "signedQuery": "?expires=4102444800&sign=bench" if spec.has_access else "",
+            "data": data if spec.has_access else [],
+        }
+        self._payload_cache[key] = payload
+        return payload
+
+    def _json_response(self, payload: dict) -> web.Response:
+        body = json.dumps(payload).encode("utf-8")
+        self.stats["api_requests"] += 1
+        self.stats["bytes_sent"] += len(body)
+        return web.Response(body=body, content_type="application/json")
+
+    async def handle_posts_list(self, request: web.Request) -> web.Response:
+        posts = self._posts.get(request.match_info["author"])
+        if posts is None:
+            raise web.HTTPNotFound()
+        limit = int(request.query.get("limit", 20))
+        offset = request.query.get("offset")
+        if offset:
+            border = tuple(int(x) for x in offset.split(":"))
+            posts = [p for p in posts if (p.publish_time, p.int_id) < border]
+        page = posts[:limit]
+        is_last = len(page) == len(posts)
+        last = page[-1] if page else None
+        return self._json_response(
+            {
+                "data": [self._post_payload(p) for p in page],
+                "extra": {
+                    "isLast": is_last,
+                    "offset": f"{last.publish_time}:{last.int_id}" if last else "",
+                },
+            }
+        )
+
+    async def handle_post(self, request: web.Request) -> web.Response:
+        key = (request.match_info["author"], request.match_info["post_id"])
+        post = self._posts_by_id.get(key)
+        if post is None:
+            raise web.HTTPNotFound()
+        return self._json_response(self._post_payload(post))
+
+    def _media_size(self, kind: str, spec: AuthorSpec) -> Optional[int]:
+        return {
+            "image": spec.image_size,
+            "video": spec.video_size,
+            "file": spec.file_size,
+        }.get(kind)
+
+    async def handle_media(self, request: web.Request) -> web.StreamResponse:
+        posts = self._posts.get(request.match_info["author"])
+        if posts is None:
+            raise web.HTTPNotFound()
+        size = self._media_size(request.match_info["kind"], posts[0].author)
+        if size is None:
+            raise web.HTTPNotFound()
+        self.stats["media_requests"] += 1
+        if request.method == "HEAD":
+            return web.Response(headers={"Content-Length": str(size)})
+        if request.method != "GET":
+            raise web.HTTPMethodNotAllowed(request.method, ["GET", "HEAD"])
+        response = web.StreamResponse(
+            headers={"Content-Type": "application/octet-stream"}
+        )
+        response.content_length = size
+        await response.prepare(request)
+        await self.faults.stream_body(
+            request, response, lambda offset, length: _ZEROS[:length], size
+        )
+        return response
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+
+async def serve(config: StubConfig, host: str = "127.0.0.1", port: int = 0):
+    return await start_server(StubBoostyServer(config), host, port)
+
+
+async def start_server(server, host: str = "127.0.0.1", port: int = 0):
+    runner = web.AppRunner(server.build_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = runner.addresses[0][1]
+    server.base_url = f"http://{host}:{bound_port}"
+    return server, runner
+
+
+def _serve_forever(serve_fn: Callable, args: tuple, port_queue) -> None:
+    async def _main():
+        server, _ = await serve_fn(*args)
+        port_queue.put(server.base_url)
+        await asyncio.Event().wait()
+
+    asyncio.run(_main())
+
+
+class ServerProcess:
+    """Запускает сервер в отдельном процессе, чтобы не нагружать event loop замера"""
+
+    def __init__(self, serve_fn: Callable, *args):
+        self._serve_fn = serve_fn
+        self._args = args
+        self.base_url: Optional[str] = None
+        self._process = None
+
+    def __enter__(self) -> "ServerProcess":
+        context = multiprocessing.get_context("spawn")
+        port_queue = context.Queue()
+        self._process = context.Process(
+            target=_serve_forever,
+            args=(self._serve_fn, self._args, port_queue),
+            daemon=True,
+        )
+        self._process.start()
+        self.base_url = port_queue.get(timeout=30)
+        return self
+
+    def __exit__(self, *args):
+        if self._process:
+            self._process.terminate()
+            self._process.join(timeout=10)
+
+
+class StubServerProcess(ServerProcess):
+    def __init__(self, config: StubConfig):
+        super().__init__(serve, config)
+        self.config = config
+
+
+def describe(config: StubConfig) -> dict:
+    return asdict(config)
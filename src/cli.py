@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import sys
+from pathlib import Path
+from typing import Optional, Sequence
+
+import __version__ as app_version
+from core.boosty.defs import VIDEO_QUALITY_GRADE
+from core.defs.common import AuthToken, DownloadingSettingsDto
+from core.disk_writer import FSYNC_POLICIES
+from core.downloads_manager import DownloadManager
+from core.draftjs_converter import TEXT_FORMATS
+from core.host_gate import host_gate
+from core.http_pool import http_pool
+from core.logger import (
+    LOG_LEVELS,
+    configure_module_levels,
+    set_log_level,
+    setup_logger,
+)
+from core.loop_monitor import loop_monitor
+from core.metrics import MetricsExporter
+from core.post_archive import rerender_library
+from core.profiler import profiler
+from core.scheduler import SCHEDULING_POLICIES
+from core.progress_counter import format_eta, format_speed
+from core.tracing import configure_tracing, load_spans, to_chrome_trace
+from core.utils import parse_post_link
+
+logger = setup_logger()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="boosty_downloader",
+        description=f"{app_version.NAME} {app_version.VERSION} command line tools",
+    )
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="INFO")
+    parser.add_argument(
+        "--log-modules",
+        default="",
+        help="per-module levels, e.g. task.py=WARNING,client.py=DEBUG",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rerender = subparsers.add_parser(
+        "rerender",
+        help="regenerate post text files from saved raw post data, offline",
+    )
+    rerender.add_argument("folder", type=Path, help="downloads folder")
+    rerender.add_argument(
+        "--formats",
+        default="md",
+        help=f"comma-separated text formats: {', '.join(TEXT_FORMATS)}",
+    )
+    rerender.add_argument(
+        "--workers", type=int, default=None, help="worker processes (default: all)"
+    )
+
+    download = subparsers.add_parser("download", help="download posts without the UI")
+    download.add_argument("links", nargs="+", help="post links")
+    download.add_argument("--folder", type=Path, required=True, help="downloads folder")
+    download.add_argument("--formats", default="md", help="post text formats")
+    download.add_argument(
+        "--video-size", choices=VIDEO_QUALITY_GRADE, default="ultra_hd"
+    )
+    download.add_argument(
+        "--parallelism", type=int, default=5, help="simultaneous file transfers"
+    )
+    download.add_argument(
+        "--metadata-concurrency",
+        type=int,
+        default=4,
+        help="posts fetched and probed at the same time",
+    )
+    download.add_argument(
+        "--api-connections",
+        type=int,
+        default=4,
+        help="simultaneous API requests per host",
+    )
+    download.add_argument(
+        "--host-connections",
+        type=int,
+        default=8,
+        help="simultaneous file requests per host",
+    )
+    download.add_argument(
+        "--schedule",
+        choices=tuple(SCHEDULING_POLICIES),
+        default="fifo",
+        help="order in which posts are prepared and their files transferred",
+    )
+    download.add_argument("--chunk-size", type=int, default=153600)
+    download.add_argument(
+        "--auto-chunk",
+        action="store_true",
+        help="adapt read size to throughput, starting from --chunk-size",
+    )
+    download.add_argument("--chunk-min", type=int, default=16 * 1024)
+    download.add_argument("--chunk-max", type=int, default=4 * 1024 * 1024)
+    download.add_argument("--timeout", type=int, default=3600)
+    download.add_argument(
+        "--write-buffer",
+        type=int,
+        default=1024 * 1024,
+        help="bytes coalesced before each disk write",
+    )
+    download.add_argument(
+        "--preallocate", action="store_true", help="preallocate files of known size"
+    )
+    download.add_argument("--fsync", choices=FSYNC_POLICIES, default="never")
+    download.add_argument(
+        "--buffer-pool",
+        action="store_true",
+        help="receive into pooled buffers of --write-buffer bytes",
+    )
+    download.add_argument(
+        "--buffer-pool-limit",
+        type=int,
+        default=64 * 1024 * 1024,
+        help="total bytes of pooled buffers",
+    )
+    download.add_argument(
+        "--disk-margin",
+        type=int,
+        default=512,
+        metavar="MB",
+        help="free space to leave on the downloads volume",
+    )
+    download.add_argument(
+        "--auth-token", help="token exported from the app (for paid posts)"
+    )
+    download.add_argument("--api-base-url", default="https://api.boosty.to")
+    download.add_argument(
+        "--metrics-port", type=int, help="serve Prometheus metrics on this port"
+    )
+    download.add_argument(
+        "--metrics-snapshot", type=Path, help="write a JSON metrics snapshot here"
+    )
+    download.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=15,
+        help="seconds between snapshots",
+    )
+    download.add_argument(
+        "--lag-threshold",
+        type=float,
+        default=0.1,
+        help="report event loop blocks longer than this many seconds",
+    )
+    download.add_argument(
+        "--profile",
+        type=float,
+        metavar="SECONDS",
+        help="profile the first SECONDS of the run into the logs folder",
+    )
+    download.add_argument("--trace", type=Path, help="write tracing spans (JSONL)")
+    download.add_argument(
+        "--otlp-endpoint", help="send spans to an OTLP/HTTP collector"
+    )
+
+    trace_export = subparsers.add_parser(
+        "trace-export",
+        help="convert recorded spans for chrome://tracing or Perfetto",
+    )
+    trace_export.add_argument("spans", type=Path, help="traces.jsonl")
+    trace_export.add_argument("-o", "--output", type=Path, required=True)
+    return parser
+
+
+def parse_formats(value: str) -> Optional[tuple]:
+    formats = tuple(fmt for fmt in value.split(",") if fmt)
+    if not formats or any(fmt not in TEXT_FORMATS for fmt in formats):
+        logger.error(f"Unknown text formats: {value}")
+        return None
+    return formats
+
+
+def run_rerender(args: argparse.Namespace) -> int:
+    formats = parse_formats(args.formats)
+    if not formats:
+        return 2
+    succeeded, failed = rerender_library(args.folder, formats, workers=args.workers)
+    print(f"Re-rendered {succeeded} posts, {failed} failed")
+    return 1 if failed else 0
+
+
+async def run_download(args: argparse.Namespace) -> int:
+    posts = [info for info in map(parse_post_link, args.links) if info]
+    if len(posts) != len(args.links):
+        logger.error("Some post links could not be parsed")
+        return 2
+    if not parse_formats(args.formats):
+        return 2
+    settings = DownloadingSettingsDto(
+        need_download_photos=True,
+        need_download_videos=True,
+        need_download_audios=True,
+        need_download_files=True,
+        chunk_size=args.chunk_size,
+        download_timeout=args.timeout,
+        preferred_video_size=args.video_size,
+        post_text_format=args.formats,
+        downloads_folder=str(args.folder),
+        max_parallelism=args.parallelism,
+        api_base_url=args.api_base_url,
+        write_buffer_size=args.write_buffer,
+        preallocate_files=args.preallocate,
+        fsync_policy=args.fsync,
+        chunk_size_auto=args.auto_chunk,
+        chunk_size_min=args.chunk_min,
+        chunk_size_max=args.chunk_max,
+        receive_buffer_pool=args.buffer_pool,
+        buffer_pool_limit=args.buffer_pool_limit,
+        disk_space_margin=args.disk_margin * 1024 * 1024,
+        scheduling_policy=args.schedule,
+    )
+    auth_token = AuthToken.from_str(args.auth_token) if args.auth_token else None
+    configure_tracing(jsonl_path=args.trace, otlp_endpoint=args.otlp_endpoint)
+
+    async def settings_provider():
+        return settings
+
+    async def auth_provider():
+        return auth_token
+
+    manager = DownloadManager(
+        maximum_concurrency=args.parallelism,
+        settings_provider=settings_provider,
+        auth_provider=auth_provider,
+        poll_interval=0.5,
+        scheduling_policy=args.schedule,
+        metadata_concurrency=args.metadata_concurrency,
+    )
+    exporter = MetricsExporter(
+        port=args.metrics_port,
+        snapshot_path=args.metrics_snapshot,
+        interval=args.metrics_interval,
+    )
+    await exporter.start()
+    loop_monitor.threshold = args.lag_threshold
+    host_gate.api_limit = args.api_connections
+    host_gate.host_limit = args.host_connections
+    loop_monitor.start()
+    mainloop = asyncio.create_task(manager.mainloop())
+    profiling = (
+        asyncio.create_task(profiler.run(args.profile)) if args.profile else None
+    )
+    try:
+        for info in posts:
+            await manager.add_task(info.author, info.id)
+        while await manager.get_active_tasks_count() > 0:
+            await asyncio.sleep(1)
+            speed, eta = await manager.get_throughput()
+            pending = await manager.get_pending_tasks_count()
+            print(
+                f"{pending} running, {format_speed(speed)}, ETA {format_eta(eta)}",
+                file=sys.stderr,
+            )
+    finally:
+        manager.close()
+        mainloop.cancel()
+        if profiling:
+            profiler.stop()
+            await profiling
+        loop_monitor.stop()
+        await exporter.stop()
+        await http_pool.close()
+    for site in loop_monitor.top_sites(5):
+        print(
+            f"Event loop blocked {site.count} times, {site.total_time:.2f} s total"
+            f" at {site.site}",
+            file=sys.stderr,
+        )
+    tasks = await manager.get_tasks(limit=len(posts))
+    failed = [task for task in tasks if task.error]
+    for task in failed:
+        print(f"{task.author}/{task.post_id}: {task.error.value}")
+    print(f"Downloaded {len(tasks) - len(failed)} posts, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+def run_trace_export(args: argparse.Namespace) -> int:
+    trace = to_chrome_trace(load_spans(args.spans))
+    args.output.write_text(json.dumps(trace), encoding="utf-8")
+    print(f"Exported {len(trace['traceEvents'])} spans to {args.output}")
+    return 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    set_log_level(args.log_level)
+    configure_module_levels(args.log_modules)
+    match args.command:
+        case "rerender":
+            return run_rerender(args)
+        case "download":
+            return asyncio.run(run_download(args))
+        case "trace-export":
+            return run_trace_export(args)
+    return 2
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,11 +1,16 @@
 import asyncio
+from pathlib import Path
 
 import flet as ft
 
 import __version__ as app_version
 import components
+from core.logger import LOG_LEVELS, set_log_level, setup_logger
+from core.post_archive import rerender_library
 from core.utils import get_download_settings
 
+logger = setup_logger()
+
 
 @ft.control
 class SettingsGroup(ft.ListView):
@@ -33,6 +38,11 @@ class SettingsGroup(ft.ListView):
         self.switch_download_files = ft.Switch(
             label="Download attached files", value=True, padding=10
         )
+        self.switch_save_raw_post = ft.Switch(
+            label="Save raw post data (post.json.gz) for offline re-rendering",
+            value=True,
+            padding=10,
+        )
         self.video_size_dropdown = ft.Dropdown(
             width=700,
             value="ultra_hd",
@@ -58,6 +68,8 @@ class SettingsGroup(ft.ListView):
             options=[
                 ft.DropdownOption(key="md", text="Markdown file (.md)"),
                 ft.DropdownOption(key="raw", text="Text file (.txt)"),
+                ft.DropdownOption(key="html", text="Web page (.html)"),
+                ft.DropdownOption(key="md,raw,html", text="All formats"),
             ],
         )
         self.chunk_size_textfield = ft.TextField(
@@ -66,6 +78,11 @@ class SettingsGroup(ft.ListView):
             input_filter=ft.NumbersOnlyInputFilter(),
             value="0",
         )
+        self.switch_chunk_size_auto = ft.Switch(
+            label="Adapt chunk size to connection speed (starts from chunk size)",
+            value=False,
+            padding=10,
+        )
         self.download_timeout_textfield = ft.TextField(
             label="Download timeout (sec.)",
             border=ft.InputBorder.UNDERLINE,
@@ -78,6 +95,90 @@ class SettingsGroup(ft.ListView):
             input_filter=ft.NumbersOnlyInputFilter(),
             value="0",
         )
+        self.write_buffer_size_textfield = ft.TextField(
+            label="Write buffer size (KB)",
+            border=ft.InputBorder.UNDERLINE,
+            input_filter=ft.NumbersOnlyInputFilter(),
+            value="1024",
+        )
+        self.switch_preallocate_files = ft.Switch(
+            label="Preallocate disk space for files of known size",
+            value=False,
+            padding=10,
+        )
+        self.switch_receive_buffer_pool = ft.Switch(
+            label="Receive into reusable buffers (less memory churn at high speed)",
+            value=False,
+            padding=10,
+        )
+        self.scheduling_policy_dropdown = ft.Dropdown(
+            width=700,
+            value="fifo",
+            label="Download order",
+            border_color=ft.Colors.TRANSPARENT,
+            filled=True,
+            fill_color=ft.Colors.SURFACE_CONTAINER,
+            options=[
+                ft.DropdownOption(key="fifo", text="In order added"),
+                ft.DropdownOption(key="shortest", text="Smallest posts first"),
+                ft.DropdownOption(key="fair", text="Take turns between authors"),
+            ],
+        )
+        self.disk_space_margin_textfield = ft.TextField(
+            label="Keep free on disk (MB)",
+            border=ft.InputBorder.UNDERLINE,
+            input_filter=ft.NumbersOnlyInputFilter(),
+            value="512",
+        )
+        self.fsync_policy_dropdown = ft.Dropdown(
+            width=700,
+            value="never",
+            label="Flush files to disk (fsync)",
+            border_color=ft.Colors.TRANSPARENT,
+            filled=True,
+            fill_color=ft.Colors.SURFACE_CONTAINER,
+            options=[
+                ft.DropdownOption(key="never", text="Never (fastest)"),
+                ft.DropdownOption(key="close", text="When a file is complete"),
+                ft.DropdownOption(key="always", text="After every write (slowest)"),
+            ],
+        )
+        self.metrics_port_textfield = ft.TextField(
+            label="Prometheus metrics port (empty to disable, restart required)",
+            border=ft.InputBorder.UNDERLINE,
+            input_filter=ft.NumbersOnlyInputFilter(),
+            value="",
+        )
+        self.switch_metrics_snapshot = ft.Switch(
+            label="Write metrics snapshot (metrics.json, restart required)",
+            value=False,
+            padding=10,
+        )
+        self.log_level_dropdown = ft.Dropdown(
+            width=700,
+            value="DEBUG",
+            label="Log level",
+            border_color=ft.Colors.TRANSPARENT,
+            filled=True,
+            fill_color=ft.Colors.SURFACE_CONTAINER,
+            options=[ft.DropdownOption(key=level, text=level) for level in LOG_LEVELS],
+        )
+        self.switch_tracing = ft.Switch(
+            label="Record tracing spans (traces.jsonl, restart required)",
+            value=False,
+            padding=10,
+        )
+        self.otlp_endpoint_textfield = ft.TextField(
+            label="OTLP/HTTP traces endpoint, e.g. http://127.0.0.1:4318/v1/traces",
+            border=ft.InputBorder.UNDERLINE,
+            value="",
+        )
+        self.rerender_button = ft.OutlinedButton(
+            "Re-render post texts from saved data",
+            icon=ft.Icons.REFRESH,
+            height=45,
+            on_click=lambda e: asyncio.create_task(self.rerender_library()),
+        )
         self.controls = [
             ft.Text(
                 spans=[
@@ -120,6 +221,7 @@ class SettingsGroup(ft.ListView):
             self.switch_download_videos,
             self.switch_download_audios,
             self.switch_download_files,
+            self.switch_save_raw_post,
             ft.Column(
                 spacing=25,
                 controls=[
@@ -129,14 +231,29 @@ class SettingsGroup(ft.ListView):
             ),
             ft.Text("Download settings", theme_style=ft.TextThemeStyle.LABEL_MEDIUM),
             self.chunk_size_textfield,
+            self.switch_chunk_size_auto,
             self.download_timeout_textfield,
             self.max_parallelism_textfield,
+            self.scheduling_policy_dropdown,
+            self.write_buffer_size_textfield,
+            self.switch_preallocate_files,
+            self.switch_receive_buffer_pool,
+            self.fsync_policy_dropdown,
+            self.disk_space_margin_textfield,
+            ft.Text("Monitoring", theme_style=ft.TextThemeStyle.LABEL_MEDIUM),
+            self.log_level_dropdown,
+            self.metrics_port_textfield,
+            self.switch_metrics_snapshot,
+            self.switch_tracing,
+            self.otlp_endpoint_textfield,
             ft.FilledButton(
                 "Save",
                 height=50,
                 margin=15,
                 on_click=lambda e: asyncio.create_task(self.apply_settings()),
             ),
+            ft.Text("Library", theme_style=ft.TextThemeStyle.LABEL_MEDIUM),
+            self.rerender_button,
         ]
 
         asyncio.create_task(self.set_initial_values())
@@ -199,6 +316,38 @@ class SettingsGroup(ft.ListView):
             )
             return
 
+        new_write_buffer_size = self.write_buffer_size_textfield.value
+        if not new_write_buffer_size or not 64 <= int(new_write_buffer_size) <= 16384:
+            self.page.show_dialog(
+                ft.AlertDialog(
+                    title=ft.Text("Write buffer size (KB)"),
+                    content=ft.Text("Please enter value between 64 and 16384."),
+                    actions=[
+                        ft.TextButton(
+                            "Understand", on_click=lambda e: self.page.pop_dialog()
+                        )
+                    ],
+                    open=True,
+                )
+            )
+            return
+
+        new_disk_space_margin = self.disk_space_margin_textfield.value
+        if not new_disk_space_margin:
+            self.page.show_dialog(
+                ft.AlertDialog(
+                    title=ft.Text("Keep free on disk (MB)"),
+                    content=ft.Text("Please enter value in megabytes, 0 to disable."),
+                    actions=[
+                        ft.TextButton(
+                            "Understand", on_click=lambda e: self.page.pop_dialog()
+                        )
+                    ],
+                    open=True,
+                )
+            )
+            return
+
         await ft.SharedPreferences().set(
             "need-download-photos", str(self.switch_download_photos.value)
         )
@@ -212,7 +361,14 @@ class SettingsGroup(ft.ListView):
             "need-download-files", str(self.switch_download_files.value)
         )
 
+        await ft.SharedPreferences().set(
+            "need-save-raw-post", str(self.switch_save_raw_post.value)
+        )
+
         await ft.SharedPreferences().set("download-chunk-size", str(new_chunk_size))
+        await ft.SharedPreferences().set(
+            "chunk-size-auto", str(self.switch_chunk_size_auto.value)
+        )
         await ft.SharedPreferences().set("download-timeout", str(new_download_timeout))
         await ft.SharedPreferences().set(
             "download-max-parallelism", str(new_max_parallelism)
@@ -220,12 +376,68 @@ class SettingsGroup(ft.ListView):
         await ft.SharedPreferences().set(
             "post-text-format", str(self.post_text_format_dropdown.value)
         )
+        await ft.SharedPreferences().set(
+            "write-buffer-size", str(int(new_write_buffer_size) * 1024)
+        )
+        await ft.SharedPreferences().set(
+            "preallocate-files", str(self.switch_preallocate_files.value)
+        )
+        await ft.SharedPreferences().set(
+            "receive-buffer-pool", str(self.switch_receive_buffer_pool.value)
+        )
+        await ft.SharedPreferences().set(
+            "fsync-policy", str(self.fsync_policy_dropdown.value)
+        )
+        await ft.SharedPreferences().set(
+            "scheduling-policy", str(self.scheduling_policy_dropdown.value)
+        )
+        await ft.SharedPreferences().set(
+            "disk-space-margin", str(int(new_disk_space_margin) * 1024 * 1024)
+        )
+        await ft.SharedPreferences().set(
+            "metrics-port", str(self.metrics_port_textfield.value or "")
+        )
+        await ft.SharedPreferences().set(
+            "metrics-snapshot", str(self.switch_metrics_snapshot.value)
+        )
+        await ft.SharedPreferences().set(
+            "tracing-enabled", str(self.switch_tracing.value)
+        )
+        await ft.SharedPreferences().set(
+            "log-level", str(self.log_level_dropdown.value)
+        )
+        set_log_level(self.log_level_dropdown.value)
+        await ft.SharedPreferences().set(
+            "tracing-otlp-endpoint", str(self.otlp_endpoint_textfield.value or "")
+        )
         await ft.SharedPreferences().set(
             "preferred-video-size", str(self.video_size_dropdown.value)
         )
 
         self.page.show_dialog(ft.SnackBar(ft.Text("Saved")))
 
+    async def rerender_library(self):
+        settings = await get_download_settings()
+        if not settings:
+            return
+        self.rerender_button.disabled = True
+        self.page.update()
+        try:
+            succeeded, failed = await asyncio.get_running_loop().run_in_executor(
+                None,
+                rerender_library,
+                Path(settings.downloads_folder),
+                settings.post_text_formats,
+            )
+            message = f"Re-rendered {succeeded} posts"
+            if failed:
+                message += f", {failed} failed"
+        except Exception as e:
+            logger.error("Failed re-render library", exc_info=e)
+            message = "Failed to re-render library"
+        self.rerender_button.disabled = False
+        self.page.show_dialog(ft.SnackBar(ft.Text(message)))
+
     async def set_initial_values(self):
         settings = await get_download_settings()
 
@@ -233,11 +445,26 @@ class SettingsGroup(ft.ListView):
         self.switch_download_videos.value = settings.need_download_videos
         self.switch_download_audios.value = settings.need_download_audios
         self.switch_download_files.value = settings.need_download_files
+        self.switch_save_raw_post.value = settings.need_save_raw_post
         self.chunk_size_textfield.value = str(settings.chunk_size)
+        self.switch_chunk_size_auto.value = settings.chunk_size_auto
         self.download_timeout_textfield.value = str(settings.download_timeout)
         self.max_parallelism_textfield.value = str(settings.max_parallelism)
         self.current_download_folder_text.value = settings.downloads_folder
         self.video_size_dropdown.value = settings.preferred_video_size
         self.post_text_format_dropdown.value = settings.post_text_format
+        self.write_buffer_size_textfield.value = str(settings.write_buffer_size // 1024)
+        self.switch_preallocate_files.value = settings.preallocate_files
+        self.switch_receive_buffer_pool.value = settings.receive_buffer_pool
+        self.fsync_policy_dropdown.value = settings.fsync_policy
+        self.scheduling_policy_dropdown.value = settings.scheduling_policy
+        self.disk_space_margin_textfield.value = str(
+            settings.disk_space_margin // (1024 * 1024)
+        )
+        self.metrics_port_textfield.value = str(settings.metrics_port or "")
+        self.switch_metrics_snapshot.value = settings.metrics_snapshot
+        self.switch_tracing.value = settings.tracing
+        self.log_level_dropdown.value = settings.log_level
+        self.otlp_endpoint_textfield.value = settings.otlp_endpoint or ""
         self.disabled = False
         self.page.update()
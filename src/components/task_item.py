@@ -5,6 +5,7 @@ from typing import Optional, Callable, Awaitable
 import flet as ft
 
 from core.defs.tasks import TaskInfo, TASK_ERROR_STATUS_LINE
+from core.progress_counter import format_eta, format_size, format_speed
 
 
 @ft.control
@@ -16,6 +17,7 @@ class TaskItem(ft.Container):
         visible=False,
         on_cancel: Optional[Callable[[Optional[TaskInfo]], Awaitable]] = None,
         on_retry: Optional[Callable[[Optional[TaskInfo]], Awaitable]] = None,
+        on_move_top: Optional[Callable[[Optional[TaskInfo]], Awaitable]] = None,
     ):
         super().__init__()
         self.progress_bar = ft.ProgressBar(color=ft.Colors.ORANGE, height=5)
@@ -37,6 +39,13 @@ class TaskItem(ft.Container):
             on_click=self.on_retry,
             bgcolor=ft.Colors.PRIMARY,
         )
+        self.move_top_button = ft.IconButton(
+            ft.Icon(ft.Icons.VERTICAL_ALIGN_TOP, color=ft.Colors.SURFACE_CONTAINER_LOW),
+            on_click=self.on_move_top,
+            bgcolor=ft.Colors.PRIMARY,
+            tooltip="Download next",
+            visible=False,
+        )
         self.task_info = task_info
         if self.task_info:
             title = self.task_info.post_id
@@ -72,6 +81,7 @@ class TaskItem(ft.Container):
                     expand=True,
                     alignment=ft.MainAxisAlignment.CENTER,
                 ),
+                self.move_top_button,
                 self.trailing_button,
             ],
             spacing=10,
@@ -81,6 +91,7 @@ class TaskItem(ft.Container):
         self.visible = visible
         self.on_cancel = on_cancel
         self.on_retry = on_retry
+        self.on_move_top = on_move_top
         self.update_view(self.task_info)
 
     def build(self):
@@ -109,11 +120,23 @@ class TaskItem(ft.Container):
         self.task_name.value = task_title
         self.task_prefix.value = task_prefix
         self.path = self.task_info.path
-        if self.task_info.total_weight < 1024**3:
-            weight = f"{self.task_info.total_weight / 1024 ** 2:.1f} MB"
-        else:
-            weight = f"{self.task_info.total_weight / 1024 ** 3:.1f} GB"
+        self.move_top_button.visible = (
+            self.task_info.queued and not self.task_info.finished
+        )
+        weight = format_size(self.task_info.total_weight)
         self.task_weight.value = f"{self.task_info.count_files} files, {weight}"
+        if not self.task_info.finished and self.task_info.waiting_space:
+            self.task_weight.value += " · waiting for disk space"
+        elif not self.task_info.finished and self.task_info.deferred_host:
+            self.task_weight.value += f" · waiting for {self.task_info.deferred_host}"
+        elif not self.task_info.finished and self.task_info.total_weight:
+            if self.task_info.stalled:
+                self.task_weight.value += " · stalled"
+            else:
+                self.task_weight.value += (
+                    f" · {format_speed(self.task_info.speed)}"
+                    f" · {format_eta(self.task_info.eta)}"
+                )
         if self.task_info.finished:
             if self.task_info.error:
                 err_icon, err_descr = TASK_ERROR_STATUS_LINE[self.task_info.error]
@@ -164,3 +187,7 @@ class TaskItem(ft.Container):
     async def on_retry(self):
         if self.on_retry:
             await self.on_retry(self.task_info)
+
+    async def on_move_top(self):
+        if self.on_move_top:
+            await self.on_move_top(self.task_info)
@@ -1,13 +1,23 @@
-from typing import Optional, Union
+from typing import Optional
 
-from aiohttp import ClientSession, ClientTimeout
+from aiohttp import ClientResponse, ClientSession, ClientTimeout
 
 import core.boosty.defs as cdefs
+import core.json_backend as json_backend
+from core.cassette import CassetteRecorder
 from core.defs.common import AuthToken
+from core.host_gate import KIND_API, host_gate
+from core.http_pool import http_pool
 from core.logger import setup_logger
+from core.metrics import http_trace_config
+from core.single_flight import SingleFlight
+from core.tracing import add_tracing_hooks, span
 
 logger = setup_logger()
 
+# Общий для всех клиентов: один пост могут одновременно запросить разные задачи
+_post_info_flight = SingleFlight("post_info")
+
 
 class BoostyClient:
 
@@ -16,10 +26,13 @@ class BoostyClient:
         chunk_size: int,
         download_timeout: int,
         auth_token: Optional[AuthToken] = None,
+        base_url: str = "https://api.boosty.to",
+        recorder: Optional[CassetteRecorder] = None,
     ) -> None:
         self.chunk_size = chunk_size
         self.download_timeout = download_timeout
-        self.base_url = "https://api.boosty.to"
+        self.base_url = base_url
+        self.recorder = recorder
         self._base_headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36",  # noqa: E501
             "Sec-Ch-Ua": '"Google Chrome";v="123", "Not:A-Brand";v="8", "Chromium";v="123"',
@@ -38,103 +51,72 @@ class BoostyClient:
         return self._base_headers
 
     def get_client_session(self) -> ClientSession:
+        """Сессия поверх общего пула соединений: закрытие ее не закрывает"""
         return ClientSession(
+            connector=http_pool.connector(),
+            connector_owner=False,
             headers=self._get_headers(),
             timeout=ClientTimeout(total=self.download_timeout),
+            trace_configs=[
+                add_tracing_hooks(http_trace_config()),
+                http_pool.trace_config(),
+            ],
         )
 
-    def _wrap_media_item(self, media: dict) -> Union[
-        cdefs.BoostyImageDto,
-        cdefs.BoostyVideoDto,
-        cdefs.BoostyAudioDto,
-        cdefs.BoostyFileDto,
-        cdefs.BoostyTextDto,
-        cdefs.BoostyLinkDto,
-        cdefs.BoostyListDto,
-        None,
-    ]:
-        match media["type"]:
-            case cdefs.BoostyMediaType.IMAGE.value:
-                if "width" not in media:  # issues/30 "узкая" картинка
-                    return None
-                return cdefs.BoostyImageDto(
-                    id=media["id"],
-                    url=media["url"],
-                    width=media["width"],
-                    height=media["height"],
-                    size=media["size"],
-                )
-            case cdefs.BoostyMediaType.VIDEO.value:
-                video = cdefs.BoostyVideoDto(id=media["id"], title=media["title"])
-                for url in media["playerUrls"]:
-                    if url["url"] != "" and url["type"] in cdefs.VIDEO_QUALITY_GRADE:
-                        size = cdefs.BoostyVideoSizesType(url["type"])
-                        video.player_urls[size] = cdefs.BoostyPlayerUrlDto(
-                            url=url["url"],
-                            size=size,
-                        )
-                return video
-            case cdefs.BoostyMediaType.AUDIO.value:
-                return cdefs.BoostyAudioDto(
-                    id=media["id"],
-                    url=media["url"],
-                    size=media["size"],
-                    title=media["title"],
-                )
-            case cdefs.BoostyMediaType.FILE.value:
-                return cdefs.BoostyFileDto(
-                    id=media["id"],
-                    url=media["url"],
-                    size=media["size"],
-                    title=media["title"],
-                )
-            case cdefs.BoostyMediaType.TEXT.value | cdefs.BoostyMediaType.HEADER.value:
-                return cdefs.BoostyTextDto(
-                    content=media["content"],
-                    modificator=media["modificator"],
-                )
-            case cdefs.BoostyMediaType.LINK.value:
-                return cdefs.BoostyLinkDto(
-                    content=media["content"],
-                    url=media["url"],
-                )
-            case cdefs.BoostyMediaType.LIST.value:
-                return cdefs.BoostyListDto(
-                    style=media["style"],
-                    items=media["items"],
-                )
-        return None
+    async def _record(self, response: ClientResponse, body: bytes) -> None:
+        if self.recorder:
+            await self.recorder.record(
+                response.method,
+                str(response.url),
+                response.status,
+                response.headers,
+                body,
+            )
+
+    _wrap_media_item = staticmethod(cdefs.wrap_media_item)
+
+    @classmethod
+    def wrap_post(
+        cls, post: dict, raw_json: Optional[bytes] = None
+    ) -> cdefs.BoostyPostDto:
+        """
+        Собирает DTO поста из ответа API. Медиа и текст разбираются лениво
+        из компактного JSON при первом обращении, для недоступных постов
+        сохраняется только заглушка без содержимого.
+        """
+        has_access = post["hasAccess"]
+        if has_access and raw_json is None:
+            raw_json = json_backend.dumps(post)
+        return cdefs.BoostyPostDto(
+            has_access=has_access,
+            id=post["id"],
+            int_id=post["intId"],
+            title=post["title"],
+            publish_time=post["publishTime"],
+            signed_query=post["signedQuery"] if has_access else "",
+            raw_json=raw_json if has_access else b"",
+        )
 
     async def get_post_info(self, author: str, post_id: str) -> cdefs.BoostyPostDto:
+        """Одинаковые одновременные запросы поста выполняются одним запросом"""
         url = self.base_url + f"/v1/blog/{author}/post/{post_id}"
-        async with self.get_client_session() as session:
-            response = await session.get(url)
-            response.raise_for_status()
-            content = await response.json()
-
-        text_content = cdefs.BoostyPostTextDto()
-        result = cdefs.BoostyPostDto(
-            has_access=content["hasAccess"],
-            id=content["id"],
-            int_id=content["intId"],
-            title=content["title"],
-            publish_time=content["publishTime"],
-            signed_query=content["signedQuery"],
+        auth = self.auth_token.authorization if self.auth_token else None
+        return await _post_info_flight.do(
+            (url, auth), lambda: self._fetch_post_info(url, post_id)
         )
 
-        for media in content["data"]:
-            wrapped_media = self._wrap_media_item(media)
-            if wrapped_media:
-                if isinstance(
-                    wrapped_media,
-                    (cdefs.BoostyTextDto, cdefs.BoostyLinkDto, cdefs.BoostyListDto),
-                ):
-                    text_content.content.append(wrapped_media)
-                else:
-                    result.media.append(wrapped_media)
-
-        result.text_content = text_content
-        return result
+    async def _fetch_post_info(self, url: str, post_id: str) -> cdefs.BoostyPostDto:
+        with span("get_post_info", post_id=post_id) as trace:
+            async with self.get_client_session() as session:
+                async with host_gate.request(url, KIND_API):
+                    response = await session.get(url)
+                    body = await response.read()
+                    trace.set("status", response.status)
+                    trace.set("bytes", len(body))
+                    await self._record(response, body)
+                    response.raise_for_status()
+
+        return self.wrap_post(json_backend.loads(body), raw_json=body)
 
     async def get_posts_list(
         self,
@@ -150,10 +132,15 @@ class BoostyClient:
         if offset:
             params["offset"] = offset
         url = self.base_url + f"/v1/blog/{author}/post/"
-        async with self.get_client_session() as session:
-            response = await session.get(url, params=params)
-            response.raise_for_status()
-            content = await response.json()
+        with span("get_posts_list", author=author, limit=limit) as trace:
+            async with self.get_client_session() as session:
+                async with host_gate.request(url, KIND_API):
+                    response = await session.get(url, params=params)
+                    body = await response.read()
+                    trace.set("status", response.status)
+                    await self._record(response, body)
+                    response.raise_for_status()
+                content = json_backend.loads(body)
         content_extra = content["extra"]
         content_data = content["data"]
         result = cdefs.BoostyPostsListDto(
@@ -163,27 +150,7 @@ class BoostyClient:
             )
         )
         for post in content_data:
-            new_post = cdefs.BoostyPostDto(
-                has_access=post["hasAccess"],
-                id=post["id"],
-                int_id=post["intId"],
-                title=post["title"],
-                publish_time=post["publishTime"],
-                signed_query=post["signedQuery"],
-            )
-            text_content = cdefs.BoostyPostTextDto()
-            for media in post["data"]:
-                wrapped_media = self._wrap_media_item(media)
-                if wrapped_media:
-                    if isinstance(
-                        wrapped_media,
-                        (cdefs.BoostyTextDto, cdefs.BoostyLinkDto, cdefs.BoostyListDto),
-                    ):
-                        text_content.content.append(wrapped_media)
-                    else:
-                        new_post.media.append(wrapped_media)
-            new_post.text_content = text_content
-            result.data.append(new_post)
+            result.data.append(self.wrap_post(post))
         return result
 
     async def get_max_int_id(self, author: str) -> Optional[int]:
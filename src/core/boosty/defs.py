@@ -1,6 +1,8 @@
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import List, Union, Dict, Optional
+from typing import List, Union, Dict, Optional, Tuple
+
+import core.json_backend as json_backend
 
 
 class BoostyMediaType(str, Enum):
@@ -31,7 +33,7 @@ VIDEO_QUALITY_GRADE = (
 )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BoostyImageDto:
     id: str
     url: str
@@ -40,13 +42,13 @@ class BoostyImageDto:
     size: int
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BoostyPlayerUrlDto:
     url: str
     size: BoostyVideoSizesType
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BoostyVideoDto:
     id: str
     title: str
@@ -58,7 +60,7 @@ class BoostyVideoDto:
         return f"{self.title if self.title else self.id}.mp4"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BoostyAudioDto:
     id: str
     url: str
@@ -69,7 +71,7 @@ class BoostyAudioDto:
         return self.title if self.title else f"{self.id}.mp3"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BoostyFileDto:
     id: str
     url: str
@@ -77,32 +79,35 @@ class BoostyFileDto:
     title: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BoostyTextDto:
     content: str
     modificator: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BoostyLinkDto:
     content: str
     url: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BoostyListDto:
     style: str
     items: List[Dict] = field(default_factory=list)
 
 
-@dataclass
+BoostyMedia = Union[BoostyImageDto, BoostyVideoDto, BoostyAudioDto, BoostyFileDto]
+
+
+@dataclass(slots=True, frozen=True)
 class BoostyPostTextDto:
     content: List[Union[BoostyTextDto, BoostyLinkDto, BoostyListDto]] = field(
         default_factory=list
     )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BoostyPostDto:
     has_access: bool
     id: str
@@ -110,22 +115,113 @@ class BoostyPostDto:
     publish_time: int
     title: Optional[str] = None
     signed_query: str = ""
-    text_content: BoostyPostTextDto = field(default_factory=BoostyPostTextDto)
-    media: List[
-        Union[BoostyImageDto, BoostyVideoDto, BoostyAudioDto, BoostyFileDto]
-    ] = field(default_factory=list)
-
+    raw_json: bytes = field(default=b"", repr=False, compare=False)
+    _content: Optional[Tuple[BoostyPostTextDto, List[BoostyMedia]]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
-@dataclass
+    def _materialize(self) -> Tuple[BoostyPostTextDto, List[BoostyMedia]]:
+        if self._content is None:
+            text_content = BoostyPostTextDto()
+            media = []
+            if self.raw_json:
+                for item in json_backend.loads(self.raw_json)["data"]:
+                    wrapped_media = wrap_media_item(item)
+                    if wrapped_media is None:
+                        continue
+                    if isinstance(
+                        wrapped_media, (BoostyTextDto, BoostyLinkDto, BoostyListDto)
+                    ):
+                        text_content.content.append(wrapped_media)
+                    else:
+                        media.append(wrapped_media)
+            object.__setattr__(self, "_content", (text_content, media))
+        return self._content
+
+    @property
+    def text_content(self) -> BoostyPostTextDto:
+        return self._materialize()[0]
+
+    @property
+    def media(self) -> List[BoostyMedia]:
+        return self._materialize()[1]
+
+
+@dataclass(slots=True, frozen=True)
 class BoostyExtraDto:
     is_last: bool
     offset: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BoostyPostsListDto:
     extra: BoostyExtraDto
     data: List[BoostyPostDto] = field(default_factory=list)
 
     def have_posts(self) -> bool:
         return len(self.data) > 0
+
+
+def wrap_media_item(media: dict) -> Union[
+    BoostyImageDto,
+    BoostyVideoDto,
+    BoostyAudioDto,
+    BoostyFileDto,
+    BoostyTextDto,
+    BoostyLinkDto,
+    BoostyListDto,
+    None,
+]:
+    match media["type"]:
+        case BoostyMediaType.IMAGE.value:
+            if "width" not in media:  # issues/30 "узкая" картинка
+                return None
+            return BoostyImageDto(
+                id=media["id"],
+                url=media["url"],
+                width=media["width"],
+                height=media["height"],
+                size=media["size"],
+            )
+        case BoostyMediaType.VIDEO.value:
+            player_urls = {}
+            for url in media["playerUrls"]:
+                if url["url"] != "" and url["type"] in VIDEO_QUALITY_GRADE:
+                    size = BoostyVideoSizesType(url["type"])
+                    player_urls[size] = BoostyPlayerUrlDto(
+                        url=url["url"],
+                        size=size,
+                    )
+            return BoostyVideoDto(
+                id=media["id"], title=media["title"], player_urls=player_urls
+            )
+        case BoostyMediaType.AUDIO.value:
+            return BoostyAudioDto(
+                id=media["id"],
+                url=media["url"],
+                size=media["size"],
+                title=media["title"],
+            )
+        case BoostyMediaType.FILE.value:
+            return BoostyFileDto(
+                id=media["id"],
+                url=media["url"],
+                size=media["size"],
+                title=media["title"],
+            )
+        case BoostyMediaType.TEXT.value | BoostyMediaType.HEADER.value:
+            return BoostyTextDto(
+                content=media["content"],
+                modificator=media["modificator"],
+            )
+        case BoostyMediaType.LINK.value:
+            return BoostyLinkDto(
+                content=media["content"],
+                url=media["url"],
+            )
+        case BoostyMediaType.LIST.value:
+            return BoostyListDto(
+                style=media["style"],
+                items=media["items"],
+            )
+    return None
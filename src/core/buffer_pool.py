@@ -0,0 +1,82 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, List
+
+from core.metrics import registry
+
+POOL_ALLOCATED = registry.gauge(
+    "boosty_buffer_pool_bytes", "Memory allocated by the receive buffer pool"
+)
+POOL_IN_USE = registry.gauge(
+    "boosty_buffer_pool_in_use_bytes", "Pooled buffers currently filled or written"
+)
+POOL_WAIT = registry.histogram(
+    "boosty_buffer_pool_wait_seconds",
+    "Time a download waited for a free pooled buffer",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+
+class BufferPool:
+    """
+    Пул переиспользуемых bytearray для приема данных из сети.
+    Общий объем выделенных буферов ограничен limit: когда он исчерпан,
+    acquire ждет возврата буфера. Используется только из event loop.
+    """
+
+    def __init__(self, limit: int = 64 * 1024 * 1024):
+        self.limit = limit
+        self.allocated = 0
+        self.in_use = 0
+        self._free: Dict[int, List[bytearray]] = {}
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def _take(self, size: int):
+        free = self._free.get(size)
+        if free:
+            return free.pop()
+        if self.allocated + size > self.limit:
+            # Свободные буферы другого размера (после смены настроек) освобождаем
+            for other, buffers in self._free.items():
+                while buffers and self.allocated + size > self.limit:
+                    self.allocated -= other
+                    buffers.pop()
+        # Один буфер выдается всегда, даже если он больше лимита
+        if self.allocated + size <= self.limit or self.in_use == 0:
+            self.allocated += size
+            POOL_ALLOCATED.set(self.allocated)
+            return bytearray(size)
+        return None
+
+    async def acquire(self, size: int) -> bytearray:
+        started = None
+        while (buffer := self._take(size)) is None:
+            if started is None:
+                started = time.monotonic()
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        if started is not None:
+            POOL_WAIT.observe(time.monotonic() - started)
+        self.in_use += size
+        POOL_IN_USE.set(self.in_use)
+        return buffer
+
+    def release(self, buffer: bytearray) -> None:
+        size = len(buffer)
+        self.in_use -= size
+        POOL_IN_USE.set(self.in_use)
+        self._free.setdefault(size, []).append(buffer)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+
+buffer_pool = BufferPool()
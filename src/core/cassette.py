@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Dict, Mapping, Optional
+
+import aiofiles
+
+from core.logger import setup_logger
+
+logger = setup_logger()
+
+INDEX_FILE_NAME = "index.jsonl"
+BODIES_DIR_NAME = "bodies"
+
+MEDIA_MODE_HEADERS = "headers"
+MEDIA_MODE_TRUNCATED = "truncated"
+MEDIA_MODE_FULL = "full"
+MEDIA_MODES = (MEDIA_MODE_HEADERS, MEDIA_MODE_TRUNCATED, MEDIA_MODE_FULL)
+
+# Заголовки, которые не имеют смысла при воспроизведении
+SKIPPED_HEADERS = {"set-cookie", "transfer-encoding", "connection", "content-encoding"}
+
+
+class MediaRecording:
+    """Запись тела медиа-ответа; в режиме truncated сохраняется только начало"""
+
+    def __init__(self, recorder: "CassetteRecorder", entry: dict, limit: Optional[int]):
+        self._recorder = recorder
+        self._entry = entry
+        self._limit = limit
+        self._written = 0
+        self._file = None
+
+    async def feed(self, chunk: bytes) -> None:
+        if self._limit is not None:
+            chunk = chunk[: max(0, self._limit - self._written)]
+        if not chunk:
+            return
+        if self._file is None:
+            self._file = await aiofiles.open(
+                self._recorder.path / self._entry["body"], "wb"
+            )
+        await self._file.write(chunk)
+        self._written += len(chunk)
+
+    async def close(self) -> None:
+        if self._file is not None:
+            await self._file.close()
+        else:
+            self._entry["body"] = None
+        self._entry["recorded_size"] = self._written
+        self._entry["truncated"] = (
+            self._entry.get("size") is not None and self._written < self._entry["size"]
+        )
+        await self._recorder.append(self._entry)
+
+
+class CassetteRecorder:
+    """
+    Сохраняет ответы API и CDN в каталог-кассету для оффлайн-воспроизведения.
+    index.jsonl хранит по записи на ответ, тела лежат в bodies/.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        media_mode: str = MEDIA_MODE_TRUNCATED,
+        media_limit: int = 64 * 1024,
+    ):
+        if media_mode not in MEDIA_MODES:
+            raise ValueError(f"Unknown media record mode: {media_mode}")
+        self.path = path
+        self.media_mode = media_mode
+        self.media_limit = media_limit
+        self._lock = asyncio.Lock()
+        (self.path / BODIES_DIR_NAME).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _body_name(method: str, url: str) -> str:
+        digest = hashlib.sha1(f"{method} {url}".encode("utf-8")).hexdigest()
+        return f"{BODIES_DIR_NAME}/{digest}.bin"
+
+    def _entry(
+        self, method: str, url: str, status: int, headers: Mapping[str, str]
+    ) -> dict:
+        size = headers.get("Content-Length")
+        return {
+            "time": time.time(),
+            "method": method,
+            "url": url,
+            "status": status,
+            "headers": {
+                k: v for k, v in headers.items() if k.lower() not in SKIPPED_HEADERS
+            },
+            "size": int(size) if size and size.isdigit() else None,
+            "body": self._body_name(method, url),
+        }
+
+    async def append(self, entry: dict) -> None:
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        async with self._lock:
+            async with aiofiles.open(self.path / INDEX_FILE_NAME, "a") as f:
+                await f.write(line)
+
+    async def record(
+        self,
+        method: str,
+        url: str,
+        status: int,
+        headers: Mapping[str, str],
+        body: Optional[bytes],
+    ) -> None:
+        """Записывает ответ API целиком"""
+        entry = self._entry(method, url, status, headers)
+        if body:
+            async with aiofiles.open(self.path / entry["body"], "wb") as f:
+                await f.write(body)
+            entry["size"] = len(body)
+            entry["recorded_size"] = len(body)
+        else:
+            entry["body"] = None
+        entry["truncated"] = False
+        await self.append(entry)
+
+    def start_media(
+        self, method: str, url: str, status: int, headers: Mapping[str, str]
+    ) -> MediaRecording:
+        limit = {
+            MEDIA_MODE_HEADERS: 0,
+            MEDIA_MODE_TRUNCATED: self.media_limit,
+            MEDIA_MODE_FULL: None,
+        }[self.media_mode]
+        return MediaRecording(self, self._entry(method, url, status, headers), limit)
+
+
+_recorders: Dict[Path, CassetteRecorder] = {}
+
+
+def get_recorder(path: str, media_mode: str = MEDIA_MODE_TRUNCATED) -> CassetteRecorder:
+    """Один рекордер на каталог, чтобы таски не писали индекс наперегонки"""
+    key = Path(path).resolve()
+    if key not in _recorders:
+        _recorders[key] = CassetteRecorder(key, media_mode=media_mode)
+        logger.info(f"Recording responses to {key} (media: {media_mode})")
+    return _recorders[key]
+
+
+def load_cassette(path: Path) -> list:
+    entries = []
+    with open(path / INDEX_FILE_NAME, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entries.append(json.loads(line))
+    return entries
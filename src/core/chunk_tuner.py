@@ -0,0 +1,101 @@
+import time
+from typing import Optional
+
+from core.defs.common import DownloadingSettingsDto
+from core.metrics import registry
+
+READ_CHUNK_SIZE = registry.histogram(
+    "boosty_read_chunk_bytes",
+    "Size of network reads chosen for media transfers",
+    buckets=tuple(2**i for i in range(12, 25)),
+)
+CHUNK_SIZE_CHANGES = registry.counter(
+    "boosty_read_chunk_changes_total",
+    "Read size adjustments made by the chunk tuner",
+    ("direction",),
+)
+
+
+class ChunkTuner:
+    """
+    Подбирает размер чтения из сети между min_size и max_size.
+    Раз в window секунд (или window_reads чтений, если файл быстрый)
+    оценивает скорость передачи: размер стремится
+    к объему, приходящему за target_interval. Увеличивается, только если
+    чтения в среднем возвращали почти весь запрошенный размер (данные уже
+    ждали в буфере), уменьшается, если приходит заметно меньше нужного.
+    Файлы задачи качаются одновременно, поэтому каждая передача получает
+    свой тюнер (for_transfer) со своим окном; он начинает с размера,
+    выбранного в задаче последним.
+    """
+
+    def __init__(
+        self,
+        min_size: int,
+        max_size: int,
+        initial: Optional[int] = None,
+        target_interval: float = 0.05,
+        window: float = 0.25,
+        window_reads: int = 32,
+    ):
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.size = min(self.max_size, max(min_size, initial or min_size))
+        self.target_interval = target_interval
+        self.window = window
+        self.window_reads = window_reads
+        self._parent: Optional["ChunkTuner"] = None
+        self._start_window()
+
+    @classmethod
+    def from_settings(cls, settings: DownloadingSettingsDto) -> Optional["ChunkTuner"]:
+        if not settings.chunk_size_auto:
+            return None
+        return cls(
+            settings.chunk_size_min, settings.chunk_size_max, settings.chunk_size
+        )
+
+    def for_transfer(self) -> "ChunkTuner":
+        """Тюнер одной передачи; его решения становятся стартовыми для следующих"""
+        tuner = ChunkTuner(
+            self.min_size,
+            self.max_size,
+            self.size,
+            self.target_interval,
+            self.window,
+            self.window_reads,
+        )
+        tuner._parent = self
+        return tuner
+
+    def _start_window(self) -> None:
+        self._window_start = time.monotonic()
+        self._bytes = 0
+        self._reads = 0
+
+    def observe(self, nbytes: int) -> int:
+        """Учитывает результат чтения и возвращает размер следующего"""
+        READ_CHUNK_SIZE.observe(self.size)
+        self._bytes += nbytes
+        self._reads += 1
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.window and self._reads < self.window_reads:
+            return self.size
+        ideal = self._bytes / elapsed * self.target_interval
+        filled = self._bytes / self._reads >= self.size * 0.75
+        if ideal > self.size and filled:
+            self._resize(self.size * 2, "up")
+        elif ideal < self.size / 2:
+            self._resize(self.size // 2, "down")
+        self._window_start = now
+        self._bytes = self._reads = 0
+        return self.size
+
+    def _resize(self, size: int, direction: str) -> None:
+        size = min(self.max_size, max(self.min_size, size))
+        if size != self.size:
+            self.size = size
+            CHUNK_SIZE_CHANGES.inc(1, direction)
+            if self._parent is not None:
+                self._parent.size = size
@@ -1,7 +1,7 @@
 import base64
 import json
 from dataclasses import dataclass
-from typing import Optional
+from typing import Awaitable, Callable, Optional, Tuple
 
 from core.logger import setup_logger
 
@@ -49,3 +49,30 @@ class DownloadingSettingsDto:
     post_text_format: str
     downloads_folder: str
     max_parallelism: int
+    need_save_raw_post: bool = True
+    api_base_url: str = "https://api.boosty.to"
+    record_dir: Optional[str] = None  # каталог кассеты для записи ответов
+    record_media: str = "truncated"
+    metrics_port: Optional[int] = None  # локальный порт для Prometheus
+    metrics_snapshot: bool = False
+    tracing: bool = False
+    log_level: str = "DEBUG"
+    otlp_endpoint: Optional[str] = None
+    write_buffer_size: int = 1024 * 1024  # объем, накапливаемый перед записью
+    preallocate_files: bool = False
+    fsync_policy: str = "never"  # never, close, always
+    chunk_size_auto: bool = False  # chunk_size - стартовое значение подбора
+    chunk_size_min: int = 16 * 1024
+    chunk_size_max: int = 4 * 1024 * 1024
+    receive_buffer_pool: bool = False
+    buffer_pool_limit: int = 64 * 1024 * 1024  # общий объем буферов приема
+    disk_space_margin: int = 512 * 1024 * 1024  # не занимать последние байты тома
+    scheduling_policy: str = "fifo"  # fifo, shortest, fair
+
+    @property
+    def post_text_formats(self) -> Tuple[str, ...]:
+        return tuple(fmt for fmt in self.post_text_format.split(",") if fmt)
+
+
+SettingsProvider = Callable[[], Awaitable[Optional[DownloadingSettingsDto]]]
+AuthProvider = Callable[[], Awaitable[Optional[AuthToken]]]
@@ -11,6 +11,7 @@ class TaskError(Enum):
     ALREADY_EXISTS = "ALREADY_EXISTS"
     ACCESS_DENIED = "ACCESS_DENIED"
     NO_HOME_FOLDER = "NO_HOME_FOLDER"
+    NO_DISK_SPACE = "NO_DISK_SPACE"
 
 
 @dataclass
@@ -24,6 +25,12 @@ class TaskInfo:
     count_files: int
     total_weight: int
     error: Optional[TaskError] = None
+    speed: float = 0.0  # байт/с
+    eta: Optional[float] = None  # секунды
+    stalled: bool = False
+    waiting_space: bool = False  # ждет свободного места на диске
+    queued: bool = False  # ждет слот загрузки
+    deferred_host: Optional[str] = None  # ждет, пока хост снова станет доступен
 
 
 TASK_ERROR_STATUS_LINE = {
@@ -32,4 +39,5 @@ TASK_ERROR_STATUS_LINE = {
     TaskError.ALREADY_EXISTS: [ft.Icons.REMOVE_RED_EYE_ROUNDED, "Already exists"],
     TaskError.ACCESS_DENIED: [ft.Icons.LOCK_ROUNDED, "Don't have access to post"],
     TaskError.NO_HOME_FOLDER: [ft.Icons.FOLDER_OFF, "Download directory unavailable"],
+    TaskError.NO_DISK_SPACE: [ft.Icons.SD_CARD_ALERT_ROUNDED, "Not enough disk space"],
 }
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import shutil
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Deque, Dict, Optional, Tuple
+
+import core.fs as fs
+from core.logger import setup_logger
+from core.metrics import registry
+
+logger = setup_logger()
+
+DISK_RESERVED = registry.gauge(
+    "boosty_disk_reserved_bytes", "Bytes reserved on disk by admitted tasks"
+)
+TASKS_WAITING_SPACE = registry.gauge(
+    "boosty_tasks_waiting_disk_space", "Tasks waiting for free disk space"
+)
+DISK_SPACE_WAIT = registry.histogram(
+    "boosty_disk_space_wait_seconds",
+    "Time a task waited for free disk space",
+    buckets=(0.1, 1, 5, 30, 60, 300, 1800, 3600),
+)
+
+
+class InsufficientDiskSpaceError(Exception):
+    """Задача не помещается на том, даже когда других резервов на нем нет"""
+
+
+@dataclass
+class SpaceStatus:
+    reserved: int
+    waiting: int
+    free: Optional[int]  # свободно на томе по последней проверке
+    margin: int  # запас, с которым задачи резервировали место последними
+
+
+class Reservation:
+    """
+    Зарезервированный под задачу объем. Уменьшается по мере записи файлов
+    (записанное уже учтено в свободном месте тома) и снимается при release.
+    """
+
+    def __init__(self, admission: "DiskSpaceAdmission", volume: int, size: int):
+        self.volume = volume
+        self.size = size
+        self._admission = admission
+
+    def consume(self, nbytes: int) -> None:
+        """Отмечает nbytes как записанные на диск"""
+        self._admission._shrink(self, min(nbytes, self.size))
+
+    def release(self) -> None:
+        self._admission._shrink(self, self.size)
+
+
+class DiskSpaceAdmission:
+    """
+    Допуск задач по свободному месту на томе папки загрузок. Задача
+    резервирует ожидаемый объем; если вместе с уже выданными резервами он не
+    помещается в свободное место за вычетом запаса margin из настроек задачи,
+    задача ждет, пока резервы не освободятся или место не появится (проверка
+    раз в poll_interval секунд). Задача, которой не хватает места и без чужих
+    резервов, получает InsufficientDiskSpaceError. Используется только из
+    event loop.
+    """
+
+    def __init__(self, poll_interval: float = 5):
+        self.poll_interval = poll_interval
+        self._margin = 0
+        self._reserved: Dict[int, int] = {}
+        self._free: Optional[int] = None
+        self._waiting = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def reserved(self) -> int:
+        return sum(self._reserved.values())
+
+    def status(self) -> SpaceStatus:
+        return SpaceStatus(
+            reserved=self.reserved,
+            waiting=self._waiting,
+            free=self._free,
+            margin=self._margin,
+        )
+
+    @staticmethod
+    def _stat_volume(folder: Path) -> Tuple[int, int]:
+        return os.stat(folder).st_dev, shutil.disk_usage(folder).free
+
+    async def try_reserve(
+        self, folder: Path, size: int, margin: int
+    ) -> Optional[Reservation]:
+        """
+        Резервирует size байт на томе folder, оставляя свободными margin
+        байт, или возвращает None
+        """
+        volume, free = await fs.run(self._stat_volume, folder)
+        self._free = free
+        self._margin = margin
+        reserved = self._reserved.get(volume, 0)
+        if size and reserved + size > free - margin:
+            if not reserved:
+                # Ждать нечего: место не освободят другие задачи
+                raise InsufficientDiskSpaceError(
+                    f"Not enough disk space in {folder}: need {size} bytes, "
+                    f"free {free}, margin {margin}"
+                )
+            return None
+        self._reserved[volume] = reserved + size
+        DISK_RESERVED.set(self.reserved)
+        return Reservation(self, volume, size)
+
+    async def reserve(self, folder: Path, size: int, margin: int) -> Reservation:
+        """Ждет, пока size байт не поместятся на томе folder с запасом margin"""
+        started = time.monotonic()
+        logged = False
+        self._waiting += 1
+        TASKS_WAITING_SPACE.inc()
+        try:
+            while (reservation := await self.try_reserve(folder, size, margin)) is None:
+                if not logged:
+                    logger.warning(
+                        f"Not enough disk space in {folder}: need {size} bytes, "
+                        f"free {self._free}, reserved {self.reserved}, "
+                        f"margin {margin}; waiting"
+                    )
+                    logged = True
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+                try:
+                    await asyncio.wait_for(waiter, self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+        finally:
+            self._waiting -= 1
+            TASKS_WAITING_SPACE.dec()
+        DISK_SPACE_WAIT.observe(time.monotonic() - started)
+        return reservation
+
+    def _shrink(self, reservation: Reservation, nbytes: int) -> None:
+        if nbytes <= 0:
+            return
+        reservation.size -= nbytes
+        self._reserved[reservation.volume] -= nbytes
+        DISK_RESERVED.set(self.reserved)
+        # Освободившееся место могут занять несколько ожидающих: будим всех
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+disk_space = DiskSpaceAdmission()
@@ -0,0 +1,333 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional, Tuple, TypeVar
+
+from core.buffer_pool import BufferPool, buffer_pool
+from core.defs.common import DownloadingSettingsDto
+from core.logger import setup_logger
+from core.metrics import registry
+from core.tracing import NOOP_SPAN, span
+
+logger = setup_logger()
+
+T = TypeVar("T")
+
+FSYNC_NEVER = "never"
+FSYNC_ON_CLOSE = "close"
+FSYNC_ALWAYS = "always"
+FSYNC_POLICIES = (FSYNC_NEVER, FSYNC_ON_CLOSE, FSYNC_ALWAYS)
+
+DISK_WRITES = registry.counter(
+    "boosty_disk_writes_total", "Coalesced buffer writes to media files"
+)
+DISK_WRITE_TIME = registry.histogram(
+    "boosty_disk_write_seconds",
+    "Time to write one coalesced buffer",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+DISK_WRITE_BACKPRESSURE = registry.histogram(
+    "boosty_disk_write_wait_seconds",
+    "Time a download waited for a free writer queue slot",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+FSYNC_TIME = registry.histogram(
+    "boosty_fsync_seconds",
+    "Time spent in fsync",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+
+@dataclass
+class WriteOptions:
+    buffer_size: int = 1024 * 1024
+    preallocate: bool = False
+    fsync: str = FSYNC_NEVER
+    pool: Optional[BufferPool] = None  # прием в переиспользуемые буферы
+
+    @classmethod
+    def from_settings(cls, settings: DownloadingSettingsDto) -> "WriteOptions":
+        return cls(
+            buffer_size=settings.write_buffer_size,
+            preallocate=settings.preallocate_files,
+            fsync=settings.fsync_policy,
+            pool=buffer_pool if settings.receive_buffer_pool else None,
+        )
+
+
+def _preallocate(fd: int, size: int) -> None:
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+    except OSError as e:
+        # Не все файловые системы (сетевые, FAT) поддерживают fallocate
+        logger.debug(f"Preallocation of {size} bytes failed: {e}")
+
+
+def _fsync(fd: int) -> float:
+    started = time.monotonic()
+    os.fsync(fd)
+    return time.monotonic() - started
+
+
+class FileWriter:
+    """
+    Запись одного файла через DiskWriter: чанки копятся в буфере до
+    buffer_size и уходят в пул записи. В полете не больше одного буфера
+    файла, поэтому порядок записи сохраняется, а следующий буфер копится,
+    пока пишется предыдущий.
+    """
+
+    def __init__(
+        self,
+        writer: "DiskWriter",
+        path: Path,
+        size: Optional[int],
+        options: WriteOptions,
+        offset: int = 0,
+    ):
+        self.path = path
+        self.size = size
+        self.options = options
+        self.offset = offset
+        # Подтвержденно записано с начала файла, включая дописываемую часть
+        self.written = offset
+        self._writer = writer
+        self._file = None
+        self._buffer = bytearray()
+        self._pending: Optional[asyncio.Future] = None
+        self._io: Optional[asyncio.Future] = None  # запись буфера в потоке
+
+    def _open(self):
+        if self.offset:
+            # Продолжение недокачанного файла: пишем после первых offset байт
+            f = open(self.path, "r+b")
+            f.truncate(self.offset)
+            f.seek(self.offset)
+        else:
+            f = open(self.path, "wb")
+        if self.options.preallocate and self.size:
+            _preallocate(f.fileno(), self.size)
+        return f
+
+    # Методы _open, _write и _finish выполняются в потоках записи и возвращают
+    # время операций: метрики обновляются уже в event loop
+
+    def _write(self, data) -> Tuple[float, Optional[float]]:
+        started = time.monotonic()
+        self._file.write(data)
+        fsync_time = None
+        if self.options.fsync == FSYNC_ALWAYS:
+            self._file.flush()
+            fsync_time = _fsync(self._file.fileno())
+        return time.monotonic() - started, fsync_time
+
+    def _finish(self, completed: bool) -> Optional[float]:
+        try:
+            self._file.flush()
+            if not completed or (self.options.preallocate and self.size):
+                # Предвыделенный хвост и части неудачных записей отрезаются:
+                # продолжение загрузки доверяет размеру файла
+                self._file.truncate(self.written)
+            if completed and self.options.fsync == FSYNC_ON_CLOSE:
+                return _fsync(self._file.fileno())
+            return None
+        finally:
+            self._file.close()
+
+    async def _write_buffer(
+        self, data, on_done: Optional[Callable[[], None]] = None
+    ) -> None:
+        """
+        Пишет буфер в потоке записи. written растет, только когда запись
+        завершилась успешно; on_done вызывается, когда поток закончил с
+        буфером, даже если запись перестали ждать.
+        """
+        try:
+            io = await self._writer.submit(self._write, data)
+        except BaseException:
+            if on_done is not None:
+                on_done()
+            raise
+        nbytes = len(data)
+
+        def done(future: asyncio.Future) -> None:
+            if not future.cancelled() and future.exception() is None:
+                self.written += nbytes
+            if on_done is not None:
+                on_done()
+
+        io.add_done_callback(done)
+        self._io = io
+        # Отмена ожидания не останавливает поток: сама запись не отменяется
+        write_time, fsync_time = await asyncio.shield(io)
+        DISK_WRITES.inc()
+        DISK_WRITE_TIME.observe(write_time)
+        if fsync_time is not None:
+            FSYNC_TIME.observe(fsync_time)
+
+    async def __aenter__(self) -> "FileWriter":
+        self._file = await self._writer.run(self._open)
+        return self
+
+    async def write(self, chunk: bytes) -> None:
+        self._buffer += chunk
+        if len(self._buffer) >= self.options.buffer_size:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if self._pending is not None:
+            await self._pending
+            self._pending = None
+        if not self._buffer:
+            return
+        data, self._buffer = self._buffer, bytearray()
+        self._pending = asyncio.ensure_future(self._write_buffer(data))
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        completed = exc_type is None
+        try:
+            if completed:
+                await self._flush()
+            if self._pending is not None:
+                pending, self._pending = self._pending, None
+                try:
+                    await pending
+                except Exception:
+                    if completed:
+                        raise
+                    completed = False
+        finally:
+            if self._io is not None and not self._io.done():
+                # Файл обрезается и закрывается только после записи в полете
+                await asyncio.wait((self._io,))
+            fsync = completed and self.options.fsync == FSYNC_ON_CLOSE
+            with span("fsync") if fsync else NOOP_SPAN:
+                fsync_time = await self._writer.run(self._finish, completed)
+            if fsync_time is not None:
+                FSYNC_TIME.observe(fsync_time)
+
+
+class PooledFileWriter(FileWriter):
+    """
+    Запись через буферы фиксированного размера из BufferPool: чанк из сети
+    копируется один раз прямо в буфер пула, буфер пишется через memoryview
+    без промежуточных копий и возвращается в пул, когда запись в потоке
+    завершилась.
+    """
+
+    def __init__(
+        self,
+        writer: "DiskWriter",
+        path: Path,
+        size: Optional[int],
+        options: WriteOptions,
+        offset: int = 0,
+    ):
+        super().__init__(writer, path, size, options, offset)
+        self._pool = options.pool
+        self._buffer: Optional[bytearray] = None
+        self._fill = 0
+
+    async def write(self, chunk: bytes) -> None:
+        view = memoryview(chunk)
+        offset = 0
+        while offset < len(view):
+            if self._buffer is None:
+                self._buffer = await self._pool.acquire(self.options.buffer_size)
+                self._fill = 0
+            n = min(len(view) - offset, len(self._buffer) - self._fill)
+            self._buffer[self._fill : self._fill + n] = view[offset : offset + n]
+            self._fill += n
+            offset += n
+            if self._fill == len(self._buffer):
+                await self._flush()
+
+    async def _flush(self) -> None:
+        if self._pending is not None:
+            await self._pending
+            self._pending = None
+        if not self._fill:
+            return
+        buffer, fill = self._buffer, self._fill
+        self._buffer, self._fill = None, 0
+        self._pending = asyncio.ensure_future(self._write_pooled(buffer, fill))
+
+    async def _write_pooled(self, buffer: bytearray, fill: int) -> None:
+        # Буфер возвращается в пул, только когда поток записи его отпустил:
+        # после отмены ожидания запись из него еще может идти
+        await self._write_buffer(
+            memoryview(buffer)[:fill], lambda: self._pool.release(buffer)
+        )
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        try:
+            await super().__aexit__(exc_type, exc, tb)
+        finally:
+            if self._buffer is not None:
+                self._pool.release(self._buffer)
+                self._buffer, self._fill = None, 0
+
+
+class DiskWriter:
+    """
+    Стадия записи на диск: ограниченный пул потоков и очередь буферов.
+    Когда в очереди queue_size буферов, загрузки ждут свободного места
+    и перестают читать из сети (backpressure).
+    """
+
+    def __init__(self, workers: int = 4, queue_size: int = 32):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="disk-writer"
+        )
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.queue_size)
+        return self._slots
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        """Выполняет операцию в пуле записи без учета очереди буферов"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, func, *args
+        )
+
+    async def submit(self, func: Callable[..., T], *args) -> "asyncio.Future[T]":
+        """
+        Ставит запись буфера в очередь, ожидая свободного места, и возвращает
+        future записи. Место освобождается, когда запись в потоке
+        завершилась, даже если ее результат перестали ждать.
+        """
+        slots = self._get_slots()
+        started = time.monotonic()
+        await slots.acquire()
+        DISK_WRITE_BACKPRESSURE.observe(time.monotonic() - started)
+        future = asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def open(
+        self,
+        path: Path,
+        size: Optional[int] = None,
+        options: WriteOptions = WriteOptions(),
+        offset: int = 0,
+    ) -> FileWriter:
+        """size - полный размер файла, offset - сколько его уже записано"""
+        if options.pool is not None:
+            return PooledFileWriter(self, path, size, options, offset)
+        return FileWriter(self, path, size, options, offset)
+
+
+disk_writer = DiskWriter()
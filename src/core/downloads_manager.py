@@ -1,21 +1,44 @@
 import asyncio
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 
+from core.authorization_provider import AuthorizationProvider
+from core.buffer_pool import buffer_pool
 from core.boosty.defs import BoostyPostDto
+from core.defs.common import SettingsProvider, AuthProvider
 from core.defs.tasks import TaskInfo
+from core.disk_space import SpaceStatus, disk_space
+from core.logger import setup_logger
+from core.pipeline import DownloadPipeline
+from core.progress_counter import ProgressCounter, format_eta, format_speed
 from core.task import Task
+from core.utils import get_download_settings
+
+logger = setup_logger()
 
 
 class DownloadManager:
     def __init__(
         self,
         maximum_concurrency: int = 5,
+        settings_provider: SettingsProvider = get_download_settings,
+        auth_provider: AuthProvider = AuthorizationProvider.get_authorization_if_valid,
+        poll_interval: float = 5,
+        scheduling_policy: str = "fifo",
+        metadata_concurrency: int = 4,
     ):
         self._tasks: Dict[str, "Task"] = {}
         self.maximum_concurrency = maximum_concurrency
-        self._semaphore = asyncio.Semaphore(self.maximum_concurrency)
+        self._settings_provider = settings_provider
+        self._auth_provider = auth_provider
+        self._poll_interval = poll_interval
+        self._pipeline = DownloadPipeline.create(
+            transfer_workers=self.maximum_concurrency,
+            metadata_concurrency=metadata_concurrency,
+            scheduling_policy=scheduling_policy,
+        )
         self._lock = asyncio.Lock()
         self._closed = False
+        self.progress = ProgressCounter(total=None)
 
     async def add_task(
         self, author: str, post_id: str, post_info: Optional[BoostyPostDto] = None
@@ -27,20 +50,35 @@ class DownloadManager:
                 else:
                     return False
             self._tasks[post_id] = Task(
-                semaphore=self._semaphore,
+                pipeline=self._pipeline,
                 author=author,
                 post_id=post_id,
                 post_info=post_info,
+                settings_provider=self._settings_provider,
+                auth_provider=self._auth_provider,
+                progress_parent=self.progress,
             )
             return True
 
     async def mainloop(self):
         while not self._closed:
+            settings = await self._settings_provider()
+            if settings:
+                # Общие для всех задач настройки применяются здесь, а не задачами
+                self._pipeline.set_policy(settings.scheduling_policy)
+                buffer_pool.limit = settings.buffer_pool_limit
             async with self._lock:
                 for post_id in self._tasks.keys():
                     if self._tasks[post_id].ready():
                         self._tasks[post_id].launch()
-            await asyncio.sleep(5)
+            speed, eta = await self.get_throughput()
+            if speed:
+                logger.info(f"Throughput: {format_speed(speed)}, ETA {format_eta(eta)}")
+            await asyncio.sleep(self._poll_interval)
+
+    def close(self):
+        self._closed = True
+        self._pipeline.stop()
 
     async def get_pending_tasks_count(self) -> int:
         async with self._lock:
@@ -58,6 +96,20 @@ class DownloadManager:
                     result += 1
             return result
 
+    async def get_throughput(self) -> Tuple[float, Optional[float]]:
+        """Общая скорость (байт/с) и ETA по всем незавершенным таскам"""
+        speed = self.progress.speed
+        async with self._lock:
+            remaining = sum(task.remaining_bytes for task in self._tasks.values())
+        if speed <= 0 or not remaining:
+            return speed, None
+        return speed, remaining / speed
+
+    @staticmethod
+    def get_space_status() -> SpaceStatus:
+        """Резервы места на диске и число задач, ждущих места"""
+        return disk_space.status()
+
     @property
     def total_tasks(self) -> int:
         return len(self._tasks)
@@ -86,6 +138,12 @@ class DownloadManager:
                             error=self._tasks[post_id].error_description,
                             count_files=self._tasks[post_id].count_files,
                             total_weight=self._tasks[post_id].total_weight,
+                            speed=self._tasks[post_id].speed,
+                            eta=self._tasks[post_id].eta,
+                            stalled=self._tasks[post_id].stalled,
+                            waiting_space=self._tasks[post_id].waiting_space,
+                            queued=self._tasks[post_id].queued,
+                            deferred_host=self._tasks[post_id].deferred_host,
                         )
                     )
                     if len(result) == limit:
@@ -102,6 +160,14 @@ class DownloadManager:
             if self._tasks[post_id].pending:
                 await self._tasks[post_id].stop()
 
+    async def move_to_top(self, post_id: str):
+        """Задача получит следующий свободный слот"""
+        async with self._lock:
+            if post_id not in self._tasks.keys():
+                return
+            top = max(task.priority for task in self._tasks.values())
+            self._tasks[post_id].priority = top + 1
+
     async def retry_task(self, post_id: str):
         if post_id in self._tasks.keys():
             await self._tasks[post_id].retry()
@@ -1,8 +1,214 @@
-import json
-from typing import List, Union, Tuple
+from html import escape
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
 
+import core.json_backend as json_backend
 from core.boosty.defs import BoostyTextDto, BoostyLinkDto, BoostyListDto
 
+TEXT_FORMAT_MARKDOWN = "md"
+TEXT_FORMAT_PLAIN = "raw"
+TEXT_FORMAT_HTML = "html"
+
+TEXT_FORMATS = (TEXT_FORMAT_MARKDOWN, TEXT_FORMAT_PLAIN, TEXT_FORMAT_HTML)
+
+Styles = Tuple[Tuple[int, int, int], ...]
+
+
+class TextNode(NamedTuple):
+    text: str
+    block_type: str
+    styles: Styles
+
+
+class BlockEndNode(NamedTuple):
+    pass
+
+
+class LinkNode(NamedTuple):
+    text: str
+    styles: Styles
+    url: str
+
+
+class ListItemNode(NamedTuple):
+    parts: Tuple[Tuple[str, Styles], ...]
+    children: Tuple["ListItemNode", ...]
+
+
+class ListNode(NamedTuple):
+    style: str
+    items: Tuple[ListItemNode, ...]
+
+
+Node = Union[TextNode, BlockEndNode, LinkNode, ListNode]
+
+BLOCK_END = BlockEndNode()
+
+
+class _Emitter:
+    def __init__(self, converter: "DraftJsConverter"):
+        self._converter = converter
+
+    def feed(self, node: Node) -> str:
+        raise NotImplementedError
+
+    def finish(self) -> str:
+        return ""
+
+
+class _MarkdownEmitter(_Emitter):
+    def _list_lines(self, items: Sequence[ListItemNode], level: int) -> List[str]:
+        lines = []
+        indent = "    " * level
+        for item in items:
+            combined_text = "".join(
+                self._converter._apply_markdown_styles(text, styles)
+                for text, styles in item.parts
+            )
+            if combined_text:
+                lines.append(f"{indent}* {combined_text}")
+            if item.children:
+                lines.append("\n")
+                lines.extend(self._list_lines(item.children, level + 1))
+            lines.append("\n\n")
+        return lines
+
+    def feed(self, node: Node) -> str:
+        if isinstance(node, BlockEndNode):
+            return "\n\n"
+        if isinstance(node, TextNode):
+            prefix = self._converter.BLOCK_TYPES.get(node.block_type, "")
+            text = self._converter._apply_markdown_styles(node.text, node.styles)
+            return f"{prefix}{text}"
+        if isinstance(node, LinkNode):
+            text = self._converter._apply_markdown_styles(node.text, node.styles)
+            return f"[{text}]({node.url})"
+        return "".join(self._list_lines(node.items, 0))
+
+
+class _PlainTextEmitter(_Emitter):
+    def _list_lines(self, items: Sequence[ListItemNode], level: int) -> List[str]:
+        lines = []
+        indent = "  " * level
+        for item in items:
+            lines.append(f"{indent}- {''.join(text for text, _ in item.parts)}")
+            if item.children:
+                lines.append("\n")
+                lines.extend(self._list_lines(item.children, level + 1))
+            lines.append("\n")
+        return lines
+
+    def feed(self, node: Node) -> str:
+        if isinstance(node, BlockEndNode):
+            return "\n"
+        if isinstance(node, TextNode):
+            return node.text
+        if isinstance(node, LinkNode):
+            return f"{node.text} (ссылка: {node.url})"
+        return "".join(self._list_lines(node.items, 0))
+
+
+class _HtmlEmitter(_Emitter):
+    BLOCK_TAGS = {
+        "header": "h2",
+        "header-one": "h1",
+        "header-two": "h2",
+        "header-three": "h3",
+        "blockquote": "blockquote",
+    }
+
+    STYLE_TAGS = {
+        0: "strong",  # BOLD
+        2: "em",  # ITALIC
+        4: "u",  # UNDERLINE
+    }
+
+    def __init__(self, converter: "DraftJsConverter"):
+        super().__init__(converter)
+        self._open_tag: Optional[str] = None
+
+    def _apply_styles(self, text: str, styles: Styles) -> str:
+        if not styles:
+            return escape(text)
+        text_length = len(text)
+        ranges = []
+        for style_id, offset, length in styles:
+            tag = self.STYLE_TAGS.get(style_id)
+            end = min(offset + length, text_length)
+            if tag and offset < end:
+                ranges.append((offset, end, tag))
+        # Диапазоны стилей могут пересекаться: текст режется на всех границах,
+        # и на каждой закрываются и заново открываются теги, чтобы они
+        # оставались вложенными
+        ranges.sort(key=lambda r: r[0])
+        points = sorted({0, text_length}.union(*((r[0], r[1]) for r in ranges)))
+        result = []
+        stack: List[str] = []
+        for start, end in zip(points, points[1:]):
+            active: List[str] = []
+            for offset, range_end, tag in ranges:
+                if offset <= start < range_end and tag not in active:
+                    active.append(tag)
+            common = 0
+            while common < min(len(stack), len(active)):
+                if stack[common] != active[common]:
+                    break
+                common += 1
+            result.extend(f"</{tag}>" for tag in reversed(stack[common:]))
+            result.extend(f"<{tag}>" for tag in active[common:])
+            stack = active
+            result.append(escape(text[start:end]))
+        result.extend(f"</{tag}>" for tag in reversed(stack))
+        return "".join(result)
+
+    def _open(self, block_type: str) -> str:
+        if self._open_tag:
+            return ""
+        self._open_tag = self.BLOCK_TAGS.get(block_type, "p")
+        return f"<{self._open_tag}>"
+
+    def _close(self) -> str:
+        if not self._open_tag:
+            return ""
+        tag, self._open_tag = self._open_tag, None
+        return f"</{tag}>\n"
+
+    def _list_html(self, style: str, items: Sequence[ListItemNode]) -> str:
+        tag = "ol" if style == "ordered" else "ul"
+        result = [f"<{tag}>"]
+        for item in items:
+            result.append("<li>")
+            result.extend(
+                self._apply_styles(text, styles) for text, styles in item.parts
+            )
+            if item.children:
+                result.append(self._list_html(style, item.children))
+            result.append("</li>")
+        result.append(f"</{tag}>")
+        return "".join(result)
+
+    def feed(self, node: Node) -> str:
+        if isinstance(node, BlockEndNode):
+            return self._close()
+        if isinstance(node, TextNode):
+            return self._open(node.block_type) + self._apply_styles(
+                node.text, node.styles
+            )
+        if isinstance(node, LinkNode):
+            url = escape(node.url, quote=True)
+            text = self._apply_styles(node.text, node.styles)
+            return f'{self._open("unstyled")}<a href="{url}">{text}</a>'
+        return self._close() + self._list_html(node.style, node.items) + "\n"
+
+    def finish(self) -> str:
+        return self._close()
+
+
+EMITTERS = {
+    TEXT_FORMAT_MARKDOWN: _MarkdownEmitter,
+    TEXT_FORMAT_PLAIN: _PlainTextEmitter,
+    TEXT_FORMAT_HTML: _HtmlEmitter,
+}
+
 
 class DraftJsConverter:
     STYLE_MAP = {
@@ -23,20 +229,21 @@ class DraftJsConverter:
 
     def __init__(self, data: List[Union[BoostyTextDto, BoostyLinkDto, BoostyListDto]]):
         self.data = data
+        self._nodes: Optional[List[Node]] = None
 
-    def _parse_boosty_text(self, content_json: str) -> Tuple[str, str, list]:
-        if content_json == "":
+    def _parse_boosty_text(self, content_json: Optional[str]) -> Tuple[str, str, list]:
+        if not content_json:
             return "", "unstyled", []
         try:
-            data = json.loads(content_json)
+            data = json_backend.loads(content_json)
             text = data[0]
             block_type = data[1]
             styles = data[2] if len(data) > 2 else []
             return text, block_type, styles
-        except (json.JSONDecodeError, IndexError, TypeError):
+        except (*json_backend.DecodeError, IndexError, TypeError):
             return "", "unstyled", []
 
-    def _apply_markdown_styles(self, text: str, styles: list) -> str:
+    def _apply_markdown_styles(self, text: str, styles: Styles) -> str:
         if not styles:
             return text
 
@@ -57,76 +264,77 @@ class DraftJsConverter:
 
         return "".join(result_text)
 
-    def _process_list(self, list_dto: BoostyListDto, level: int = 0) -> List[str]:
-        """Рекурсивно обрабатывает BoostyListDto."""
-        lines = []
-        prefix = "* "
-        indent = "    " * level
-
-        for item in list_dto.items:
-            item_text_parts = []
-            for text_dto in item.get("data", []):
+    def _parse_list_items(self, items: list) -> Tuple[ListItemNode, ...]:
+        """Рекурсивно разбирает элементы списка в промежуточное представление."""
+        result = []
+        for item in items or ():
+            parts = []
+            for text_dto in item.get("data") or ():
                 text, _, styles = self._parse_boosty_text(text_dto.get("content"))
-                item_text_parts.append(self._apply_markdown_styles(text, styles))
+                parts.append((text, tuple(tuple(style) for style in styles)))
+            children = []
+            for sub in item.get("items") or ():
+                if "data" in sub:
+                    children.extend(self._parse_list_items([sub]))
+                else:
+                    children.extend(self._parse_list_items(sub.get("items")))
+            result.append(ListItemNode(parts=tuple(parts), children=tuple(children)))
+        return tuple(result)
 
-            combined_text = "".join(item_text_parts)
-            if combined_text:
-                lines.append(f"{indent}{prefix}{combined_text}")
+    def _parse_node(
+        self, item: Union[BoostyTextDto, BoostyLinkDto, BoostyListDto]
+    ) -> Optional[Node]:
+        if isinstance(item, BoostyLinkDto):
+            text, _, styles = self._parse_boosty_text(item.content)
+            return LinkNode(
+                text=text, styles=tuple(tuple(s) for s in styles), url=item.url
+            )
+        if isinstance(item, BoostyTextDto):
+            if item.modificator == "BLOCK_END":
+                return BLOCK_END
+            text, block_type, styles = self._parse_boosty_text(item.content)
+            return TextNode(
+                text=text,
+                block_type=block_type,
+                styles=tuple(tuple(s) for s in styles),
+            )
+        if isinstance(item, BoostyListDto):
+            return ListNode(style=item.style, items=self._parse_list_items(item.items))
+        return None
 
-            if item.items:
-                for sub_list in item.get("items", []):
-                    lines.extend(self._process_list(sub_list, level + 1))
-            lines.append("\n\n")
-        return lines
+    @property
+    def nodes(self) -> List[Node]:
+        """Блоки поста, разобранные один раз при первом обращении."""
+        if self._nodes is None:
+            self._nodes = []
+            for item in self.data:
+                node = self._parse_node(item)
+                if node is not None:
+                    self._nodes.append(node)
+        return self._nodes
+
+    def iter_render(self, formats: Sequence[str]) -> Iterator[Tuple[str, str]]:
+        """
+        За один проход по блокам выдает куски текста сразу для всех форматов.
+        Возвращает пары (формат, кусок).
+        """
+        emitters = [(fmt, EMITTERS[fmt](self)) for fmt in formats]
+        for node in self.nodes:
+            for fmt, emitter in emitters:
+                if chunk := emitter.feed(node):
+                    yield fmt, chunk
+        for fmt, emitter in emitters:
+            if chunk := emitter.finish():
+                yield fmt, chunk
+
+    def _render(self, fmt: str) -> str:
+        return "".join(chunk for _, chunk in self.iter_render((fmt,)))
 
     def to_markdown(self) -> str:
-        result = []
-        for item in self.data:
-            if isinstance(item, BoostyLinkDto):
-                text, b_type, styles = self._parse_boosty_text(item.content)
-                formatted_text = self._apply_markdown_styles(text, styles)
-                result.append(f"[{formatted_text}]({item.url})")
-
-            elif isinstance(item, BoostyTextDto):
-                if item.modificator == "BLOCK_END":
-                    result.append("\n\n")
-                else:
-                    text, b_type, styles = self._parse_boosty_text(item.content)
-                    formatted_text = self._apply_markdown_styles(text, styles)
-                    prefix = self.BLOCK_TYPES.get(b_type, "")
-                    result.append(f"{prefix}{formatted_text}")
-
-            elif isinstance(item, BoostyListDto):
-                list_lines = self._process_list(item)
-                result.extend(list_lines)
-        return "".join(result)
+        return self._render(TEXT_FORMAT_MARKDOWN)
 
     def to_plain_text(self) -> str:
-        result = []
+        return self._render(TEXT_FORMAT_PLAIN)
 
-        def process_plain_list(list_dto, level=0):
-            lines = []
-            indent = "  " * level
-            for i in list_dto.items:
-                text_parts = [
-                    self._parse_boosty_text(d.get("content"))[0] for d in i.get("data")
-                ]
-                lines.append(f"{indent}- {''.join(text_parts)}")
-                for sub in i.get("items"):
-                    lines.extend(process_plain_list(sub, level + 1))
-                lines.append("\n")
-            return lines
-
-        for item in self.data:
-            if isinstance(item, BoostyLinkDto):
-                text, _, _ = self._parse_boosty_text(item.content)
-                result.append(f"{text} (ссылка: {item.url})")
-            elif isinstance(item, BoostyTextDto):
-                if item.modificator == "BLOCK_END":
-                    result.append("\n")
-                else:
-                    text, _, _ = self._parse_boosty_text(item.content)
-                    result.append(text)
-            elif isinstance(item, BoostyListDto):
-                result.extend(process_plain_list(item))
-        return "".join(result)
+    def to_html(self) -> str:
+        return self._render(TEXT_FORMAT_HTML)
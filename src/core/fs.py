@@ -0,0 +1,152 @@
+import asyncio
+import functools
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, TypeVar
+
+from core.logger import setup_logger
+
+logger = setup_logger()
+
+T = TypeVar("T")
+
+# Метаданные на сетевых дисках и SMB отвечают десятки миллисекунд: такие вызовы
+# идут в отдельный пул, чтобы не ждать в общей очереди asyncio.to_thread
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="fs")
+
+
+async def run(func: Callable[..., T], *args, **kwargs) -> T:
+    """Выполняет блокирующую операцию с файловой системой в пуле fs"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor, functools.partial(func, *args, **kwargs)
+    )
+
+
+async def exists(path: Path) -> bool:
+    return await run(os.path.exists, path)
+
+
+async def is_dir(path: Path) -> bool:
+    return await run(os.path.isdir, path)
+
+
+async def file_size(path: Path) -> Optional[int]:
+    """Размер файла или None, если его нет"""
+    try:
+        return (await run(os.stat, path)).st_size
+    except FileNotFoundError:
+        return None
+
+
+async def makedirs(path: Path) -> None:
+    await run(os.makedirs, path, exist_ok=True)
+
+
+async def list_dirs(path: Path) -> List[str]:
+    """Имена подпапок; пустой список, если папки нет"""
+
+    def _list() -> List[str]:
+        if not os.path.isdir(path):
+            return []
+        with os.scandir(path) as entries:
+            return [entry.name for entry in entries if entry.is_dir()]
+
+    return await run(_list)
+
+
+async def copy_file(source: Path, target: Path) -> int:
+    """Копирует файл и возвращает его размер"""
+
+    def _copy() -> int:
+        shutil.copyfile(source, target)
+        return os.path.getsize(target)
+
+    return await run(_copy)
+
+
+async def replace(source: Path, target: Path) -> None:
+    await run(os.replace, source, target)
+
+
+async def remove(path: Path) -> None:
+    """Удаляет файл, если он есть"""
+    try:
+        await run(os.remove, path)
+    except FileNotFoundError:
+        pass
+
+
+# Файл пишется под временным именем и переименовывается, когда скачан целиком:
+# недокачанный файл не считается готовым, и загрузку можно продолжить
+PART_SUFFIX = ".part"
+
+
+def part_path(path: Path) -> Path:
+    return path.with_name(path.name + PART_SUFFIX)
+
+
+def _scan_files(path: Path) -> Dict[str, int]:
+    with os.scandir(path) as entries:
+        return {
+            entry.name: entry.stat().st_size
+            for entry in entries
+            if entry.is_file(follow_symlinks=False)
+        }
+
+
+class HomeFolderError(OSError):
+    pass
+
+
+class PostDirectory:
+    """
+    Папка поста с закешированным листингом. Проверка папки загрузок, создание
+    папки поста и листинг выполняются одним походом в пул, дальше проверки
+    существования файлов идут из памяти до конца задачи.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.created = False
+        self._files: Dict[str, int] = {}
+
+    @classmethod
+    async def open(cls, downloads_folder: Path, path: Path) -> "PostDirectory":
+        """
+        Создает папку загрузок (если ее нет) и папку поста.
+        Ошибка создания папки загрузок пробрасывается как HomeFolderError.
+        """
+        directory = cls(path)
+        await run(directory._prepare, downloads_folder)
+        return directory
+
+    def _prepare(self, downloads_folder: Path) -> None:
+        if not os.path.isdir(downloads_folder):
+            logger.error(
+                f"Home directory does not exist: {downloads_folder}, creating..."
+            )
+            try:
+                os.makedirs(downloads_folder, exist_ok=True)
+            except OSError as e:
+                raise HomeFolderError(str(e)) from e
+        if os.path.isdir(self.path):
+            self._files = _scan_files(self.path)
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            self.created = True
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._files
+
+    def size(self, name: str) -> Optional[int]:
+        return self._files.get(name)
+
+    def add(self, name: str, size: int) -> None:
+        """Отмечает файл, записанный задачей"""
+        self._files[name] = size
+
+    def discard(self, name: str) -> None:
+        self._files.pop(name, None)
@@ -0,0 +1,275 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from aiohttp import ClientConnectionError, ClientPayloadError, ClientResponseError
+
+from core.logger import setup_logger
+from core.metrics import registry
+
+logger = setup_logger()
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half-open"
+_STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+# Запросы к API и за файлами ограничиваются раздельно, даже на одном хосте
+KIND_API = "api"
+KIND_MEDIA = "media"
+# Прогревочные запросы не должны открывать автомат загрузок файлов
+KIND_WARMUP = "warmup"
+
+HOST_REQUESTS_ACTIVE = registry.gauge(
+    "boosty_host_requests_active", "Requests in flight by host", ("host", "kind")
+)
+HOST_BREAKER_STATE = registry.gauge(
+    "boosty_host_breaker_state",
+    "Circuit breaker state by host: 0 closed, 1 half-open, 2 open",
+    ("host", "kind"),
+)
+HOST_BREAKER_OPENED = registry.counter(
+    "boosty_host_breaker_opened_total",
+    "Times a host circuit breaker opened",
+    ("host", "kind"),
+)
+HOST_REQUESTS_DEFERRED = registry.counter(
+    "boosty_host_requests_deferred_total",
+    "Requests refused because the host circuit breaker was open",
+    ("host", "kind"),
+)
+
+
+class HostUnavailableError(Exception):
+    """Хост временно отключен автоматом: запрос нужно отложить, а не провалить"""
+
+    def __init__(self, host: str, kind: str, retry_in: float):
+        super().__init__(f"{host} ({kind}) is unavailable, retry in {retry_in:.0f} s")
+        self.host = host
+        self.kind = kind
+        self.retry_in = retry_in
+
+
+def is_host_failure(error: BaseException) -> bool:
+    """Ошибка говорит о проблеме хоста, а не конкретного запроса"""
+    if isinstance(error, ClientResponseError):
+        return error.status >= 500 or error.status == 429
+    return isinstance(
+        error, (ClientConnectionError, ClientPayloadError, asyncio.TimeoutError)
+    )
+
+
+@dataclass
+class HostStatus:
+    host: str
+    kind: str
+    limit: int
+    active: int
+    waiting: int
+    state: str
+    failures: int
+    retry_in: Optional[float]  # секунд до пробного запроса, если автомат открыт
+
+
+class HostState:
+    """
+    Лимит одновременных запросов и автомат одного хоста. После threshold
+    ошибок подряд автомат открывается: запросы к хосту сразу получают
+    HostUnavailableError. Через cooldown секунд автомат полуоткрыт и
+    пропускает один пробный запрос: успех закрывает его, ошибка открывает
+    снова.
+    """
+
+    def __init__(
+        self, host: str, kind: str, limit: int, threshold: int, cooldown: float
+    ):
+        self.host = host
+        self.kind = kind
+        self.limit = limit
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self._changed = asyncio.Event()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return STATE_CLOSED
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return STATE_OPEN
+        return STATE_HALF_OPEN
+
+    @property
+    def retry_in(self) -> Optional[float]:
+        if self.opened_at is None:
+            return None
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    async def admit(self) -> bool:
+        """
+        Пропускает запрос или бросает HostUnavailableError, если автомат
+        открыт. В полуоткрытом состоянии первый запрос становится пробным
+        (возвращается True), остальные ждут его исхода.
+        """
+        while True:
+            state = self.state
+            if state == STATE_CLOSED:
+                return False
+            if state == STATE_OPEN:
+                HOST_REQUESTS_DEFERRED.inc(1, self.host, self.kind)
+                raise HostUnavailableError(self.host, self.kind, self.retry_in or 0)
+            if not self.probing:
+                self.probing = True
+                HOST_BREAKER_STATE.set(
+                    _STATE_VALUES[STATE_HALF_OPEN], self.host, self.kind
+                )
+                return True
+            await self._changed.wait()
+
+    def succeeded(self, probe: bool) -> None:
+        self.failures = 0
+        if probe or self.opened_at is not None:
+            if self.opened_at is not None:
+                logger.info(f"Host {self.host} ({self.kind}) is available again")
+            self.opened_at = None
+            self._notify()
+        if probe:
+            self.probing = False
+
+    def failed(self, probe: bool) -> None:
+        self.failures += 1
+        if probe:
+            self.probing = False
+        if probe or (self.opened_at is None and self.failures >= self.threshold):
+            logger.warning(
+                f"Host {self.host} ({self.kind}) failed {self.failures} times in a row, "
+                f"deferring its requests for {self.cooldown:.0f} s"
+            )
+            self.opened_at = time.monotonic()
+            HOST_BREAKER_OPENED.inc(1, self.host, self.kind)
+            self._notify()
+
+    def released(self, probe: bool) -> None:
+        """Пробный запрос завершился без результата (например, отменен)"""
+        if probe:
+            self.probing = False
+            self._notify()
+
+    def _notify(self) -> None:
+        HOST_BREAKER_STATE.set(_STATE_VALUES[self.state], self.host, self.kind)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_ready(self) -> None:
+        """Ждет, пока хост снова начнет принимать запросы (хотя бы пробный)"""
+        while self.state == STATE_OPEN:
+            try:
+                await asyncio.wait_for(self._changed.wait(), self.retry_in)
+            except asyncio.TimeoutError:
+                pass
+
+
+class HostGate:
+    """
+    Лимиты и автоматы запросов по хостам. Запросы к API ограничены
+    api_limit на хост, за файлами и прогревочные - host_limit на хост, и у
+    каждого вида свой автомат. Состояние привязано к event loop, в котором сделан первый
+    запрос. Используется только из event loop.
+    """
+
+    def __init__(
+        self,
+        api_limit: int = 4,
+        host_limit: int = 8,
+        failure_threshold: int = 5,
+        cooldown: float = 30,
+    ):
+        self.api_limit = api_limit
+        self.host_limit = host_limit
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._hosts: Dict[Tuple[str, str], HostState] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _host(self, host: str, kind: str) -> HostState:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._hosts.clear()
+        state = self._hosts.get((host, kind))
+        if state is None:
+            limit = self.api_limit if kind == KIND_API else self.host_limit
+            state = self._hosts[(host, kind)] = HostState(
+                host, kind, limit, self.failure_threshold, self.cooldown
+            )
+        return state
+
+    @asynccontextmanager
+    async def request(self, url: str, kind: str = KIND_MEDIA) -> AsyncIterator[None]:
+        """
+        Слот запроса к хосту url на время запроса и чтения ответа. Исход
+        запроса (исключение внутри блока) учитывается автоматом хоста.
+        """
+        state = self._host(urlsplit(url).hostname or "", kind)
+        probe = await state.admit()
+        state.waiting += 1
+        try:
+            await state.semaphore.acquire()
+        except BaseException:
+            state.released(probe)
+            raise
+        finally:
+            state.waiting -= 1
+        state.active += 1
+        HOST_REQUESTS_ACTIVE.inc(1, state.host, state.kind)
+        try:
+            yield
+        except BaseException as e:
+            if is_host_failure(e):
+                state.failed(probe)
+                if state.state == STATE_OPEN:
+                    # Запросы, упавшие уже при открытом автомате, откладываются
+                    raise HostUnavailableError(
+                        state.host, state.kind, state.retry_in or 0
+                    ) from e
+            elif isinstance(e, (ClientResponseError, ValueError)):
+                state.succeeded(probe)  # хост ответил
+            else:
+                state.released(probe)
+            raise
+        else:
+            state.succeeded(probe)
+        finally:
+            state.active -= 1
+            HOST_REQUESTS_ACTIVE.dec(1, state.host, state.kind)
+            state.semaphore.release()
+
+    async def wait_ready(self, error: HostUnavailableError) -> None:
+        """Ждет, пока хост, отказавший с error, снова начнет принимать запросы"""
+        await self._host(error.host, error.kind).wait_ready()
+
+    def status(self) -> List[HostStatus]:
+        return [
+            HostStatus(
+                host=state.host,
+                kind=state.kind,
+                limit=state.limit,
+                active=state.active,
+                waiting=state.waiting,
+                state=state.state,
+                failures=state.failures,
+                retry_in=state.retry_in,
+            )
+            for _, state in sorted(self._hosts.items())
+        ]
+
+
+host_gate = HostGate()
@@ -0,0 +1,156 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set
+from urllib.parse import urlsplit
+
+from aiohttp import TCPConnector, TraceConfig
+
+from core.host_gate import KIND_WARMUP, host_gate
+from core.logger import setup_logger
+from core.metrics import HTTP_CONNECT_TIME, HTTP_CONNECTIONS, registry
+
+if TYPE_CHECKING:
+    from core.boosty.client import BoostyClient
+
+logger = setup_logger()
+
+WARMUP_REQUESTS = registry.counter(
+    "boosty_http_warmup_requests_total",
+    "Requests sent to open connections before downloads need them",
+    ("host",),
+)
+
+
+@dataclass
+class HostConnectionStats:
+    host: str
+    opened: int
+    reused: int
+    handshake: Optional[float]  # среднее время открытия соединения, секунды
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class ConnectionPool:
+    """
+    Общий для всех клиентов пул соединений. Раньше каждый запрос открывал
+    свою сессию и заново проходил DNS, TCP и TLS; теперь соединения остаются
+    открытыми keepalive_timeout секунд и переиспользуются, а адреса хостов
+    кешируются на dns_ttl секунд. Коннектор создается на event loop, в
+    котором его запросили первым.
+    """
+
+    def __init__(
+        self,
+        dns_ttl: int = 300,
+        keepalive_timeout: float = 30,
+        warm_connections: int = 2,
+    ):
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.warm_connections = warm_connections
+        self._connector: Optional[TCPConnector] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_used: Dict[str, float] = {}  # origin -> конец последнего запроса
+        self._warming: Set[asyncio.Task] = set()
+        self._trace_config = TraceConfig()
+        self._trace_config.on_request_end.append(self._on_request_end)
+
+    def connector(self) -> TCPConnector:
+        loop = asyncio.get_running_loop()
+        if self._connector is None or self._connector.closed or self._loop is not loop:
+            self._loop = loop
+            self._last_used.clear()
+            self._connector = TCPConnector(
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+        return self._connector
+
+    def trace_config(self) -> TraceConfig:
+        """Отмечает, к каким хостам в пуле есть недавно использованные соединения"""
+        return self._trace_config
+
+    async def _on_request_end(self, session, context: SimpleNamespace, params):
+        self._last_used[_origin(str(params.url))] = time.monotonic()
+
+    def is_warm(self, origin: str) -> bool:
+        used = self._last_used.get(origin)
+        # С запасом: сервер может закрыть простаивающее соединение раньше нас
+        return used is not None and time.monotonic() - used < self.keepalive_timeout / 2
+
+    def warm_up(self, client: "BoostyClient", urls: Iterable[str]) -> None:
+        """
+        В фоне открывает до warm_connections соединений к каждому хосту из
+        urls, к которому в пуле нет живых соединений: HEAD-запросы к самим
+        файлам, которые будут скачаны
+        """
+        by_origin: Dict[str, List[str]] = {}
+        for url in urls:
+            origin = _origin(url)
+            if self.is_warm(origin):
+                continue
+            targets = by_origin.setdefault(origin, [])
+            if len(targets) < self.warm_connections:
+                targets.append(url)
+        for origin, targets in by_origin.items():
+            # Пока прогрев идет, хост не прогреваем повторно
+            self._last_used[origin] = time.monotonic()
+            task = asyncio.create_task(self._warm(client, origin, targets))
+            self._warming.add(task)
+            task.add_done_callback(self._warming.discard)
+
+    async def _warm(self, client: "BoostyClient", origin: str, urls: List[str]):
+        host = urlsplit(origin).hostname or ""
+        async with client.get_client_session() as session:
+
+            async def head(url: str) -> None:
+                WARMUP_REQUESTS.inc(1, host)
+                try:
+                    async with host_gate.request(url, KIND_WARMUP):
+                        async with session.head(url) as response:
+                            logger.debug(f"Warmed up {origin}: {response.status}")
+                            response.raise_for_status()
+                except Exception as e:
+                    logger.debug(f"Failed warm up connection to {origin}: {e!r}")
+
+            # Одновременные запросы занимают разные соединения
+            await asyncio.gather(*(head(url) for url in urls))
+
+    @staticmethod
+    def host_stats() -> List[HostConnectionStats]:
+        """Соединения по хостам с начала работы, по метрикам запросов"""
+        counts: Dict[str, Dict[str, float]] = {}
+        for key, value in HTTP_CONNECTIONS.snapshot().items():
+            host, _, kind = key.rpartition(",")
+            counts.setdefault(host, {})[kind] = value
+        handshakes = HTTP_CONNECT_TIME.snapshot()
+        stats = []
+        for host, kinds in sorted(counts.items()):
+            handshake = handshakes.get(host)
+            stats.append(
+                HostConnectionStats(
+                    host=host,
+                    opened=int(kinds.get("new", 0)),
+                    reused=int(kinds.get("reused", 0)),
+                    handshake=(
+                        handshake["sum"] / handshake["count"] if handshake else None
+                    ),
+                )
+            )
+        return stats
+
+    async def close(self) -> None:
+        for task in list(self._warming):
+            task.cancel()
+        if self._connector is not None:
+            await self._connector.close()
+            self._connector = None
+
+
+http_pool = ConnectionPool()
@@ -0,0 +1,48 @@
+import json
+from typing import Any, Callable, Dict, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+_BACKENDS: Dict[str, Tuple[Callable[[Union[bytes, str]], Any], Callable]] = {
+    "json": (json.loads, _stdlib_dumps),
+}
+DecodeError: Tuple[type, ...] = (ValueError,)
+
+if msgspec is not None:
+    _msgspec_decoder = msgspec.json.Decoder()
+    _msgspec_encoder = msgspec.json.Encoder()
+    _BACKENDS["msgspec"] = (_msgspec_decoder.decode, _msgspec_encoder.encode)
+    DecodeError += (msgspec.DecodeError,)
+
+if orjson is not None:
+    _BACKENDS["orjson"] = (orjson.loads, orjson.dumps)
+
+# Быстрейший доступный бэкенд: orjson, затем msgspec, затем стандартный json
+backend = next(name for name in ("orjson", "msgspec", "json") if name in _BACKENDS)
+loads, dumps = _BACKENDS[backend]
+
+
+def available_backends() -> Tuple[str, ...]:
+    return tuple(_BACKENDS.keys())
+
+
+def set_backend(name: str) -> None:
+    """Переключает бэкенд (например, на стандартный json для сравнения)"""
+    global backend, loads, dumps
+    if name not in _BACKENDS:
+        raise ValueError(f"JSON backend {name!r} is not available")
+    backend = name
+    loads, dumps = _BACKENDS[name]
@@ -1,17 +1,143 @@
+import atexit
 import logging
+import multiprocessing
+import os
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Dict, Optional, Tuple
 
+LOGGER_NAME = "boosty_downloader_logger"
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+LOG_FILE = "runtime.log"
 
-def setup_logger(log_file="runtime.log"):
-    logger = logging.getLogger("boosty_downloader_logger")
+_listener: Optional[QueueListener] = None
+
+
+class VerbosityFilter(logging.Filter):
+    """Общий уровень логирования и переопределения для отдельных модулей (по имени файла)"""
+
+    def __init__(self, level: int = logging.DEBUG):
+        super().__init__()
+        self.level = level
+        self.module_levels: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= self.module_levels.get(record.filename, self.level)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Ограничивает частые отладочные сообщения: с каждой строки кода проходит
+    не больше burst сообщений DEBUG сразу и rate в секунду дальше. Сообщения
+    INFO и выше не ограничиваются. Число отброшенных сохраняется в поле
+    suppressed следующего пропущенного сообщения, текст записи не меняется.
+    """
+
+    def __init__(self, rate: float = 20, burst: int = 50):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[Tuple[str, int], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            # [токены, время последнего пополнения, отброшено]
+            bucket = self._buckets[key] = [self.burst, now, 0]
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            bucket[2] += 1
+            return False
+        bucket[0] = tokens - 1
+        if bucket[2]:
+            record.suppressed = bucket[2]
+            bucket[2] = 0
+        return True
+
+
+class LogFormatter(logging.Formatter):
+    """Дописывает к сообщению, сколько похожих отбросил RateLimitFilter"""
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        message = super().formatMessage(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            message += f" ({suppressed} similar messages suppressed)"
+        return message
+
+
+verbosity_filter = VerbosityFilter()
+rate_limit_filter = RateLimitFilter()
+
+
+def _parse_level(level) -> int:
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return value
+
+
+def _sync_logger_level() -> None:
+    # Уровень самого логгера - минимальный из заданных, чтобы отброшенные
+    # сообщения не создавали LogRecord
+    levels = [verbosity_filter.level, *verbosity_filter.module_levels.values()]
+    logging.getLogger(LOGGER_NAME).setLevel(min(levels))
+
+
+def set_log_level(level) -> None:
+    verbosity_filter.level = _parse_level(level)
+    _sync_logger_level()
+
+
+def set_module_log_level(module: str, level: Optional[str]) -> None:
+    """Уровень для модуля по имени файла (task.py); None - сбросить"""
+    if level is None:
+        verbosity_filter.module_levels.pop(module, None)
+    else:
+        verbosity_filter.module_levels[module] = _parse_level(level)
+    _sync_logger_level()
+
+
+def configure_module_levels(spec: str) -> None:
+    """Строка вида "task.py=INFO,client.py=DEBUG" """
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        module, _, level = item.partition("=")
+        set_module_log_level(module.strip(), level.strip())
+
+
+def get_logs_folder() -> Path:
+    return Path(LOG_FILE).resolve().parent
+
+
+def stop_logging() -> None:
+    """Дописывает очередь и останавливает поток записи логов"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def setup_logger(log_file=LOG_FILE):
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
 
     if logger.handlers:
         return logger
 
     logger.setLevel(logging.DEBUG)
 
-    formatter = logging.Formatter(
+    formatter = LogFormatter(
         fmt="[%(levelname)s] %(asctime)s %(filename)s %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
     )
@@ -19,25 +145,45 @@ def setup_logger(log_file="runtime.log"):
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.DEBUG)
     console_handler.setFormatter(formatter)
+    handlers = [console_handler]
 
-    try:
-        file_handler = RotatingFileHandler(
-            log_file,
-            maxBytes=50 * 1024 * 1024,
-            backupCount=1,
-            mode="w",
-            encoding="utf-8",
-        )
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-    except Exception as e:
-        print(f"Can't create log file: {e}")
-
-    logger.addHandler(console_handler)
+    # Дочерние процессы (например, пул перерендера) не должны пересоздавать лог
+    if multiprocessing.parent_process() is None:
+        try:
+            file_handler = RotatingFileHandler(
+                log_file,
+                maxBytes=50 * 1024 * 1024,
+                backupCount=1,
+                mode="w",
+                encoding="utf-8",
+            )
+            file_handler.setLevel(logging.DEBUG)
+            file_handler.setFormatter(formatter)
+            handlers.insert(0, file_handler)
+        except Exception as e:
+            print(f"Can't create log file: {e}")
+
+    # Запись в файл и консоль идет в отдельном потоке, event loop только кладет
+    # записи в очередь
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(verbosity_filter)
+    queue_handler.addFilter(rate_limit_filter)
+    logger.addHandler(queue_handler)
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
 
     logger.propagate = False
 
+    try:
+        if level := os.environ.get("BOOSTY_LOG_LEVEL"):
+            set_log_level(level)
+        if module_levels := os.environ.get("BOOSTY_LOG_MODULES"):
+            configure_module_levels(module_levels)
+    except ValueError as e:
+        logger.warning(f"Ignoring log level from environment: {e}")
+
     logger.info(f"Logger created: {log_file}")
 
     return logger
@@ -0,0 +1,239 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+from core.logger import setup_logger
+from core.metrics import registry
+
+logger = setup_logger()
+
+SOURCE_ROOT = Path(__file__).resolve().parents[1]
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STACK_DEPTH = 20
+
+LOOP_LAG = registry.histogram(
+    "boosty_event_loop_lag_seconds",
+    "Delay between a scheduled heartbeat and its execution",
+    buckets=LAG_BUCKETS,
+)
+LOOP_LAG_LAST = registry.gauge(
+    "boosty_event_loop_lag_last_seconds", "Last measured event loop lag"
+)
+LOOP_BLOCKED = registry.counter(
+    "boosty_event_loop_blocked_total",
+    "Event loop blocks longer than the threshold by call site",
+    ("site",),
+)
+LOOP_BLOCKED_TIME = registry.counter(
+    "boosty_event_loop_blocked_seconds_total",
+    "Time the event loop spent blocked by call site",
+    ("site",),
+)
+
+Stack = Tuple[str, ...]
+
+
+class BlockingSite:
+    """Место в коде, на котором event loop блокировался, с последним стеком"""
+
+    __slots__ = ("site", "stack", "count", "total_time", "max_time", "last_seen")
+
+    def __init__(self, site: str, stack: Stack):
+        self.site = site
+        self.stack = stack
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_seen = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "site": self.site,
+            "count": self.count,
+            "total_time": round(self.total_time, 4),
+            "max_time": round(self.max_time, 4),
+            "last_seen": self.last_seen,
+            "stack": list(self.stack),
+        }
+
+
+class _Episode:
+    __slots__ = ("beat", "samples")
+
+    def __init__(self, beat: float):
+        self.beat = beat
+        self.samples: Dict[Stack, int] = {}
+
+
+def _format_stack(frame) -> Stack:
+    summary = traceback.extract_stack(frame, limit=STACK_DEPTH)
+    return tuple(f"{item.filename}:{item.lineno} {item.name}" for item in summary)
+
+
+def _culprit(stack: Stack) -> str:
+    """Ближайший к месту блокировки кадр из кода приложения"""
+    for line in reversed(stack):
+        path, _, rest = line.partition(":")
+        try:
+            relative = Path(path).resolve().relative_to(SOURCE_ROOT)
+        except ValueError:
+            continue
+        return f"{relative.as_posix()}:{rest}"
+    return stack[-1] if stack else "unknown"
+
+
+class LoopMonitor:
+    """
+    Измеряет задержку event loop задачей-пульсом и следит за ним из
+    отдельного потока: если пульс не приходит дольше threshold, снимает
+    стек потока event loop. Самый частый стек блокировки засчитывается
+    ближайшему к нему кадру из кода приложения.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.1,
+        threshold: float = 0.1,
+        sample_interval: float = 0.02,
+        history: int = 600,
+        recent: int = 50,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.sample_interval = sample_interval
+        self.sites: Dict[str, BlockingSite] = {}
+        self.recent: Deque[dict] = deque(maxlen=recent)
+        self._lags: Deque[Tuple[float, float]] = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._heartbeat is not None
+
+    def start(self) -> None:
+        """Запускает мониторинг текущего event loop; вызывается из него же"""
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._watchdog.start()
+        logger.info(
+            f"Event loop monitor started, blocking threshold {self.threshold * 1000:.0f} ms"
+        )
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self._heartbeat.cancel()
+        self._heartbeat = None
+        self._stopped.set()
+        self._watchdog.join(timeout=1)
+        self._watchdog = None
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._beat = now
+            LOOP_LAG.observe(lag)
+            LOOP_LAG_LAST.set(lag)
+            with self._lock:
+                self._lags.append((now, lag))
+
+    def _watch(self) -> None:
+        episode: Optional[_Episode] = None
+        while not self._stopped.wait(self.sample_interval):
+            beat = self._beat
+            if episode is not None and beat != episode.beat:
+                self._finish(episode, beat)
+                episode = None
+            if time.monotonic() - beat < self.interval + self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            if episode is None:
+                episode = _Episode(beat)
+            stack = _format_stack(frame)
+            episode.samples[stack] = episode.samples.get(stack, 0) + 1
+            del frame
+
+    def _finish(self, episode: _Episode, beat: float) -> None:
+        duration = max(0.0, beat - episode.beat - self.interval)
+        stack = max(episode.samples, key=episode.samples.get)
+        now = time.time()
+        culprit = _culprit(stack)
+        with self._lock:
+            site = self.sites.get(culprit)
+            if site is None:
+                site = self.sites[culprit] = BlockingSite(culprit, stack)
+            site.stack = stack
+            site.count += 1
+            site.total_time += duration
+            site.max_time = max(site.max_time, duration)
+            site.last_seen = now
+            self.recent.append({"time": now, "duration": duration, "site": site.site})
+        LOOP_BLOCKED.inc(1, site.site)
+        LOOP_BLOCKED_TIME.inc(duration, site.site)
+        logger.warning(
+            f"Event loop blocked for {duration * 1000:.0f} ms at {site.site}"
+        )
+
+    def lag_stats(self, window: float = 60) -> dict:
+        """Задержка за последние window секунд: текущая, p50, p99 и максимум"""
+        since = time.monotonic() - window
+        with self._lock:
+            lags = sorted(lag for moment, lag in self._lags if moment >= since)
+            current = self._lags[-1][1] if self._lags else 0.0
+        if not lags:
+            return {"current": current, "p50": 0.0, "p99": 0.0, "max": 0.0}
+        return {
+            "current": current,
+            "p50": lags[len(lags) // 2],
+            "p99": lags[min(len(lags) - 1, int(len(lags) * 0.99))],
+            "max": lags[-1],
+        }
+
+    def top_sites(self, limit: int = 10) -> List[BlockingSite]:
+        with self._lock:
+            sites = sorted(
+                self.sites.values(), key=lambda s: s.total_time, reverse=True
+            )
+        return sites[:limit]
+
+    def recent_blocks(self) -> List[dict]:
+        with self._lock:
+            return list(self.recent)
+
+    def snapshot(self) -> dict:
+        return {
+            "lag": self.lag_stats(),
+            "threshold": self.threshold,
+            "sites": [site.to_dict() for site in self.top_sites()],
+            "recent": self.recent_blocks(),
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.sites.clear()
+            self.recent.clear()
+
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,394 @@
+import asyncio
+import bisect
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import TraceConfig, web
+
+from core.logger import setup_logger
+from core.tracing import span
+
+if TYPE_CHECKING:
+    from core.scheduler import TaskSlot
+
+logger = setup_logger()
+
+METRICS_SNAPSHOT_FILE = "metrics.json"
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def _label_str(self, values: LabelValues, extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+    def snapshot(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        values = self._values or ({(): 0} if not self.labels else {})
+        return [f"{self.name}{self._label_str(k)} {v}" for k, v in values.items()]
+
+    def snapshot(self):
+        if not self.labels:
+            return self._values.get((), 0)
+        return {",".join(k): v for k, v in self._values.items()}
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, *labels: str) -> None:
+        self.inc(-amount, *labels)
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+
+class _HistogramState:
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self, size: int):
+        self.buckets = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.bounds = tuple(sorted(buckets))
+        self._states: Dict[LabelValues, _HistogramState] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        state = self._states.get(labels)
+        if state is None:
+            state = self._states[labels] = _HistogramState(len(self.bounds))
+        index = bisect.bisect_left(self.bounds, value)
+        if index < len(self.bounds):
+            state.buckets[index] += 1
+        state.sum += value
+        state.count += 1
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, state in self._states.items():
+            cumulative = 0
+            for bound, count in zip(self.bounds, state.buckets):
+                cumulative += count
+                le = self._label_str(labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = self._label_str(labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {state.count}")
+            lines.append(f"{self.name}_sum{self._label_str(labels)} {state.sum}")
+            lines.append(f"{self.name}_count{self._label_str(labels)} {state.count}")
+        return lines
+
+    def snapshot(self):
+        return {
+            ",".join(labels): {
+                "count": state.count,
+                "sum": state.sum,
+                "buckets": dict(zip(map(str, self.bounds), state.buckets)),
+            }
+            for labels, state in self._states.items()
+        }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса, общий для UI и консольного режима"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels=()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(
+        self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {
+            "time": time.time(),
+            "metrics": {
+                name: metric.snapshot() for name, metric in self._metrics.items()
+            },
+        }
+
+
+registry = MetricsRegistry()
+
+DOWNLOADED_BYTES = registry.counter(
+    "boosty_downloaded_bytes_total", "Bytes of media written to disk"
+)
+DOWNLOADED_FILES = registry.counter(
+    "boosty_downloaded_files_total", "Media files downloaded"
+)
+TASKS_FINISHED = registry.counter(
+    "boosty_tasks_finished_total", "Finished tasks by result", ("result",)
+)
+TASK_RETRIES = registry.counter("boosty_task_retries_total", "Task retries")
+SIGNATURE_REFRESHES = registry.counter(
+    "boosty_signature_refreshes_total",
+    "Signed media URLs re-signed after the signature expired",
+)
+RESUMED_DOWNLOADS = registry.counter(
+    "boosty_resumed_downloads_total", "File downloads continued from a partial file"
+)
+HTTP_RESPONSES = registry.counter(
+    "boosty_http_responses_total",
+    "HTTP responses by host and status",
+    ("host", "status"),
+)
+HTTP_TTFB = registry.histogram(
+    "boosty_http_ttfb_seconds", "Time to response headers", ("host",)
+)
+HTTP_CONNECTIONS = registry.counter(
+    "boosty_http_connections_total",
+    "Connections used by requests: opened or taken from the pool",
+    ("host", "kind"),
+)
+HTTP_CONNECT_TIME = registry.histogram(
+    "boosty_http_connect_seconds",
+    "Time to open a connection, including DNS, TCP and TLS handshakes",
+    ("host",),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+HTTP_DNS_TIME = registry.histogram(
+    "boosty_http_dns_seconds",
+    "Time to resolve a host name (cache misses)",
+    ("host",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+HTTP_DNS_CACHE = registry.counter(
+    "boosty_http_dns_cache_total", "DNS cache lookups by result", ("host", "result")
+)
+FILE_TRANSFER_TIME = registry.histogram(
+    "boosty_file_transfer_seconds", "Time to download one media file"
+)
+METADATA_SLOT_WAIT = registry.histogram(
+    "boosty_metadata_slot_wait_seconds",
+    "Time a task waited for a metadata stage slot",
+)
+METADATA_QUEUE_DEPTH = registry.gauge(
+    "boosty_metadata_tasks_queued", "Tasks waiting for a metadata stage slot"
+)
+METADATA_TASKS_RUNNING = registry.gauge(
+    "boosty_metadata_tasks_running", "Tasks holding a metadata stage slot"
+)
+
+
+@asynccontextmanager
+async def tracked_slot(slot: "TaskSlot"):
+    """Захватывает слот стадии метаданных, учитывая очередь и время ожидания"""
+    started = time.monotonic()
+    METADATA_QUEUE_DEPTH.inc()
+    try:
+        with span("queue_wait"):
+            await slot.acquire()
+    finally:
+        METADATA_QUEUE_DEPTH.dec()
+    METADATA_SLOT_WAIT.observe(time.monotonic() - started)
+    METADATA_TASKS_RUNNING.inc()
+    try:
+        yield
+    finally:
+        METADATA_TASKS_RUNNING.dec()
+        slot.release()
+
+
+async def _on_request_start(session, context: SimpleNamespace, params) -> None:
+    context.started = time.monotonic()
+    # Хуки соединения и DNS не получают URL: берем хост запроса
+    context.host = params.url.host or ""
+
+
+async def _on_request_end(session, context: SimpleNamespace, params) -> None:
+    host = params.url.host or ""
+    HTTP_RESPONSES.inc(1, host, str(params.response.status))
+    HTTP_TTFB.observe(time.monotonic() - context.started, host)
+
+
+async def _on_request_exception(session, context: SimpleNamespace, params) -> None:
+    HTTP_RESPONSES.inc(1, params.url.host or "", "error")
+
+
+async def _on_connection_create_start(
+    session, context: SimpleNamespace, params
+) -> None:
+    context.connect_started = time.monotonic()
+
+
+async def _on_connection_create_end(session, context: SimpleNamespace, params) -> None:
+    HTTP_CONNECTIONS.inc(1, context.host, "new")
+    HTTP_CONNECT_TIME.observe(time.monotonic() - context.connect_started, context.host)
+
+
+async def _on_connection_reuseconn(session, context: SimpleNamespace, params) -> None:
+    HTTP_CONNECTIONS.inc(1, context.host, "reused")
+
+
+async def _on_dns_resolvehost_start(session, context: SimpleNamespace, params) -> None:
+    context.dns_started = time.monotonic()
+
+
+async def _on_dns_resolvehost_end(session, context: SimpleNamespace, params) -> None:
+    HTTP_DNS_TIME.observe(time.monotonic() - context.dns_started, context.host)
+
+
+async def _on_dns_cache_hit(session, context: SimpleNamespace, params) -> None:
+    HTTP_DNS_CACHE.inc(1, context.host, "hit")
+
+
+async def _on_dns_cache_miss(session, context: SimpleNamespace, params) -> None:
+    HTTP_DNS_CACHE.inc(1, context.host, "miss")
+
+
+def http_trace_config() -> TraceConfig:
+    trace_config = TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_request_end.append(_on_request_end)
+    trace_config.on_request_exception.append(_on_request_exception)
+    trace_config.on_connection_create_start.append(_on_connection_create_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace_config.on_dns_resolvehost_start.append(_on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(_on_dns_resolvehost_end)
+    trace_config.on_dns_cache_hit.append(_on_dns_cache_hit)
+    trace_config.on_dns_cache_miss.append(_on_dns_cache_miss)
+    return trace_config
+
+
+class MetricsExporter:
+    """
+    Отдает реестр в формате Prometheus на локальном порту
+    и/или периодически сохраняет JSON-снимок в файл
+    """
+
+    def __init__(
+        self,
+        metrics: MetricsRegistry = registry,
+        port: Optional[int] = None,
+        snapshot_path: Optional[Path] = None,
+        interval: float = 15,
+        host: str = "127.0.0.1",
+    ):
+        self.metrics = metrics
+        self.port = port
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self.host = host
+        self._runner: Optional[web.AppRunner] = None
+        self._snapshot_task: Optional[asyncio.Task] = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=self.metrics.render_prometheus().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def handle_snapshot(self, request: web.Request) -> web.Response:
+        return web.json_response(self.metrics.snapshot())
+
+    async def start(self) -> None:
+        if self.port:
+            app = web.Application()
+            app.router.add_get("/metrics", self.handle_metrics)
+            app.router.add_get("/metrics.json", self.handle_snapshot)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, self.host, self.port).start()
+            logger.info(f"Metrics available at http://{self.host}:{self.port}/metrics")
+        if self.snapshot_path:
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+            logger.info(f"Writing metrics snapshots to {self.snapshot_path}")
+
+    def write_snapshot(self) -> None:
+        tmp_path = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(self.metrics.snapshot()), encoding="utf-8")
+        os.replace(tmp_path, self.snapshot_path)
+
+    async def _snapshot_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.write_snapshot)
+            except Exception as e:
+                logger.error("Failed write metrics snapshot", exc_info=e)
+
+    async def stop(self) -> None:
+        if self._snapshot_task:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+            try:
+                await asyncio.to_thread(self.write_snapshot)
+            except Exception as e:
+                logger.error("Failed write metrics snapshot", exc_info=e)
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
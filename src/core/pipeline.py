@@ -0,0 +1,42 @@
+import asyncio
+from dataclasses import dataclass
+
+from core.scheduler import SlotScheduler
+from core.work_queue import FileWorkQueue
+
+
+@dataclass
+class DownloadPipeline:
+    """
+    Стадии загрузки поста, у каждой своя параллельность:
+    metadata - запрос поста, папка и пробы размеров,
+    render - запись текста и архива поста,
+    transfer - общая очередь файлов, воркеры которой только передают байты.
+    Политика очереди загрузок действует на metadata и transfer: она решает,
+    какой пост получит слот подготовки и чей файл передается следующим.
+    """
+
+    metadata: SlotScheduler
+    render: asyncio.Semaphore
+    transfer: FileWorkQueue
+
+    @classmethod
+    def create(
+        cls,
+        transfer_workers: int = 5,
+        metadata_concurrency: int = 4,
+        render_concurrency: int = 2,
+        scheduling_policy: str = "fifo",
+    ) -> "DownloadPipeline":
+        return cls(
+            metadata=SlotScheduler(metadata_concurrency, scheduling_policy),
+            render=asyncio.Semaphore(render_concurrency),
+            transfer=FileWorkQueue(workers=transfer_workers, policy=scheduling_policy),
+        )
+
+    def set_policy(self, name: str) -> None:
+        self.metadata.set_policy(name)
+        self.transfer.set_policy(name)
+
+    def stop(self) -> None:
+        self.transfer.stop()
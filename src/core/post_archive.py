@@ -0,0 +1,110 @@
+import gzip
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import core.json_backend as json_backend
+import core.fs as fs
+from core.boosty.client import BoostyClient
+from core.logger import setup_logger
+from core.post_renderer import PostTextRenderer
+
+logger = setup_logger()
+
+ARCHIVE_FILE_NAME = "post.json.gz"
+
+
+def dump_post_archive(raw_json: bytes) -> bytes:
+    return gzip.compress(raw_json, compresslevel=6)
+
+
+def load_post_archive(path: Path) -> bytes:
+    with gzip.open(path, "rb") as f:
+        return f.read()
+
+
+async def save_post_archive(post_path: Path, raw_json: bytes) -> Path:
+    """Сохраняет исходный ответ API рядом с медиа поста"""
+    archive_path = post_path / ARCHIVE_FILE_NAME
+
+    def _write():
+        tmp_path = archive_path.with_name(archive_path.name + ".tmp")
+        tmp_path.write_bytes(dump_post_archive(raw_json))
+        os.replace(tmp_path, archive_path)
+
+    await fs.run(_write)
+    logger.info(f"Raw post data saved: {archive_path}")
+    return archive_path
+
+
+def find_post_archives(downloads_folder: Path) -> List[Path]:
+    """Ищет архивы постов в структуре <папка загрузок>/<автор>/<пост>/"""
+    result = []
+    if not downloads_folder.is_dir():
+        return result
+    for author_dir in os.scandir(downloads_folder):
+        if not author_dir.is_dir():
+            continue
+        for post_dir in os.scandir(author_dir.path):
+            if not post_dir.is_dir():
+                continue
+            archive_path = Path(post_dir.path) / ARCHIVE_FILE_NAME
+            if archive_path.is_file():
+                result.append(archive_path)
+    return result
+
+
+def rerender_post(archive_path: Path, formats: Sequence[str]) -> Optional[str]:
+    """
+    Перегенерирует текст поста из архива. Выполняется в процессе пула, где
+    нет файла лога: вместо записи в лог возвращает traceback ошибки (None -
+    успех), его логирует родительский процесс.
+    """
+    try:
+        raw_json = load_post_archive(archive_path)
+        post_info = BoostyClient.wrap_post(
+            json_backend.loads(raw_json), raw_json=raw_json
+        )
+        renderer = PostTextRenderer(post_info)
+        renderer.write_sync(
+            renderer.get_targets(archive_path.parent, formats, overwrite=True)
+        )
+        return None
+    except Exception:
+        return traceback.format_exc()
+
+
+def rerender_library(
+    downloads_folder: Path,
+    formats: Sequence[str],
+    workers: Optional[int] = None,
+) -> Tuple[int, int]:
+    """
+    Перегенерирует текстовые файлы всех постов из сохраненных архивов без сети.
+    Возвращает количество успешно и неуспешно обработанных постов.
+    """
+    archives = find_post_archives(downloads_folder)
+    logger.info(f"Re-rendering {len(archives)} posts in {downloads_folder}")
+    if not archives:
+        return 0, 0
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, min(64, len(archives) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(
+            executor.map(
+                rerender_post,
+                archives,
+                [tuple(formats)] * len(archives),
+                chunksize=chunksize,
+            )
+        )
+    failed = 0
+    for archive_path, error in zip(archives, results):
+        if error is not None:
+            failed += 1
+            logger.error(f"Failed re-render post {archive_path}:\n{error.rstrip()}")
+    succeeded = len(results) - failed
+    logger.info(f"Re-rendered {succeeded} posts, {failed} failed")
+    return succeeded, failed
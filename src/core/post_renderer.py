@@ -0,0 +1,140 @@
+from contextlib import AsyncExitStack, ExitStack
+from datetime import datetime
+from html import escape
+from pathlib import Path
+from typing import Container, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import aiofiles
+
+import core.fs as fs
+from core.boosty.defs import BoostyPostDto
+from core.draftjs_converter import (
+    DraftJsConverter,
+    TEXT_FORMAT_HTML,
+    TEXT_FORMAT_MARKDOWN,
+    TEXT_FORMAT_PLAIN,
+)
+from core.logger import setup_logger
+
+logger = setup_logger()
+
+TEXT_FILE_NAMES = {
+    TEXT_FORMAT_MARKDOWN: "content.md",
+    TEXT_FORMAT_PLAIN: "content.txt",
+    TEXT_FORMAT_HTML: "content.html",
+}
+
+# Сколько символов копится в памяти для одного формата перед записью на диск
+FLUSH_THRESHOLD = 64 * 1024
+
+
+class PostTextRenderer:
+    """Рендер текста поста сразу в несколько форматов с потоковой записью в файлы"""
+
+    def __init__(self, post_info: BoostyPostDto):
+        self.post_info = post_info
+        self.converter = DraftJsConverter(post_info.text_content.content)
+
+    def _header(self, fmt: str) -> str:
+        title = self.post_info.title
+        if fmt == TEXT_FORMAT_MARKDOWN:
+            return f"# {title}\n" if title else ""
+        if fmt == TEXT_FORMAT_HTML:
+            head = (
+                '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+                f"<title>{escape(title or self.post_info.id)}</title>\n"
+                "</head>\n<body>\n"
+            )
+            return head + (f"<h1>{escape(title)}</h1>\n" if title else "")
+        return f"{title} \n\n" if title else ""
+
+    def _footer(self, fmt: str) -> str:
+        post_time = datetime.fromtimestamp(self.post_info.publish_time)
+        fmt_date = post_time.strftime("%d.%m.%Y %H:%M")
+        if fmt == TEXT_FORMAT_MARKDOWN:
+            return f"\n\n---\n\n*Published {fmt_date}*\n"
+        if fmt == TEXT_FORMAT_HTML:
+            return f"<hr>\n<p><em>Published {fmt_date}</em></p>\n</body>\n</html>\n"
+        return f"\n\n[Published {fmt_date}]\n"
+
+    def iter_chunks(self, formats: Sequence[str]) -> Iterator[Tuple[str, str]]:
+        for fmt in formats:
+            yield fmt, self._header(fmt)
+        yield from self.converter.iter_render(formats)
+        for fmt in formats:
+            yield fmt, self._footer(fmt)
+
+    @staticmethod
+    def get_targets(
+        post_path: Path,
+        formats: Sequence[str],
+        overwrite: bool = False,
+        existing: Optional[Container[str]] = None,
+    ) -> Dict[str, Path]:
+        """existing - уже известные имена файлов в папке поста, вместо stat на диске"""
+        targets = {}
+        for fmt in formats:
+            path = post_path / TEXT_FILE_NAMES[fmt]
+            if existing is not None:
+                present = path.name in existing
+            else:
+                present = path.exists()
+            if not overwrite and present:
+                logger.info(f"Skip creating text file: {path} (already exists)")
+                continue
+            targets[fmt] = path
+        return targets
+
+    def _iter_flushes(self, formats: Sequence[str]) -> Iterator[Tuple[str, str]]:
+        buffers: Dict[str, List[str]] = {fmt: [] for fmt in formats}
+        sizes = dict.fromkeys(formats, 0)
+        for fmt, chunk in self.iter_chunks(formats):
+            buffers[fmt].append(chunk)
+            sizes[fmt] += len(chunk)
+            if sizes[fmt] >= FLUSH_THRESHOLD:
+                yield fmt, "".join(buffers[fmt])
+                buffers[fmt].clear()
+                sizes[fmt] = 0
+        for fmt in formats:
+            if buffers[fmt]:
+                yield fmt, "".join(buffers[fmt])
+
+    async def write(self, targets: Dict[str, Path]) -> None:
+        """Пишет все форматы за один проход, не собирая текст целиком в памяти"""
+        if not targets:
+            return
+        try:
+            async with AsyncExitStack() as stack:
+                files = {}
+                for fmt, path in targets.items():
+                    logger.info(f"Creating text file: {path}")
+                    files[fmt] = await stack.enter_async_context(
+                        aiofiles.open(path, "w", encoding="utf-8")
+                    )
+                for fmt, data in self._iter_flushes(tuple(targets.keys())):
+                    await files[fmt].write(data)
+        except BaseException:
+            await fs.run(self._cleanup, targets)
+            raise
+
+    def write_sync(self, targets: Dict[str, Path]) -> None:
+        if not targets:
+            return
+        try:
+            with ExitStack() as stack:
+                files = {}
+                for fmt, path in targets.items():
+                    files[fmt] = stack.enter_context(open(path, "w", encoding="utf-8"))
+                for fmt, data in self._iter_flushes(tuple(targets.keys())):
+                    files[fmt].write(data)
+        except BaseException:
+            self._cleanup(targets)
+            raise
+
+    @staticmethod
+    def _cleanup(targets: Dict[str, Path]) -> None:
+        for path in targets.values():
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                logger.error(f"Failed remove incomplete text file {path}", exc_info=e)
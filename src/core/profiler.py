@@ -0,0 +1,210 @@
+import asyncio
+import cProfile
+import datetime
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from core.logger import get_logs_folder, setup_logger
+
+try:
+    import yappi
+except ImportError:
+    yappi = None
+
+logger = setup_logger()
+
+PROFILE_DURATIONS = (10, 30, 60, 120)
+
+
+@dataclass
+class ProfileResult:
+    duration: float
+    files: List[Path] = field(default_factory=list)
+
+
+def _frame_name(code) -> str:
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({Path(code.co_filename).name}:{code.co_firstlineno})".replace(
+        ";", ","
+    )
+
+
+def _coroutine_stack(task: asyncio.Task) -> List[str]:
+    """Цепочка await задачи от корневой корутины до самой вложенной"""
+    stack = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = (
+            getattr(coro, "cr_frame", None)
+            or getattr(coro, "gi_frame", None)
+            or getattr(coro, "ag_frame", None)
+        )
+        if frame is None:
+            break
+        stack.append(_frame_name(frame.f_code))
+        coro = (
+            getattr(coro, "cr_await", None)
+            or getattr(coro, "gi_yieldfrom", None)
+            or getattr(coro, "ag_await", None)
+        )
+    return stack
+
+
+def _thread_stack(frame) -> List[str]:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _write_collapsed(path: Path, weights: Dict[str, float]) -> None:
+    """Формат collapsed stacks для flamegraph.pl, speedscope и inferno; вес - мс"""
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, weight in sorted(weights.items()):
+            if round(weight * 1000):
+                f.write(f"{stack} {round(weight * 1000)}\n")
+
+
+class Profiler:
+    """
+    Профилирование работающего приложения по запросу на duration секунд.
+    Пишет в папку логов:
+      - .prof: cProfile потока event loop (yappi с wall-часами, если установлен);
+      - -tasks.collapsed: время задач asyncio по цепочкам await, включая ожидание;
+      - -loop.collapsed: выборки стека потока event loop (что его занимало).
+    """
+
+    def __init__(self, sample_interval: float = 0.01):
+        self.sample_interval = sample_interval
+        self.output_dir: Optional[Path] = None
+        self._running = False
+        self._stop_requested: Optional[asyncio.Event] = None
+        self._task_weights: Dict[str, float] = {}
+        self._loop_weights: Dict[str, float] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def stop(self) -> None:
+        """Завершает профилирование раньше срока"""
+        if self._stop_requested is not None:
+            self._stop_requested.set()
+
+    async def _sample_tasks(self, stop: asyncio.Event) -> None:
+        current = asyncio.current_task()
+        last = time.monotonic()
+        while not stop.is_set():
+            await asyncio.sleep(self.sample_interval)
+            now = time.monotonic()
+            elapsed, last = now - last, now
+            for task in asyncio.all_tasks():
+                if task is current or task.done():
+                    continue
+                stack = ";".join(_coroutine_stack(task))
+                if stack:
+                    self._task_weights[stack] = (
+                        self._task_weights.get(stack, 0) + elapsed
+                    )
+
+    def _sample_loop_thread(self, thread_id: int, stop: threading.Event) -> None:
+        last = time.monotonic()
+        while not stop.wait(self.sample_interval):
+            now = time.monotonic()
+            elapsed, last = now - last, now
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            key = ";".join(_thread_stack(frame))
+            del frame
+            self._loop_weights[key] = self._loop_weights.get(key, 0) + elapsed
+
+    def _start_cpu_profile(self):
+        if yappi is not None:
+            yappi.set_clock_type("wall")
+            yappi.clear_stats()
+            yappi.start()
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    @staticmethod
+    def _stop_cpu_profile(profile) -> None:
+        # Останавливается в потоке event loop: cProfile привязан к потоку
+        if yappi is not None:
+            yappi.stop()
+        else:
+            profile.disable()
+
+    @staticmethod
+    def _save_cpu_profile(profile, path: Path) -> None:
+        """Пишет остановленный профиль; вызывается вне event loop"""
+        if yappi is not None:
+            yappi.get_func_stats().save(str(path), type="pstat")
+            yappi.clear_stats()
+            return
+        profile.dump_stats(path)
+
+    async def run(self, duration: float) -> ProfileResult:
+        """Профилирует текущий event loop duration секунд и сохраняет файлы"""
+        if self._running:
+            raise RuntimeError("Profiler is already running")
+        self._running = True
+        self._stop_requested = asyncio.Event()
+        self._task_weights = {}
+        self._loop_weights = {}
+        output_dir = self.output_dir or get_logs_folder()
+        prefix = output_dir / f"profile-{datetime.datetime.now():%Y%m%d-%H%M%S}"
+        result = ProfileResult(duration=duration)
+        logger.info(
+            f"Profiling for {duration:.0f} s (backend: {'yappi' if yappi else 'cProfile'})"
+        )
+
+        stop_tasks = asyncio.Event()
+        stop_thread = threading.Event()
+        sampler = threading.Thread(
+            target=self._sample_loop_thread,
+            args=(threading.get_ident(), stop_thread),
+            name="profiler-sampler",
+            daemon=True,
+        )
+        task_sampler = asyncio.create_task(self._sample_tasks(stop_tasks))
+        started = time.monotonic()
+        profile = self._start_cpu_profile()
+        sampler.start()
+        try:
+            await asyncio.wait_for(self._stop_requested.wait(), duration)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            result.duration = time.monotonic() - started
+            stop_thread.set()
+            stop_tasks.set()
+            prof_path = prefix.with_suffix(".prof")
+            self._stop_cpu_profile(profile)
+            # Запись большого профиля заняла бы event loop и сама дала бы задержку
+            await asyncio.to_thread(self._save_cpu_profile, profile, prof_path)
+            await task_sampler
+            await asyncio.to_thread(sampler.join)
+            result.files.append(prof_path)
+            for suffix, weights in (
+                ("-tasks.collapsed", self._task_weights),
+                ("-loop.collapsed", self._loop_weights),
+            ):
+                path = prefix.with_name(prefix.name + suffix)
+                await asyncio.to_thread(_write_collapsed, path, weights)
+                result.files.append(path)
+            self._stop_requested = None
+            self._running = False
+        logger.info(f"Profile saved: {', '.join(str(p) for p in result.files)}")
+        return result
+
+
+profiler = Profiler()
@@ -1,12 +1,116 @@
+import math
+import time
+from collections import deque
+from typing import Optional
+
+
 class ProgressCounter:
-    def __init__(self, total):
+    """
+    Счетчик прогресса с оценкой скорости: EWMA по корзинам в tick секунд,
+    ETA и объем за последние window секунд. update() дешевый и вызывается
+    на каждый чанк, обновления передаются родительскому счетчику.
+    """
+
+    def __init__(
+        self,
+        total,
+        parent: Optional["ProgressCounter"] = None,
+        half_life: float = 3.0,
+        window: float = 5.0,
+        tick: float = 0.25,
+    ):
         self.total = total
         self.n = 0
+        self.parent = parent
+        self.window = window
+        self._tick = tick
+        self._tau = half_life / math.log(2)
+        self._speed = 0.0
+        self._primed = False
+        self._started = time.monotonic()
+        self._bucket_start = self._started
+        self._bucket_bytes = 0
+        self._history = deque()  # (время закрытия корзины, байт)
 
     def update(self, n=1):
         self.n += n
+        self._bucket_bytes += n
+        now = time.monotonic()
+        if now - self._bucket_start >= self._tick:
+            self._roll(now)
+        if self.parent is not None:
+            self.parent.update(n)
+
+    def _roll(self, now: float) -> None:
+        elapsed = now - self._bucket_start
+        if elapsed <= 0:
+            return
+        rate = self._bucket_bytes / elapsed
+        if self._primed:
+            self._speed += (1 - math.exp(-elapsed / self._tau)) * (rate - self._speed)
+        elif self._bucket_bytes:
+            # Первая непустая корзина задает стартовую оценку, чтобы не ползти от нуля
+            self._speed = rate
+            self._primed = True
+        if self._bucket_bytes:
+            self._history.append((now, self._bucket_bytes))
+        while self._history and self._history[0][0] < now - self.window:
+            self._history.popleft()
+        self._bucket_start = now
+        self._bucket_bytes = 0
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if now - self._bucket_start >= self._tick:
+            self._roll(now)
+
+    @property
+    def speed(self) -> float:
+        """Сглаженная скорость, байт/с"""
+        self._refresh()
+        return self._speed
+
+    @property
+    def recent_bytes(self) -> int:
+        """Байт за последние window секунд"""
+        self._refresh()
+        return sum(n for _, n in self._history) + self._bucket_bytes
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Оценка оставшегося времени в секундах, None - если оценить нельзя"""
+        if not self.total:
+            return None
+        speed = self.speed
+        if speed <= 0:
+            return None
+        return max(0, self.total - self.n) / speed
 
     def __enter__(self):
         return self
 
     def __exit__(self, *args): ...
+
+
+def format_size(size: float) -> str:
+    if size < 1024**3:
+        return f"{size / 1024 ** 2:.1f} MB"
+    return f"{size / 1024 ** 3:.1f} GB"
+
+
+def format_speed(speed: float) -> str:
+    return f"{format_size(speed)}/s"
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
@@ -0,0 +1,195 @@
+import asyncio
+import itertools
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Sequence, Type, TypeVar
+
+from core.logger import setup_logger
+
+if TYPE_CHECKING:
+    from core.task import Task
+
+logger = setup_logger()
+
+
+class Waiter:
+    """
+    То, что ждет очереди: задача, порядок добавления и ожидаемый объем.
+    Политики выбирают среди ожидающих слот задач и среди файлов постов в
+    очереди передачи.
+    """
+
+    __slots__ = ()
+
+    task: "Task"
+    order: int
+
+    @property
+    def expected_bytes(self) -> Optional[int]:
+        raise NotImplementedError
+
+
+W = TypeVar("W", bound=Waiter)
+
+
+class SlotRequest(Waiter):
+    """Задача, ожидающая слот загрузки"""
+
+    __slots__ = ("task", "order", "future")
+
+    def __init__(self, task: "Task", order: int, future: asyncio.Future):
+        self.task = task
+        self.order = order  # порядок добавления задачи
+        self.future = future
+
+    @property
+    def expected_bytes(self) -> Optional[int]:
+        return self.task.expected_bytes
+
+
+class SchedulingPolicy:
+    """Выбирает, кому из ожидающих отдать освободившийся слот"""
+
+    name = ""
+
+    def select(self, waiting: Sequence[W]) -> W:
+        raise NotImplementedError
+
+
+class FifoPolicy(SchedulingPolicy):
+    name = "fifo"
+
+    def select(self, waiting: Sequence[W]) -> W:
+        return min(waiting, key=lambda request: request.order)
+
+
+class ShortestFirstPolicy(SchedulingPolicy):
+    """
+    Сначала задачи с наименьшим ожидаемым объемом. Объем неизвестен, пока у
+    задачи нет метаданных поста (загрузка по ссылке): такие идут после
+    задач с известным объемом.
+    """
+
+    name = "shortest"
+
+    def select(self, waiting: Sequence[W]) -> W:
+        def key(request: W):
+            expected = request.expected_bytes
+            return expected is None, expected or 0, request.order
+
+        return min(waiting, key=key)
+
+
+class FairPolicy(SchedulingPolicy):
+    """Авторы получают слоты по очереди, внутри автора - в порядке добавления"""
+
+    name = "fair"
+
+    def __init__(self):
+        self._turns: Deque[str] = deque()
+
+    def select(self, waiting: Sequence[W]) -> W:
+        by_author: Dict[str, W] = {}
+        for request in sorted(waiting, key=lambda r: r.order):
+            by_author.setdefault(request.task.author, request)
+        for author in by_author:
+            if author not in self._turns:
+                self._turns.append(author)
+        for _ in range(len(self._turns)):
+            author = self._turns[0]
+            self._turns.rotate(-1)
+            if author in by_author:
+                return by_author[author]
+        return min(waiting, key=lambda request: request.order)
+
+
+SCHEDULING_POLICIES: Dict[str, Type[SchedulingPolicy]] = {
+    policy.name: policy for policy in (FifoPolicy, ShortestFirstPolicy, FairPolicy)
+}
+
+
+def create_policy(name: str) -> Optional[SchedulingPolicy]:
+    policy = SCHEDULING_POLICIES.get(name)
+    if policy is None:
+        logger.error(f"Unknown scheduling policy: {name}")
+        return None
+    return policy()
+
+
+class SlotScheduler:
+    """
+    Слоты загрузки с выбором очередности. Освободившийся слот получает
+    задача с наибольшим приоритетом, заданным пользователем, среди равных -
+    выбранная политикой. Используется только из event loop.
+    """
+
+    def __init__(self, capacity: int, policy: str = FifoPolicy.name):
+        self.capacity = capacity
+        self.policy: SchedulingPolicy = FifoPolicy()
+        self.set_policy(policy)
+        self._busy = 0
+        self._waiting: List[SlotRequest] = []
+        self._orders = itertools.count()
+
+    def set_policy(self, name: str) -> None:
+        if name == self.policy.name:
+            return
+        policy = create_policy(name)
+        if policy is None:
+            return
+        logger.info(f"Scheduling policy: {name}")
+        self.policy = policy
+
+    def slot(self, task: "Task") -> "TaskSlot":
+        return TaskSlot(self, task, next(self._orders))
+
+    async def _acquire(self, task: "Task", order: int) -> None:
+        if self._busy < self.capacity and not self._waiting:
+            self._busy += 1
+            return
+        request = SlotRequest(task, order, asyncio.get_running_loop().create_future())
+        self._waiting.append(request)
+        try:
+            await request.future
+        except asyncio.CancelledError:
+            if request in self._waiting:
+                self._waiting.remove(request)
+            elif not request.future.cancelled():
+                # Слот уже был выдан, но задачу отменили: отдаем его дальше
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self._busy -= 1
+        self._grant()
+
+    def _grant(self) -> None:
+        while self._waiting and self._busy < self.capacity:
+            top = max(request.task.priority for request in self._waiting)
+            request = self.policy.select(
+                [r for r in self._waiting if r.task.priority == top]
+            )
+            self._waiting.remove(request)
+            if request.future.done():  # задачу отменили, пока она ждала
+                continue
+            self._busy += 1
+            request.future.set_result(None)
+
+
+class TaskSlot:
+    """Слот конкретной задачи: интерфейс acquire/release как у семафора"""
+
+    def __init__(self, scheduler: SlotScheduler, task: "Task", order: int):
+        self._scheduler = scheduler
+        self._task = task
+        self._order = order
+        self.queued = False
+
+    async def acquire(self) -> None:
+        self.queued = True
+        try:
+            await self._scheduler._acquire(self._task, self._order)
+        finally:
+            self.queued = False
+
+    def release(self) -> None:
+        self._scheduler._release()
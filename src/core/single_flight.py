@@ -0,0 +1,97 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from core.metrics import registry
+
+T = TypeVar("T")
+
+COALESCED_REQUESTS = registry.counter(
+    "boosty_coalesced_requests_total",
+    "Requests that joined an identical request already in flight",
+    ("kind",),
+)
+
+
+class _Call:
+    __slots__ = ("task", "waiters", "state")
+
+    def __init__(self, task: asyncio.Task, state: Any):
+        self.task = task
+        self.waiters = 0
+        self.state = state
+
+
+class SingleFlight:
+    """
+    Объединяет одинаковые одновременные операции: пока операция с ключом
+    выполняется, остальные вызовы с тем же ключом ждут ее результат (или
+    исключение) вместо повторного запроса. Операция идет отдельной задачей
+    и отменяется, только когда ее перестали ждать все вызвавшие.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        waiter = self.join(key)
+        if waiter is None:
+            waiter = self.start(key, func)
+        return await waiter
+
+    def start(
+        self, key: Hashable, func: Callable[[], Awaitable[T]], state: Any = None
+    ) -> "asyncio.Future[T]":
+        """
+        Запускает операцию key, которой еще нет. state - общие данные ее
+        участников, их возвращает state(). Отмена возвращенного future
+        означает, что вызвавший перестал ждать.
+        """
+        call = _Call(asyncio.create_task(func()), state)
+        self._calls[key] = call
+        call.task.add_done_callback(lambda _: self._forget(key, call))
+        return self._attach(key, call)
+
+    def join(self, key: Hashable) -> "Optional[asyncio.Future]":
+        """Присоединяется к выполняющейся операции key; None - такой нет"""
+        call = self._calls.get(key)
+        if call is None:
+            return None
+        COALESCED_REQUESTS.inc(1, self.kind)
+        return self._attach(key, call)
+
+    def state(self, key: Hashable) -> Any:
+        call = self._calls.get(key)
+        return call.state if call is not None else None
+
+    def _attach(self, key: Hashable, call: _Call) -> asyncio.Future:
+        call.waiters += 1
+        waiter = asyncio.get_running_loop().create_future()
+
+        def relay(task: asyncio.Task) -> None:
+            if waiter.done():
+                return
+            if task.cancelled():
+                waiter.cancel()
+            elif task.exception() is not None:
+                waiter.set_exception(task.exception())
+            else:
+                waiter.set_result(task.result())
+
+        def leave(_) -> None:
+            call.task.remove_done_callback(relay)
+            call.waiters -= 1
+            if not call.waiters and not call.task.done():
+                self._forget(key, call)
+                call.task.cancel()
+
+        call.task.add_done_callback(relay)
+        waiter.add_done_callback(leave)
+        return waiter
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -1,15 +1,20 @@
 import asyncio
-import os
+import functools
+import time
 from dataclasses import dataclass
-from datetime import datetime
 from pathlib import Path
-from typing import Optional, List
+from typing import Awaitable, Callable, Optional, List, Tuple
 
-import aiofiles
-from aiohttp import ClientSession
+from aiohttp import (
+    ClientConnectionError,
+    ClientPayloadError,
+    ClientResponse,
+    ClientSession,
+)
 
 from core.authorization_provider import AuthorizationProvider
 from core.boosty.client import BoostyClient
+from core.cassette import CassetteRecorder, get_recorder
 from core.boosty.defs import (
     BoostyImageDto,
     BoostyAudioDto,
@@ -18,20 +23,150 @@ from core.boosty.defs import (
     VIDEO_QUALITY_GRADE,
     BoostyPostDto,
 )
-from core.defs.common import DownloadingSettingsDto
+from core.defs.common import DownloadingSettingsDto, SettingsProvider, AuthProvider
+from core.chunk_tuner import ChunkTuner
 from core.defs.tasks import TaskError
-from core.draftjs_converter import DraftJsConverter
+from core.disk_space import InsufficientDiskSpaceError, Reservation, disk_space
+from core.disk_writer import WriteOptions, disk_writer
+import core.fs as fs
+from core.host_gate import HostUnavailableError, host_gate
+from core.http_pool import http_pool
 from core.logger import setup_logger
-from core.progress_counter import ProgressCounter
-from core.utils import validate_windows_dir_name, sign_url, get_download_settings
+from core.metrics import (
+    DOWNLOADED_BYTES,
+    DOWNLOADED_FILES,
+    FILE_TRANSFER_TIME,
+    RESUMED_DOWNLOADS,
+    SIGNATURE_REFRESHES,
+    TASKS_FINISHED,
+    TASK_RETRIES,
+    tracked_slot,
+)
+from core.post_archive import save_post_archive
+from core.post_renderer import PostTextRenderer
+from core.pipeline import DownloadPipeline
+from core.single_flight import SingleFlight
+from core.tracing import span
+from core.work_queue import FileBatch
+from core.progress_counter import (
+    ProgressCounter,
+    format_size,
+    format_speed,
+)
+from core.utils import (
+    validate_windows_dir_name,
+    sign_url,
+    signature_expires,
+    get_download_settings,
+)
 
 logger = setup_logger()
 
+# Одинаковые пробы размера и загрузки одного URL из разных задач
+_probe_flight = SingleFlight("probe_size")
+_transfer_flight = SingleFlight("transfer")
+
+# Ответы на ссылку с истекшей подписью
+SIGNATURE_EXPIRED_STATUSES = (401, 403, 410)
+# Подпись, истекающая раньше чем через столько секунд, обновляется заранее
+SIGNATURE_EXPIRY_MARGIN = 60
+# Запросов на файл: продолжения после обрыва и обновления подписи
+MAX_FILE_ATTEMPTS = 4
+
+# API не сообщает размер видео до HEAD-запроса: для планирования берем оценку
+VIDEO_SIZE_ESTIMATE = 512 * 1024 * 1024
+
+
+def estimate_post_size(post_info: BoostyPostDto) -> int:
+    """Ожидаемый объем медиа поста по метаданным"""
+    total = 0
+    for media in post_info.media:
+        if isinstance(media, BoostyVideoDto):
+            total += VIDEO_SIZE_ESTIMATE
+        else:
+            total += media.size
+    return total
+
+
+class FileProgress:
+    """
+    Прогресс загрузки одного файла. Одну загрузку могут ждать несколько
+    задач: ее байты идут в прогресс каждой из них, пока она ждет, а в
+    общий счетчик parent - один раз.
+    """
+
+    def __init__(self, total: int, parent: Optional[ProgressCounter] = None):
+        self.counter = ProgressCounter(total=total or None, parent=parent)
+        self._watchers: List[Tuple["Task", ProgressCounter]] = []
+
+    @property
+    def n(self) -> int:
+        return self.counter.n
+
+    @property
+    def elapsed(self) -> float:
+        return self.counter.elapsed
+
+    def watch(
+        self, task: "Task", pbar: ProgressCounter
+    ) -> Tuple["Task", ProgressCounter]:
+        """Начинает учитывать загрузку в pbar задачи, с уже полученными байтами"""
+        watcher = (task, ProgressCounter(total=self.counter.total, parent=pbar))
+        self._watchers.append(watcher)
+        if self.counter.n:
+            task._advance(self.counter.n, watcher[1])
+        return watcher
+
+    def unwatch(self, watcher: Tuple["Task", ProgressCounter]) -> None:
+        self._watchers.remove(watcher)
+
+    def advance(self, n: int) -> None:
+        """Учитывает n байт файла (n < 0 - файл начат заново)"""
+        self.counter.update(n)
+        for task, file_pbar in self._watchers:
+            task._advance(n, file_pbar)
+
 
 @dataclass
 class FinalDownloadTaskDto:
     final_url: str
     save_path: Path
+    size: int = 0
+    # Ссылка без подписи: по ней файл подписывается заново, когда подпись истекла
+    unsigned_url: Optional[str] = None
+
+
+@dataclass
+class PreparedPostDto:
+    settings: DownloadingSettingsDto
+    client: BoostyClient
+    post_info: BoostyPostDto
+    post_path: Path
+    downloads_folder: Path
+    directory: fs.PostDirectory
+    download_items: List[FinalDownloadTaskDto]
+    signed_query: str = ""  # текущая подпись ссылок поста
+    warmed: bool = False  # соединения к хостам файлов уже прогреваются
+
+    @property
+    def missing_items(self) -> List[FinalDownloadTaskDto]:
+        """Файлы, которых еще нет в папке поста"""
+        return [
+            item
+            for item in self.download_items
+            if item.save_path.name not in self.directory
+        ]
+
+    def partial_size(self, item: FinalDownloadTaskDto) -> int:
+        """Сколько файла уже скачано в прошлый раз"""
+        return self.directory.size(fs.part_path(item.save_path).name) or 0
+
+    @property
+    def missing_bytes(self) -> int:
+        """Сколько осталось скачать (для резерва места на диске)"""
+        return sum(
+            max(0, item.size - self.partial_size(item)) for item in self.missing_items
+        )
 
 
 class Task:
@@ -39,26 +174,39 @@ class Task:
 
     def __init__(
         self,
-        semaphore: asyncio.Semaphore,
+        pipeline: DownloadPipeline,
         author: str,
         post_id: str,
         post_info: Optional[BoostyPostDto] = None,
+        settings_provider: SettingsProvider = get_download_settings,
+        auth_provider: AuthProvider = AuthorizationProvider.get_authorization_if_valid,
+        progress_parent: Optional[ProgressCounter] = None,
     ):
-        self._semaphore = semaphore
+        self._slot = pipeline.metadata.slot(self)
+        self._pipeline = pipeline
+        self._batch: Optional[FileBatch] = None
+        self._progress_parent = progress_parent
+        self._progress: Optional[ProgressCounter] = None
+        self._settings_provider = settings_provider
+        self._auth_provider = auth_provider
         self.author = author
         self.post_id = post_id
+        self.priority = 0  # выше - раньше получает слот
         self.title = None
         self.path = None
         self._percent = 0
         self._downloaded_bytes = 0
         self._done = False
         self._pending = False
+        self._waiting_space = False
+        self._deferred_host: Optional[str] = None
         self._error = False
         self._task = None
         self._finished = False
         self._count_files = 0
         self._total_weight = 0
         self._post_info = post_info
+        self._estimated_bytes: Optional[int] = None
         self.error_description: Optional[TaskError] = None
         self._built_client: Optional[BoostyClient] = None
 
@@ -69,6 +217,37 @@ class Task:
     def percent(self) -> float:
         return self._percent / 100
 
+    @property
+    def speed(self) -> float:
+        """Текущая скорость загрузки, байт/с"""
+        if self._progress is None or self._finished:
+            return 0.0
+        return self._progress.speed
+
+    @property
+    def eta(self) -> Optional[float]:
+        if self._progress is None or self._finished:
+            return None
+        return self._progress.eta
+
+    @property
+    def stalled(self) -> bool:
+        """Загрузка идет, но за последнее окно не пришло ни байта"""
+        if self._progress is None or self._finished:
+            return False
+        if self._batch is not None and not self._batch.running:
+            return False  # файлы ждут воркеров общей очереди
+        return (
+            self._progress.elapsed > self._progress.window
+            and self._progress.recent_bytes == 0
+        )
+
+    @property
+    def remaining_bytes(self) -> int:
+        if self._finished:
+            return 0
+        return max(0, self._total_weight - self._downloaded_bytes)
+
     @property
     def finished(self) -> bool:
         return self._finished
@@ -77,6 +256,34 @@ class Task:
     def pending(self) -> bool:
         return self._pending
 
+    @property
+    def expected_bytes(self) -> Optional[int]:
+        """Объем задачи: точный после подготовки, до нее - оценка по метаданным"""
+        if self._total_weight:
+            return self._total_weight
+        if self._post_info is None:
+            return None
+        if self._estimated_bytes is None:
+            self._estimated_bytes = estimate_post_size(self._post_info)
+        return self._estimated_bytes
+
+    @property
+    def queued(self) -> bool:
+        """Задача ждет слот или ее файлы ждут воркеров"""
+        if self._slot.queued:
+            return True
+        return self._batch is not None and self._batch.queued > 0
+
+    @property
+    def waiting_space(self) -> bool:
+        """Задача ждет свободного места на диске"""
+        return self._waiting_space
+
+    @property
+    def deferred_host(self) -> Optional[str]:
+        """Хост, который временно не принимает запросы и которого ждет задача"""
+        return self._deferred_host
+
     @property
     def total_weight(self) -> int:
         return self._total_weight
@@ -87,35 +294,55 @@ class Task:
 
     def launch(self):
         if self._task is None:
-            self._task = asyncio.create_task(self._run())
+            self._task = asyncio.create_task(self._traced_run())
 
     async def _build_client(self, force: bool = False) -> Optional[BoostyClient]:
         if not self._built_client or force:
-            settings = await get_download_settings()
+            settings = await self._settings_provider()
             if not settings:
                 logger.error(
                     "Failed get application settings. It may be that the home folder could not be found."
                 )
                 return None
-            auth_token = await AuthorizationProvider.get_authorization_if_valid()
+            auth_token = await self._auth_provider()
             self._built_client = BoostyClient(
                 chunk_size=settings.chunk_size,
                 download_timeout=settings.download_timeout,
                 auth_token=auth_token,
+                base_url=settings.api_base_url,
+                recorder=(
+                    get_recorder(settings.record_dir, settings.record_media)
+                    if settings.record_dir
+                    else None
+                ),
             )
         return self._built_client
 
     async def fetch_file_size(self, url: str) -> Optional[int]:
+        """Одновременные пробы одного URL выполняются одним запросом"""
+        return await _probe_flight.do(url, lambda: self._fetch_file_size(url))
+
+    async def _fetch_file_size(self, url: str) -> Optional[int]:
         client = await self._build_client()
         if not client:
             return None
         session = client.get_client_session()
         logger.info(f"Fetching file size for {url}")
         try:
-            async with session.head(url) as response:
-                logger.debug(f"Got response {response.status}")
-                response.raise_for_status()
-                return response.content_length
+            async with host_gate.request(url):
+                with span("probe_size") as trace:
+                    response = await session.head(url)
+                    trace.set("status", response.status)
+                async with response:
+                    logger.debug(f"Got response {response.status}")
+                    if client.recorder:
+                        await client.recorder.record(
+                            "HEAD", url, response.status, response.headers, None
+                        )
+                    response.raise_for_status()
+                    return response.content_length
+        except HostUnavailableError:
+            raise
         except Exception as e:
             logger.error("Failed to fetch file size", exc_info=e)
             return None
@@ -125,8 +352,12 @@ class Task:
     async def stop(self):
         if self._task:
             self._task.cancel()
+        if not self._finished:
+            TASKS_FINISHED.inc(1, TaskError.CANCELLED.value)
         self._task = None
         self._pending = False
+        self._waiting_space = False
+        self._deferred_host = None
         self._error = True
         self._finished = True
         self.error_description = TaskError.CANCELLED
@@ -134,54 +365,212 @@ class Task:
     async def retry(self):
         if self._done or self._pending:
             return
-        self._percent = 0
         self._error = False
         self.error_description = None
         self._finished = False
         self._task = None
+        self._reset_progress()
+        TASK_RETRIES.inc()
+        self.launch()
+
+    def _reset_progress(self) -> None:
+        self._percent = 0
         self._total_weight = 0
         self._count_files = 0
-        self.launch()
+        self._downloaded_bytes = 0
+        self._progress = None
+
+    def _advance(self, n: int, file_pbar: ProgressCounter) -> None:
+        """Учитывает n байт файла (n < 0 - файл начат заново)"""
+        self._downloaded_bytes += n
+        file_pbar.update(n)
+        pbar = file_pbar.parent
+        self._percent = (pbar.n / (pbar.total or 1)) * 100
 
     async def _download_file(
         self,
         session: ClientSession,
         file_url: str,
         save_path: Path,
-        pbar: ProgressCounter,
+        progress: FileProgress,
         chunk_size: int = 153600,
+        recorder: Optional[CassetteRecorder] = None,
+        directory: Optional[fs.PostDirectory] = None,
+        write_options: WriteOptions = WriteOptions(),
+        tuner: Optional[ChunkTuner] = None,
+        size: int = 0,
+        resign: Optional[Callable[[], Awaitable[Optional[str]]]] = None,
     ):
-        if save_path.exists():
+        """
+        Качает файл в save_path.part и переименовывает, когда он скачан целиком.
+        Недокачанный файл продолжается запросом Range: после обрыва соединения
+        и при следующем запуске задачи. Если ссылка вернула 401/403/410, а
+        resign выдал новую подпись, загрузка продолжается по новой ссылке.
+        """
+        if directory is not None:
+            existing = directory.size(save_path.name)
+        else:
+            existing = await fs.file_size(save_path)
+        if existing is not None:
             logger.info(f"Skip downloading file {save_path} (already exists)")
             await session.close()
-            size = save_path.stat().st_size
-            self._downloaded_bytes += size
-            pbar.update(size)
-            total = pbar.total or 1
-            self._percent = (pbar.n / total) * 100
+            progress.advance(existing)
             return
+        part_path = fs.part_path(save_path)
+        attempts = 0
         async with session:
-            logger.info(f"Downloading file {file_url}")
-            async with session.get(file_url) as response:
-                logger.debug(f"Got response {response.status}")
-                response.raise_for_status()
-                async with aiofiles.open(save_path, "wb") as f:
-                    logger.debug(f"Writing file {save_path}")
-                    async for chunk in response.content.iter_chunked(chunk_size):
+            while True:
+                attempts += 1
+                if attempts == 1 and directory is not None:
+                    offset = directory.size(part_path.name) or 0
+                else:
+                    offset = await fs.file_size(part_path) or 0
+                if size and offset >= size:
+                    # Предвыделенный файл после сбоя: по размеру не понять,
+                    # сколько записано, поэтому начинаем заново
+                    offset = 0
+                if offset != progress.n:
+                    progress.advance(offset - progress.n)
+                logger.info(
+                    f"Downloading file {file_url}"
+                    + (f" from byte {offset}" if offset else "")
+                )
+                headers = {"Range": f"bytes={offset}-"} if offset else None
+                retry = attempts < MAX_FILE_ATTEMPTS
+                try:
+                    async with host_gate.request(file_url):
+                        with span("ttfb") as trace:
+                            response = await session.get(file_url, headers=headers)
+                            trace.set("status", response.status)
+                        async with response:
+                            logger.debug(f"Got response {response.status}")
+                            if (
+                                response.status in SIGNATURE_EXPIRED_STATUSES
+                                and resign
+                                and retry
+                            ):
+                                new_url = await resign()
+                                if new_url:
+                                    logger.warning(
+                                        f"Signature of {save_path.name} expired, "
+                                        f"continuing with a refreshed one"
+                                    )
+                                    file_url = new_url
+                                    continue
+                            if offset and response.status == 416 and retry:
+                                # Частичный файл длиннее, чем файл на сервере
+                                await fs.remove(part_path)
+                                continue
+                            if offset and response.status == 200:
+                                offset = 0  # сервер не поддержал Range: файл целиком
+                                progress.advance(-progress.n)
+                            elif response.status == 206 and not response.headers.get(
+                                "Content-Range", ""
+                            ).startswith(f"bytes {offset}-"):
+                                raise ValueError(
+                                    f"Unexpected Content-Range for {file_url}: "
+                                    f"{response.headers.get('Content-Range')}"
+                                )
+                            if offset:
+                                RESUMED_DOWNLOADS.inc()
+                            total_size = (
+                                offset + response.content_length
+                                if response.content_length is not None
+                                else None
+                            )
+                            await self._receive_file(
+                                response,
+                                file_url,
+                                part_path,
+                                progress,
+                                offset,
+                                total_size,
+                                chunk_size,
+                                recorder,
+                                write_options,
+                                tuner,
+                            )
+                except (ClientPayloadError, ClientConnectionError) as e:
+                    if not retry:
+                        raise
+                    logger.warning(
+                        f"Download of {save_path.name} interrupted: {e!r}; resuming"
+                    )
+                    continue
+                break
+        await fs.replace(part_path, save_path)
+        if directory is not None:
+            directory.discard(part_path.name)
+            directory.add(save_path.name, progress.n)
+        elapsed = progress.elapsed
+        DOWNLOADED_FILES.inc()
+        FILE_TRANSFER_TIME.observe(elapsed)
+        logger.info(
+            f"Downloaded file {save_path}: {format_size(progress.n)} "
+            f"in {elapsed:.1f}s ({format_speed(progress.n / (elapsed or 1))})"
+        )
+
+    async def _receive_file(
+        self,
+        response: ClientResponse,
+        file_url: str,
+        part_path: Path,
+        progress: FileProgress,
+        offset: int,
+        total_size: Optional[int],
+        chunk_size: int,
+        recorder: Optional[CassetteRecorder],
+        write_options: WriteOptions,
+        tuner: Optional[ChunkTuner],
+    ) -> None:
+        """Пишет тело ответа в part_path начиная с offset"""
+        recording = (
+            recorder.start_media("GET", file_url, response.status, response.headers)
+            if recorder
+            else None
+        )
+        try:
+            response.raise_for_status()
+            with span("transfer", size=response.content_length, offset=offset):
+                async with disk_writer.open(
+                    part_path, total_size, write_options, offset
+                ) as f:
+                    logger.debug(f"Writing file {part_path}")
+                    # С пулом буферов чанки транспорта передаются как
+                    # есть (readany), без склейки внутри read(n)
+                    pooled = write_options.pool is not None
+                    if pooled:
+                        tuner = None
+                    read_size = chunk_size
+                    if tuner:
+                        # Соседние файлы задачи идут параллельно: окно свое
+                        tuner = tuner.for_transfer()
+                        read_size = tuner.size
+                    while True:
+                        if pooled:
+                            chunk = await response.content.readany()
+                        else:
+                            chunk = await response.content.read(read_size)
                         if not chunk:
-                            continue
+                            break
+                        if tuner:
+                            read_size = tuner.observe(len(chunk))
                         await f.write(chunk)
+                        if recording:
+                            await recording.feed(chunk)
                         new_chunk_size = len(chunk)
-                        self._downloaded_bytes += new_chunk_size
-                        pbar.update(new_chunk_size)
-                        total = pbar.total or 1
-                        self._percent = (pbar.n / total) * 100
+                        progress.advance(new_chunk_size)
+                        DOWNLOADED_BYTES.inc(new_chunk_size)
+        finally:
+            if recording:
+                await recording.close()
 
     def _fallback(self, err: TaskError) -> None:
         self._error = True
         self.error_description = err
         self._finished = True
         self._pending = False
+        TASKS_FINISHED.inc(1, err.value)
 
     async def _prepare_download_tasks(
         self,
@@ -190,6 +579,7 @@ class Task:
         settings: DownloadingSettingsDto,
     ) -> List[FinalDownloadTaskDto]:
         download_items = []
+        probes: List[FinalDownloadTaskDto] = []
         for media in post_info.media:
             if (
                 isinstance(media, BoostyImageDto) and settings.need_download_photos
@@ -199,6 +589,7 @@ class Task:
                     FinalDownloadTaskDto(
                         final_url=media.url,
                         save_path=post_path / (media.id + ".jpg"),
+                        size=media.size,
                     )
                 )
 
@@ -211,19 +602,12 @@ class Task:
                 for i in range(lborder_quality, len(VIDEO_QUALITY_GRADE)):
                     url_info = media.player_urls.get(VIDEO_QUALITY_GRADE[i])
                     if url_info:
-                        file_size = await self.fetch_file_size(url_info.url)
-                        if not file_size:
-                            raise ValueError(
-                                f"Failed fetch file size for {url_info.url}"
-                            )
-                        self._total_weight += file_size
                         path = post_path / validate_windows_dir_name(media.get_title())
-                        download_items.append(
-                            FinalDownloadTaskDto(
-                                final_url=url_info.url,
-                                save_path=path,
-                            )
+                        item = FinalDownloadTaskDto(
+                            final_url=url_info.url, save_path=path
                         )
+                        download_items.append(item)
+                        probes.append(item)  # размер узнаем HEAD-запросом ниже
                         break
 
             elif (
@@ -236,6 +620,8 @@ class Task:
                         FinalDownloadTaskDto(
                             final_url=sign_url(media.url, post_info.signed_query),
                             save_path=path,
+                            size=media.size,
+                            unsigned_url=media.url,
                         )
                     )
 
@@ -249,140 +635,429 @@ class Task:
                         FinalDownloadTaskDto(
                             final_url=sign_url(media.url, post_info.signed_query),
                             save_path=path,
+                            size=media.size,
+                            unsigned_url=media.url,
                         )
                     )
 
+        # Размеры видео запрашиваются параллельно, а не по одному
+        sizes = await asyncio.gather(
+            *(self.fetch_file_size(item.final_url) for item in probes)
+        )
+        for item, file_size in zip(probes, sizes):
+            if not file_size:
+                raise ValueError(f"Failed fetch file size for {item.final_url}")
+            item.size = file_size
+            self._total_weight += file_size
         return download_items
 
+    async def _traced_run(self):
+        with span("task", author=self.author, post_id=self.post_id) as trace:
+            await self._run()
+            trace.set("files", self._count_files)
+            trace.set("bytes", self._downloaded_bytes)
+            if self.error_description:
+                trace.set("result", self.error_description.value)
+
     async def _run(self):
         if self._done or self._pending:
             return None
 
         self._pending = True
-        async with self._semaphore:
-            settings = await get_download_settings()
-            if not settings:
-                logger.error(
-                    "Failed get application settings. It may be that the home folder could not be found."
-                )
+        while True:
+            try:
+                return await self._attempt()
+            except HostUnavailableError as e:
+                # Автомат хоста открыт: ждем его без слотов и начинаем заново,
+                # недокачанные файлы продолжатся с места остановки
+                logger.warning(f"Post {self.post_id} deferred: {e}")
+                self._reset_progress()
+                self._deferred_host = e.host
+                try:
+                    await host_gate.wait_ready(e)
+                finally:
+                    self._deferred_host = None
+            except Exception as e:
+                logger.error("Failed download post due unexpected error", exc_info=e)
                 return self._fallback(TaskError.ERROR)
-            client = await self._build_client(force=True)
-            if not client:
-                logger.error("Failed build client, task skipped")
+
+    async def _attempt(self):
+        # Слот стадии метаданных занят только на запросы к API и пробы размеров
+        async with tracked_slot(self._slot):
+            prepared = await self._prepare()
+            if prepared is None:
+                return None
+            required = prepared.missing_bytes
+            try:
+                reservation = await disk_space.try_reserve(
+                    prepared.downloads_folder,
+                    required,
+                    prepared.settings.disk_space_margin,
+                )
+            except InsufficientDiskSpaceError as e:
+                logger.error(f"Post {self.post_id} does not fit on disk: {e}")
+                return self._fallback(TaskError.NO_DISK_SPACE)
+            except Exception as e:
+                logger.error("Failed check free disk space", exc_info=e)
                 return self._fallback(TaskError.ERROR)
 
-            if self._post_info:
-                post_info = self._post_info
-            else:
-                try:
-                    post_info = await client.get_post_info(self.author, self.post_id)
-                except Exception as e:
-                    logger.error(
-                        "Failed fetch post info due unexpected error", exc_info=e
-                    )
-                    return self._fallback(TaskError.ERROR)
+        # Текст пишется параллельно с ожиданием места и передачей файлов
+        render = asyncio.create_task(self._render(prepared))
+        try:
+            error = await self._reserve_and_transfer(prepared, required, reservation)
+        except HostUnavailableError:
+            await render
+            raise
+        except BaseException:
+            # Ошибки текста _render обрабатывает сам, остается только отмена
+            render.cancel()
+            raise
+        await render
+        if error:
+            return self._fallback(error)
 
-            if post_info.title:
-                self.title = post_info.title
+        self._done = True
+        self._percent = 100
+        self._pending = False
+        self._finished = True
+        TASKS_FINISHED.inc(1, "done")
+        return None
 
-            if not post_info.has_access:
-                logger.error(
-                    f"User have no access to the post {self.post_id}, cancelled"
+    async def _reserve_and_transfer(
+        self,
+        prepared: PreparedPostDto,
+        required: int,
+        reservation: Optional[Reservation],
+    ) -> Optional[TaskError]:
+        if reservation is None:
+            # Место на диске ждем без слота: задачи поменьше могут пройти
+            self._waiting_space = True
+            try:
+                reservation = await disk_space.reserve(
+                    prepared.downloads_folder,
+                    required,
+                    prepared.settings.disk_space_margin,
                 )
-                return self._fallback(TaskError.ACCESS_DENIED)
+            except InsufficientDiskSpaceError as e:
+                logger.error(f"Post {self.post_id} does not fit on disk: {e}")
+                return TaskError.NO_DISK_SPACE
+            except Exception as e:
+                logger.error("Failed check free disk space", exc_info=e)
+                return TaskError.ERROR
+            finally:
+                self._waiting_space = False
+        return await self._transfer(prepared, reservation)
 
-            downloads_folder = Path(settings.downloads_folder)
-            logger.info(f"Home dir: {downloads_folder}")
+    async def _prepare(self) -> Optional[PreparedPostDto]:
+        """Стадия метаданных: пост, папка и список файлов с размерами"""
+        settings = await self._settings_provider()
+        if not settings:
+            logger.error(
+                "Failed get application settings. It may be that the home folder could not be found."
+            )
+            return self._fallback(TaskError.ERROR)
+        client = await self._build_client(force=True)
+        if not client:
+            logger.error("Failed build client, task skipped")
+            return self._fallback(TaskError.ERROR)
 
+        if self._post_info:
+            post_info = self._post_info
+        else:
             try:
-                if not os.path.isdir(settings.downloads_folder):
-                    logger.error(
-                        f"Home directory does not exist: {settings.downloads_folder}, creating..."
-                    )
-                    downloads_folder.mkdir(parents=True, exist_ok=True)
+                post_info = await client.get_post_info(self.author, self.post_id)
+            except HostUnavailableError:
+                raise
             except Exception as e:
-                logger.error("Failed create or check home directory", exc_info=e)
-                return self._fallback(TaskError.NO_HOME_FOLDER)
-
-            post_path = Path(settings.downloads_folder) / self.author / self.post_id
-            if post_info.title:
-                if title := validate_windows_dir_name(post_info.title):
-                    post_path = (
-                        Path(settings.downloads_folder)
-                        / self.author
-                        / (title + "_" + self.post_id)
-                    )
+                logger.error("Failed fetch post info due unexpected error", exc_info=e)
+                return self._fallback(TaskError.ERROR)
+
+        if post_info.title:
+            self.title = post_info.title
+
+        if not post_info.has_access:
+            logger.error(f"User have no access to the post {self.post_id}, cancelled")
+            return self._fallback(TaskError.ACCESS_DENIED)
 
-            self.path = post_path
-            if not os.path.isdir(post_path):
-                post_path.mkdir(parents=True)
-                logger.info(f"Post directory created: {post_path}")
+        downloads_folder = Path(settings.downloads_folder)
+        logger.info(f"Home dir: {downloads_folder}")
+
+        post_path = downloads_folder / self.author / self.post_id
+        if post_info.title:
+            if title := validate_windows_dir_name(post_info.title):
+                post_path = (
+                    downloads_folder / self.author / (title + "_" + self.post_id)
+                )
+
+        self.path = post_path
+        try:
+            directory = await fs.PostDirectory.open(downloads_folder, post_path)
+        except fs.HomeFolderError as e:
+            logger.error("Failed create or check home directory", exc_info=e)
+            return self._fallback(TaskError.NO_HOME_FOLDER)
+        except Exception as e:
+            logger.error("Failed create post directory", exc_info=e)
+            return self._fallback(TaskError.ERROR)
+        if directory.created:
+            logger.info(f"Post directory created: {post_path}")
 
+        try:
+            with span("prepare_downloads") as trace:
+                download_items = await self._prepare_download_tasks(
+                    post_path=post_path, post_info=post_info, settings=settings
+                )
+                trace.set("files", len(download_items))
+        except HostUnavailableError:
+            raise
+        except Exception as e:
+            logger.error("Failed prepare post files", exc_info=e)
+            return self._fallback(TaskError.ERROR)
+
+        self._count_files = len(download_items)
+        prepared = PreparedPostDto(
+            settings=settings,
+            client=client,
+            post_info=post_info,
+            post_path=post_path,
+            downloads_folder=downloads_folder,
+            directory=directory,
+            download_items=download_items,
+            signed_query=post_info.signed_query,
+        )
+        return prepared
+
+    async def _render(self, prepared: PreparedPostDto) -> None:
+        """Стадия текста: файлы текста поста и архив исходного JSON"""
+        settings = prepared.settings
+        post_info = prepared.post_info
+        post_path = prepared.post_path
+        async with self._pipeline.render:
             try:
-                parser = DraftJsConverter(post_info.text_content.content)
-                post_time = datetime.fromtimestamp(post_info.publish_time)
-                fmt_date = post_time.strftime("%d.%m.%Y %H:%M")
-                if settings.post_text_format == "md":
-                    if post_info.title:
-                        text_content = f"# {post_info.title}\n"
-                    else:
-                        text_content = ""
-                    text_content += parser.to_markdown() + "\n\n"
-                    text_content += f"---\n\n*Published {fmt_date}*\n"
-                else:
-                    if post_info.title:
-                        text_content = f"{post_info.title} \n\n"
-                    else:
-                        text_content = ""
-                    text_content += parser.to_plain_text() + "\n\n"
-                    text_content += f"[Published {fmt_date}]\n"
+                with span("render_text", formats=settings.post_text_format):
+                    renderer = PostTextRenderer(post_info)
+                    await renderer.write(
+                        renderer.get_targets(
+                            post_path,
+                            settings.post_text_formats,
+                            existing=prepared.directory,
+                        )
+                    )
             except Exception as e:
                 logger.error(
                     "Failed get post text content due unexpected error", exc_info=e
                 )
-                text_content = None
 
-            if text_content:
-                text_file_path = post_path / (
-                    "content.txt"
-                    if settings.post_text_format == "raw"
-                    else "content.md"
-                )
-                if text_file_path.exists():
-                    logger.info(
-                        f"Skip creating text file: {text_file_path} (already exists)"
+            if settings.need_save_raw_post and post_info.raw_json:
+                try:
+                    with span("save_archive", bytes=len(post_info.raw_json)):
+                        await save_post_archive(post_path, post_info.raw_json)
+                except Exception as e:
+                    logger.error("Failed save raw post data", exc_info=e)
+
+    async def _download_item(
+        self,
+        prepared: PreparedPostDto,
+        media: FinalDownloadTaskDto,
+        pbar: ProgressCounter,
+        write_options: WriteOptions,
+        tuner: Optional[ChunkTuner],
+        reservation: Reservation,
+    ) -> Optional[asyncio.Task]:
+        """
+        Задание воркера очереди: загрузка файла поста. Если этот файл уже
+        качает другая задача, возвращает ожидание ее загрузки, которое идет
+        без воркера.
+        """
+        client = prepared.client
+        if not prepared.warmed:
+            # Первый файл поста у воркера: остальные пойдут следом, и
+            # соединения к их хостам не успеют закрыться до начала загрузки
+            prepared.warmed = True
+            http_pool.warm_up(
+                client,
+                [
+                    item.final_url
+                    for item in prepared.missing_items
+                    if item is not media
+                ],
+            )
+        missing = media.save_path.name not in prepared.directory
+        needed = max(0, media.size - prepared.partial_size(media))
+        # Ключ без подписи: подписи одного файла в разных задачах разные
+        key = media.unsigned_url or media.final_url
+
+        async def resign() -> Optional[str]:
+            return await self._resign(prepared, media)
+
+        async def download(progress: FileProgress) -> Path:
+            if media.unsigned_url and missing:
+                expires = signature_expires(prepared.signed_query)
+                if expires and expires - SIGNATURE_EXPIRY_MARGIN <= time.time():
+                    await resign()
+            await self._download_file(
+                session=client.get_client_session(),
+                file_url=media.final_url,
+                save_path=media.save_path,
+                progress=progress,
+                chunk_size=prepared.settings.chunk_size,
+                recorder=client.recorder,
+                directory=prepared.directory,
+                write_options=write_options,
+                tuner=tuner,
+                size=media.size,
+                resign=resign if media.unsigned_url else None,
+            )
+            return media.save_path
+
+        if missing:
+            waiter = _transfer_flight.join(key)
+            if waiter is not None:
+                follow = asyncio.create_task(
+                    self._await_download(
+                        prepared,
+                        media,
+                        pbar,
+                        reservation,
+                        needed,
+                        waiter,
+                        _transfer_flight.state(key),
                     )
-                else:
-                    logger.info(f"Creating text file: {text_file_path}")
-                    async with aiofiles.open(
-                        text_file_path, "w", encoding="utf-8"
-                    ) as f:
-                        await f.write(text_content)
-
-            download_items = await self._prepare_download_tasks(
-                post_path=post_path, post_info=post_info, settings=settings
+                )
+                # Отмененное до старта ожидание не снимет себя само
+                follow.add_done_callback(lambda _: waiter.cancel())
+                return follow
+            progress = FileProgress(media.size, self._progress_parent)
+            waiter = _transfer_flight.start(key, lambda: download(progress), progress)
+            await self._await_download(
+                prepared, media, pbar, reservation, needed, waiter, progress
             )
+            return None
 
-            self._count_files = len(download_items)
-            with ProgressCounter(total=self._total_weight) as pbar:
-                for media in download_items:
-                    session = client.get_client_session()
-                    try:
-                        await self._download_file(
-                            session=session,
-                            file_url=media.final_url,
-                            save_path=media.save_path,
-                            pbar=pbar,
-                            chunk_size=settings.chunk_size,
-                        )
-                    except Exception as e:
-                        logger.error("Error downloading file", exc_info=e)
-                        return self._fallback(TaskError.ERROR)
-                    await asyncio.sleep(0.1)
+        progress = FileProgress(media.size, self._progress_parent)
+        watcher = progress.watch(self, pbar)
+        try:
+            with span("download_file", file=media.save_path.name):
+                await download(progress)
+        except HostUnavailableError:
+            raise
+        except Exception as e:
+            logger.error("Error downloading file", exc_info=e)
+            raise
+        finally:
+            progress.unwatch(watcher)
+        return None
 
-            self._done = True
-            self._percent = 100
-            self._pending = False
-            self._finished = True
+    async def _await_download(
+        self,
+        prepared: PreparedPostDto,
+        media: FinalDownloadTaskDto,
+        pbar: ProgressCounter,
+        reservation: Reservation,
+        needed: int,
+        waiter: "asyncio.Future[Path]",
+        progress: FileProgress,
+    ) -> None:
+        """
+        Ждет общую загрузку файла, считая ее байты в прогресс этой задачи.
+        Если файл качался в папку другой задачи, копирует его.
+        """
+        watcher = progress.watch(self, pbar)
+        try:
+            with span("download_file", file=media.save_path.name) as trace:
+                try:
+                    source = await waiter
+                finally:
+                    progress.unwatch(watcher)
+                if source != media.save_path:
+                    # Тот же URL в это время качала другая задача: копируем ее файл
+                    trace.set("coalesced", True)
+                    size = await fs.copy_file(source, media.save_path)
+                    logger.info(f"Copied {source} to {media.save_path}")
+                    prepared.directory.add(media.save_path.name, size)
+        except HostUnavailableError:
+            raise
+        except Exception as e:
+            logger.error("Error downloading file", exc_info=e)
+            raise
+        # Записанный файл уже учтен в свободном месте тома
+        reservation.consume(needed)
+
+    async def _resign(
+        self, prepared: PreparedPostDto, media: FinalDownloadTaskDto
+    ) -> Optional[str]:
+        """
+        Подписывает ссылку файла заново. signedQuery поста перезапрашивается,
+        только если ссылка подписана текущим: файлы, получившие отказ
+        одновременно, обходятся одним запросом поста. None - подпись обновить
+        не удалось.
+        """
+        stale = prepared.signed_query
+        if sign_url(media.unsigned_url, stale) == media.final_url:
+            try:
+                with span("refresh_signature"):
+                    post_info = await prepared.client.get_post_info(
+                        self.author, self.post_id
+                    )
+            except HostUnavailableError:
+                raise
+            except Exception as e:
+                logger.error("Failed refresh post signature", exc_info=e)
+                return None
+            if not post_info.has_access or not post_info.signed_query:
+                logger.error(f"Post {self.post_id} is no longer accessible")
+                return None
+            if post_info.signed_query == stale:
+                return None  # подпись та же: отказ не из-за ее истечения
+            prepared.signed_query = post_info.signed_query
+            if self._post_info is not None:
+                # Повтор задачи не должен начинать со старой подписи
+                self._post_info = post_info
+        media.final_url = sign_url(media.unsigned_url, prepared.signed_query)
+        SIGNATURE_REFRESHES.inc()
+        return media.final_url
 
+    async def _transfer(
+        self, prepared: PreparedPostDto, reservation: Reservation
+    ) -> Optional[TaskError]:
+        """Стадия передачи: файлы поста качают воркеры общей очереди"""
+        settings = prepared.settings
+        write_options = WriteOptions.from_settings(settings)
+        tuner = ChunkTuner.from_settings(settings)
+        try:
+            # Общий счетчик получает байты от FileProgress: файл, который
+            # ждут несколько задач, учитывается в нем один раз
+            with ProgressCounter(total=self._total_weight) as pbar:
+                self._progress = pbar
+                self._batch = batch = self._pipeline.transfer.submit(
+                    self,
+                    [
+                        (
+                            media.size,
+                            functools.partial(
+                                self._download_item,
+                                prepared,
+                                media,
+                                pbar,
+                                write_options,
+                                tuner,
+                                reservation,
+                            ),
+                        )
+                        for media in prepared.download_items
+                    ],
+                )
+                try:
+                    await batch.wait()
+                except HostUnavailableError:
+                    raise
+                except Exception:
+                    return TaskError.ERROR
+                logger.info(
+                    f"Post {self.post_id} downloaded: {format_size(pbar.n)} "
+                    f"in {pbar.elapsed:.1f}s "
+                    f"({format_speed(pbar.n / (pbar.elapsed or 1))})"
+                )
+        finally:
+            self._batch = None
+            reservation.release()
         return None
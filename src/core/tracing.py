@@ -0,0 +1,334 @@
+import atexit
+import contextvars
+import json
+import queue
+import random
+import threading
+import time
+import urllib.request
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Iterable, List, Optional
+
+from aiohttp import TraceConfig
+
+from core.logger import setup_logger
+
+logger = setup_logger()
+
+TRACES_FILE = "traces.jsonl"
+SERVICE_NAME = "boosty-downloader"
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    """Отрезок времени внутри трейса; используется как контекстный менеджер"""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "error",
+        "_token",
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error: Optional[str] = None
+        self._token = None
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def start(self) -> "Span":
+        self.start_ns = time.time_ns()
+        return self
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        tracer.submit(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self.start())
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current_span.reset(self._token)
+        self.end(exc)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    def set(self, key: str, value) -> None: ...
+
+    def start(self) -> "_NoopSpan":
+        return self
+
+    def end(self, error: Optional[BaseException] = None) -> None: ...
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *args) -> None: ...
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonlSpanExporter:
+    def __init__(self, path: Path):
+        self.path = path
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for item in spans:
+                f.write(json.dumps(item.to_dict(), ensure_ascii=False) + "\n")
+
+
+class OtlpSpanExporter:
+    """Отправляет спаны коллектору по OTLP/HTTP в JSON-кодировке"""
+
+    def __init__(self, endpoint: str = "http://127.0.0.1:4318/v1/traces"):
+        self.endpoint = endpoint
+
+    @staticmethod
+    def _attributes(attributes: dict) -> list:
+        result = []
+        for key, value in attributes.items():
+            if isinstance(value, bool):
+                encoded = {"boolValue": value}
+            elif isinstance(value, int):
+                encoded = {"intValue": str(value)}
+            elif isinstance(value, float):
+                encoded = {"doubleValue": value}
+            else:
+                encoded = {"stringValue": str(value)}
+            result.append({"key": key, "value": encoded})
+        return result
+
+    def _span(self, item: Span) -> dict:
+        encoded = {
+            "traceId": item.trace_id,
+            "spanId": item.span_id,
+            "name": item.name,
+            "kind": 1,
+            "startTimeUnixNano": str(item.start_ns),
+            "endTimeUnixNano": str(item.end_ns),
+            "attributes": self._attributes(item.attributes),
+        }
+        if item.parent_id:
+            encoded["parentSpanId"] = item.parent_id
+        if item.error:
+            encoded["status"] = {"code": 2, "message": item.error}
+        return encoded
+
+    def export(self, spans: List[Span]) -> None:
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": self._attributes({"service.name": SERVICE_NAME})
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "boosty_downloader"},
+                            "spans": [self._span(item) for item in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=5):
+            pass
+
+
+class Tracer:
+    """
+    Собирает завершенные спаны и выгружает их пачками в фоновом потоке,
+    чтобы запись файла или запросы к коллектору не блокировали event loop.
+    Пока экспортеры не заданы, span() возвращает пустышку.
+    """
+
+    def __init__(self, batch_size: int = 256, flush_interval: float = 1.0):
+        self.exporters: list = []
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._worker: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    def configure(self, exporters: Iterable) -> None:
+        self.exporters = list(exporters)
+        if self.exporters and self._worker is None:
+            self._worker = threading.Thread(
+                target=self._run, name="span-exporter", daemon=True
+            )
+            self._worker.start()
+            atexit.register(self.shutdown)
+
+    def submit(self, item: Span) -> None:
+        self._queue.put(item)
+
+    def _export(self, batch: List[Span]) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(batch)
+            except Exception as e:
+                logger.error(f"Failed export {len(batch)} spans", exc_info=e)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._export(batch)
+
+    def shutdown(self) -> None:
+        if self._worker is None:
+            return
+        self._queue.put(None)
+        self._worker.join(timeout=10)
+        self._worker = None
+        # Спаны, завершенные после сигнала остановки
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                batch.append(item)
+        if batch:
+            self._export(batch)
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attributes):
+    """Дочерний спан текущего; корневой, если активного спана нет"""
+    if not tracer.exporters:
+        return NOOP_SPAN
+    return Span(name, _current_span.get(), attributes)
+
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+
+def configure_tracing(
+    jsonl_path: Optional[Path] = None, otlp_endpoint: Optional[str] = None
+) -> None:
+    exporters = []
+    if jsonl_path:
+        exporters.append(JsonlSpanExporter(jsonl_path))
+        logger.info(f"Writing tracing spans to {jsonl_path}")
+    if otlp_endpoint:
+        exporters.append(OtlpSpanExporter(otlp_endpoint))
+        logger.info(f"Exporting tracing spans to {otlp_endpoint}")
+    tracer.configure(exporters)
+
+
+async def _on_connection_create_start(session, context: SimpleNamespace, params):
+    context.connect_span = span("connect")
+    context.connect_span.start()
+
+
+async def _on_connection_create_end(session, context: SimpleNamespace, params):
+    context.connect_span.end()
+
+
+async def _on_dns_resolvehost_start(session, context: SimpleNamespace, params):
+    context.dns_span = span("dns", host=params.host)
+    context.dns_span.start()
+
+
+async def _on_dns_resolvehost_end(session, context: SimpleNamespace, params):
+    context.dns_span.end()
+
+
+def add_tracing_hooks(trace_config: TraceConfig) -> TraceConfig:
+    """Спаны установки соединения и DNS внутри текущего спана запроса"""
+    trace_config.on_connection_create_start.append(_on_connection_create_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_dns_resolvehost_start.append(_on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(_on_dns_resolvehost_end)
+    return trace_config
+
+
+def load_spans(path: Path) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def to_chrome_trace(spans: List[dict]) -> dict:
+    """Формат Trace Event для chrome://tracing и Perfetto: трейс на дорожку"""
+    lanes = {}
+    events = []
+    for item in sorted(spans, key=lambda s: s["start_ns"]):
+        lane = lanes.setdefault(item["trace_id"], len(lanes) + 1)
+        args = dict(item["attributes"])
+        if item.get("error"):
+            args["error"] = item["error"]
+        events.append(
+            {
+                "name": item["name"],
+                "ph": "X",
+                "ts": item["start_ns"] / 1000,
+                "dur": (item["end_ns"] - item["start_ns"]) / 1000,
+                "pid": 1,
+                "tid": lane,
+                "args": args,
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -6,7 +6,10 @@ from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
 import flet as ft
 
 from core.defs.common import PostInfo, DownloadingSettingsDto
-from core.logger import setup_logger
+from core.disk_writer import FSYNC_POLICIES
+from core.draftjs_converter import TEXT_FORMATS
+from core.logger import LOG_LEVELS, setup_logger
+from core.scheduler import SCHEDULING_POLICIES
 
 logger = setup_logger()
 
@@ -184,6 +187,12 @@ async def get_download_settings() -> Optional[DownloadingSettingsDto]:
     else:
         need_download_files = False
 
+    need_save_raw_post = await ft.SharedPreferences().get("need-save-raw-post")
+    if need_save_raw_post == "True" or need_save_raw_post is None:
+        need_save_raw_post = True
+    else:
+        need_save_raw_post = False
+
     chunk_size = int(await ft.SharedPreferences().get("download-chunk-size") or 153600)
     if chunk_size < 1500:
         chunk_size = 1500
@@ -198,6 +207,8 @@ async def get_download_settings() -> Optional[DownloadingSettingsDto]:
         await ft.SharedPreferences().get("preferred-video-size") or "ultra_hd"
     )
     post_text_format = await ft.SharedPreferences().get("post-text-format") or "raw"
+    if not all(fmt in TEXT_FORMATS for fmt in post_text_format.split(",")):
+        post_text_format = "raw"
     max_parallelism = int(
         await ft.SharedPreferences().get("download-max-parallelism") or 5
     )
@@ -205,16 +216,69 @@ async def get_download_settings() -> Optional[DownloadingSettingsDto]:
         max_parallelism = 1
     elif max_parallelism > 30:
         max_parallelism = 30
+    metrics_port = int(await ft.SharedPreferences().get("metrics-port") or 0)
+    if not 1024 <= metrics_port <= 65535:
+        metrics_port = None
+    metrics_snapshot = await ft.SharedPreferences().get("metrics-snapshot") == "True"
+    tracing = await ft.SharedPreferences().get("tracing-enabled") == "True"
+    otlp_endpoint = await ft.SharedPreferences().get("tracing-otlp-endpoint") or None
+    log_level = await ft.SharedPreferences().get("log-level") or "DEBUG"
+    if log_level not in LOG_LEVELS:
+        log_level = "DEBUG"
+    write_buffer_size = int(
+        await ft.SharedPreferences().get("write-buffer-size") or 1024 * 1024
+    )
+    if write_buffer_size < 64 * 1024:
+        write_buffer_size = 64 * 1024
+    elif write_buffer_size > 16 * 1024 * 1024:
+        write_buffer_size = 16 * 1024 * 1024
+    preallocate_files = await ft.SharedPreferences().get("preallocate-files") == "True"
+    chunk_size_auto = await ft.SharedPreferences().get("chunk-size-auto") == "True"
+    receive_buffer_pool = (
+        await ft.SharedPreferences().get("receive-buffer-pool") == "True"
+    )
+    disk_space_margin = int(
+        await ft.SharedPreferences().get("disk-space-margin") or 512 * 1024 * 1024
+    )
+    if disk_space_margin < 0:
+        disk_space_margin = 0
+    scheduling_policy = await ft.SharedPreferences().get("scheduling-policy") or "fifo"
+    if scheduling_policy not in SCHEDULING_POLICIES:
+        scheduling_policy = "fifo"
+    fsync_policy = await ft.SharedPreferences().get("fsync-policy") or "never"
+    if fsync_policy not in FSYNC_POLICIES:
+        fsync_policy = "never"
 
     return DownloadingSettingsDto(
         need_download_photos=need_download_photos,
         need_download_videos=need_download_videos,
         need_download_audios=need_download_audios,
         need_download_files=need_download_files,
+        need_save_raw_post=need_save_raw_post,
         chunk_size=chunk_size,
         download_timeout=download_timeout,
         preferred_video_size=preferred_video_size,
         post_text_format=post_text_format,
         downloads_folder=downloads_folder,
         max_parallelism=max_parallelism,
+        metrics_port=metrics_port,
+        metrics_snapshot=metrics_snapshot,
+        tracing=tracing,
+        otlp_endpoint=otlp_endpoint,
+        log_level=log_level,
+        write_buffer_size=write_buffer_size,
+        preallocate_files=preallocate_files,
+        fsync_policy=fsync_policy,
+        chunk_size_auto=chunk_size_auto,
+        receive_buffer_pool=receive_buffer_pool,
+        disk_space_margin=disk_space_margin,
+        scheduling_policy=scheduling_policy,
     )
+
+
+def signature_expires(qs: str) -> Optional[int]:
+    """Время истечения подписи (unix) из signedQuery, если оно указано"""
+    expires = dict(parse_qsl(qs.lstrip("?"))).get("expires")
+    if expires and expires.isdigit():
+        return int(expires)
+    return None
@@ -0,0 +1,277 @@
+import asyncio
+import contextvars
+import functools
+import itertools
+import math
+from collections import deque
+from typing import (
+    TYPE_CHECKING,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from core.logger import setup_logger
+from core.metrics import registry
+from core.scheduler import FifoPolicy, SchedulingPolicy, Waiter, create_policy
+
+if TYPE_CHECKING:
+    from core.task import Task
+
+logger = setup_logger()
+
+LANE_SMALL = "small"
+LANE_LARGE = "large"
+SMALL_FILE_SIZE = 8 * 1024 * 1024
+
+FILE_QUEUE_DEPTH = registry.gauge(
+    "boosty_file_queue_items", "Files waiting for a download worker", ("lane",)
+)
+FILE_QUEUE_STEALS = registry.counter(
+    "boosty_file_queue_steals_total",
+    "Files taken by a worker from the other lane",
+    ("lane",),
+)
+FILE_WORKERS_BUSY = registry.gauge(
+    "boosty_file_workers_busy", "Download workers transferring a file"
+)
+
+# Загрузка файла. Может вернуть продолжение: ожидание, которому не нужен
+# воркер (например, чужой загрузки того же файла) - воркер сразу свободен
+FileJob = Callable[[], Awaitable[Optional[Awaitable[None]]]]
+
+
+class FileWorkItem:
+    __slots__ = ("batch", "size", "job", "context", "running")
+
+    def __init__(self, batch: "FileBatch", size: int, job: FileJob):
+        self.batch = batch
+        self.size = size
+        self.job = job
+        # Спаны трассировки файла остаются вложенными в спан задачи
+        self.context = contextvars.copy_context()
+        self.running: Optional[asyncio.Task] = None
+
+
+class FileBatch(Waiter):
+    """
+    Файлы одного поста в общей очереди. Пост завершен, когда завершены все
+    его файлы; первая ошибка снимает остальные файлы поста с очереди.
+    """
+
+    def __init__(self, queue: "FileWorkQueue", task: "Task", order: int):
+        self.task = task
+        self.order = order
+        self.pending = 0  # в очереди и в работе
+        self.queued = 0
+        self.queued_bytes = 0
+        self.items: List[FileWorkItem] = []
+        self._queue = queue
+        self._done = asyncio.get_running_loop().create_future()
+
+    @property
+    def running(self) -> int:
+        return self.pending - self.queued
+
+    @property
+    def expected_bytes(self) -> int:
+        """Объем файлов поста, еще ждущих воркера"""
+        return self.queued_bytes
+
+    def _finish_item(self, error: Optional[BaseException]) -> None:
+        self.pending -= 1
+        if self._done.done():
+            return
+        if isinstance(error, asyncio.CancelledError):
+            self._done.cancel()
+        elif error is not None:
+            self._done.set_exception(error)
+            self.cancel()
+        elif self.pending == 0:
+            self._done.set_result(None)
+
+    async def wait(self) -> None:
+        """Ждет все файлы поста; при отмене снимает их с очереди"""
+        if not self.pending and not self._done.done():
+            self._done.set_result(None)
+        try:
+            await asyncio.shield(self._done)
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+
+    def cancel(self) -> None:
+        self._queue._remove(self)
+        for item in self.items:
+            if item.running is not None:
+                item.running.cancel()
+
+
+class Lane:
+    """
+    Очередь файлов одного размера, по постам. Воркер берет следующий файл
+    поста с наибольшим приоритетом, среди равных пост выбирает политика
+    очереди, внутри поста файлы идут по порядку.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._batches: Dict[FileBatch, Deque[FileWorkItem]] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, item: FileWorkItem) -> None:
+        self._batches.setdefault(item.batch, deque()).append(item)
+        self._size += 1
+        FILE_QUEUE_DEPTH.set(self._size, self.name)
+
+    def pop(self, policy: SchedulingPolicy) -> Optional[FileWorkItem]:
+        if not self._size:
+            return None
+        # Приоритет читается при каждом выборе: перенос поста наверх
+        # действует и на уже поставленные в очередь файлы
+        top = max(batch.task.priority for batch in self._batches)
+        batch = policy.select(
+            [batch for batch in self._batches if batch.task.priority == top]
+        )
+        items = self._batches[batch]
+        item = items.popleft()
+        if not items:
+            del self._batches[batch]
+        self._size -= 1
+        FILE_QUEUE_DEPTH.set(self._size, self.name)
+        return item
+
+    def remove(self, batch: FileBatch) -> List[FileWorkItem]:
+        removed = list(self._batches.pop(batch, ()))
+        self._size -= len(removed)
+        FILE_QUEUE_DEPTH.set(self._size, self.name)
+        return removed
+
+
+class FileWorkQueue:
+    """
+    Общая очередь файлов всех постов. Файлы до small_size идут в малую
+    очередь, остальные в большую; половина воркеров берет сначала малые
+    файлы, половина - большие, а своя очередь пуста, воркер забирает работу
+    из чужой. Так большие видео не занимают все соединения, пока ждут
+    картинки, и наоборот. Пост, чей файл передается следующим, выбирает
+    политика очереди загрузок. После каждого файла воркер выдерживает pause.
+    """
+
+    def __init__(
+        self,
+        workers: int = 5,
+        small_size: int = SMALL_FILE_SIZE,
+        pause: float = 0.1,
+        policy: str = FifoPolicy.name,
+    ):
+        self.workers = workers
+        self.small_size = small_size
+        self.pause = pause
+        self.policy: SchedulingPolicy = create_policy(policy) or FifoPolicy()
+        self._lanes = {LANE_SMALL: Lane(LANE_SMALL), LANE_LARGE: Lane(LANE_LARGE)}
+        self._available = asyncio.Event()
+        self._workers: Set[asyncio.Task] = set()
+        self._seq = itertools.count()
+
+    def _ensure_workers(self) -> None:
+        if self._workers:
+            return
+        small_workers = math.ceil(self.workers / 2)
+        for i in range(self.workers):
+            own = LANE_SMALL if i < small_workers else LANE_LARGE
+            other = LANE_LARGE if own == LANE_SMALL else LANE_SMALL
+            self._workers.add(asyncio.create_task(self._work(own, other)))
+
+    def set_policy(self, name: str) -> None:
+        if name == self.policy.name:
+            return
+        policy = create_policy(name)
+        if policy is not None:
+            self.policy = policy
+
+    def submit(self, task: "Task", jobs: List[Tuple[int, FileJob]]) -> FileBatch:
+        """Ставит файлы поста (размер, загрузка) в очередь"""
+        self._ensure_workers()
+        batch = FileBatch(self, task, next(self._seq))
+        for size, job in jobs:
+            item = FileWorkItem(batch, size, job)
+            batch.items.append(item)
+            batch.pending += 1
+            batch.queued += 1
+            batch.queued_bytes += size
+            lane = LANE_SMALL if size < self.small_size else LANE_LARGE
+            self._lanes[lane].push(item)
+        if jobs:
+            self._available.set()
+        return batch
+
+    def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        self._workers.clear()
+
+    def _remove(self, batch: FileBatch) -> None:
+        for lane in self._lanes.values():
+            for item in lane.remove(batch):
+                batch.pending -= 1
+                batch.queued -= 1
+                batch.queued_bytes -= item.size
+
+    def _take(self, own: str, other: str) -> Optional[FileWorkItem]:
+        item = self._lanes[own].pop(self.policy)
+        if item is None:
+            item = self._lanes[other].pop(self.policy)
+            if item is not None:
+                FILE_QUEUE_STEALS.inc(1, own)
+        if item is not None:
+            item.batch.queued -= 1
+            item.batch.queued_bytes -= item.size
+        if not any(self._lanes.values()):
+            self._available.clear()
+        return item
+
+    async def _work(self, own: str, other: str) -> None:
+        while True:
+            item = self._take(own, other)
+            if item is None:
+                await self._available.wait()
+                continue
+            FILE_WORKERS_BUSY.inc()
+            item.running = asyncio.create_task(item.job(), context=item.context)
+            try:
+                await asyncio.wait((item.running,))
+            except asyncio.CancelledError:
+                item.running.cancel()
+                raise
+            finally:
+                FILE_WORKERS_BUSY.dec()
+            running = item.running
+            if not running.cancelled() and running.exception() is None:
+                continuation = running.result()
+                if continuation is not None:
+                    item.running = asyncio.ensure_future(continuation)
+                    item.running.add_done_callback(
+                        functools.partial(self._finish, item)
+                    )
+                    continue
+            self._finish(item, running)
+            if self.pause:
+                await asyncio.sleep(self.pause)
+
+    @staticmethod
+    def _finish(item: FileWorkItem, running: asyncio.Future) -> None:
+        if running.cancelled():
+            error: Optional[BaseException] = asyncio.CancelledError()
+        else:
+            error = running.exception()
+        item.running = None
+        item.batch._finish_item(error)
@@ -1,11 +1,19 @@
 import asyncio
+import multiprocessing
+from pathlib import Path
 
 import flet as ft
 
 import __version__ as app_version
 from core.downloads_manager import DownloadManager
-from core.logger import setup_logger
+from core.http_pool import http_pool
+from core.logger import set_log_level, setup_logger
+from core.loop_monitor import loop_monitor
+from core.metrics import METRICS_SNAPSHOT_FILE, MetricsExporter
+from core.tracing import TRACES_FILE, configure_tracing
+from core.utils import get_download_settings
 from pages.auth_management import AuthManagementPage
+from pages.diagnostics import DiagnosticsPage
 from pages.download_image_by_link import DownloadImageByLinkPage
 from pages.download_post import DownloadPostPage
 from pages.download_several_posts import DownloadSeveralPostsPage
@@ -28,6 +36,22 @@ async def main(page: ft.Page):
     page.window.min_height = 500
 
     manager = DownloadManager()
+    exporter = None
+    settings = await get_download_settings()
+    if settings:
+        set_log_level(settings.log_level)
+    if settings and (settings.tracing or settings.otlp_endpoint):
+        configure_tracing(
+            jsonl_path=Path(TRACES_FILE) if settings.tracing else None,
+            otlp_endpoint=settings.otlp_endpoint,
+        )
+    if settings and (settings.metrics_port or settings.metrics_snapshot):
+        exporter = MetricsExporter(
+            port=settings.metrics_port,
+            snapshot_path=(
+                Path(METRICS_SNAPSHOT_FILE) if settings.metrics_snapshot else None
+            ),
+        )
 
     def route_change(e):
         page.views.clear()
@@ -51,6 +75,8 @@ async def main(page: ft.Page):
                 page.views.append(DownloadImageByLinkPage(manager))
             case "/feedback-and-bugs":
                 page.views.append(FeedbackAndBugsPage(manager))
+            case "/diagnostics":
+                page.views.append(DiagnosticsPage(manager))
 
         page.update()
 
@@ -59,6 +85,13 @@ async def main(page: ft.Page):
 
     logger.info("Router is set up, starting task manager...")
 
+    async def close_app():
+        loop_monitor.stop()
+        if exporter:
+            await exporter.stop()
+        await http_pool.close()
+        await page.window.destroy()
+
     async def check_active_downloads_on_close():
         if await manager.get_active_tasks_count() > 0:
             page.show_dialog(
@@ -69,9 +102,7 @@ async def main(page: ft.Page):
                         ft.TextButton("No", on_click=lambda e: page.pop_dialog()),
                         ft.TextButton(
                             "Yes",
-                            on_click=lambda e: asyncio.create_task(
-                                page.window.destroy()
-                            ),
+                            on_click=lambda e: asyncio.create_task(close_app()),
                         ),
                     ],
                     open=True,
@@ -79,7 +110,7 @@ async def main(page: ft.Page):
             )
             page.update()
         else:
-            await page.window.destroy()
+            await close_app()
 
     def window_event(e: ft.WindowEvent):
         if e.type == ft.WindowEventType.CLOSE:
@@ -90,9 +121,17 @@ async def main(page: ft.Page):
 
     asyncio.create_task(manager.mainloop())
     logger.info("Task manager started")
+    loop_monitor.start()
+
+    if exporter:
+        try:
+            await exporter.start()
+        except Exception as e:
+            logger.error("Failed start metrics exporter", exc_info=e)
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     logger = setup_logger()
     logger.info(f"Starting {app_version.NAME} v{app_version.VERSION}...")
     try:
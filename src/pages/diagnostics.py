@@ -0,0 +1,237 @@
+import asyncio
+import datetime
+
+import flet as ft
+
+import components
+from core.downloads_manager import DownloadManager
+from core.host_gate import STATE_CLOSED, host_gate
+from core.http_pool import http_pool
+from core.loop_monitor import loop_monitor
+from core.profiler import PROFILE_DURATIONS, profiler
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f} ms"
+
+
+def _site_summary(site) -> str:
+    return (
+        f"{site.count} times · total {_ms(site.total_time)} · max {_ms(site.max_time)}"
+    )
+
+
+def _breaker_line(status) -> str:
+    line = (
+        f"{status.host:<30} {status.kind:<5} {status.active:>3}/{status.limit:<3}"
+        f" {status.waiting:>4} waiting  {status.state}"
+    )
+    if status.state != STATE_CLOSED:
+        line += f", retry in {status.retry_in:.0f} s"
+    elif status.failures:
+        line += f", {status.failures} failures in a row"
+    return line
+
+
+class DiagnosticsPage(ft.View):
+    def __init__(self, manager: DownloadManager):
+        super().__init__()
+        self.route = "/diagnostics"
+        self.manager = manager
+        self.alive = True
+
+        self.lag_line = ft.ListTile(
+            leading=ft.Icon(ft.Icons.MONITOR_HEART),
+            title="Event loop lag",
+        )
+        self.profile_duration = ft.Dropdown(
+            label="Duration",
+            width=130,
+            value=str(PROFILE_DURATIONS[1]),
+            options=[
+                ft.dropdown.Option(key=str(d), text=f"{d} s") for d in PROFILE_DURATIONS
+            ],
+        )
+        self.profile_button = ft.Button(
+            "Capture profile",
+            icon=ft.Icons.TIMER,
+            height=45,
+            on_click=self.capture_profile,
+        )
+        self.profile_status = ft.Text("", selectable=True)
+        self.sites_view = ft.Column(spacing=5)
+        self.recent_text = ft.Text("", selectable=True, font_family="monospace")
+        self.hosts_text = ft.Text("", selectable=True, font_family="monospace")
+        self.breakers_text = ft.Text("", selectable=True, font_family="monospace")
+        self.controls = [
+            components.AppBar(manager),
+            ft.Row(
+                controls=[
+                    ft.IconButton(
+                        ft.Icon(ft.Icons.ARROW_BACK), on_click=self.go_to_index
+                    ),
+                    ft.Text("Diagnostics", size=24, weight=ft.FontWeight.BOLD),
+                ]
+            ),
+            ft.Card(
+                shadow_color=ft.Colors.ON_SURFACE_VARIANT,
+                content=ft.Container(
+                    padding=10,
+                    content=ft.Row(
+                        [
+                            ft.Container(self.lag_line, expand=True),
+                            ft.TextButton(
+                                "Reset",
+                                icon=ft.Icons.DELETE_SWEEP,
+                                on_click=self.reset,
+                            ),
+                        ]
+                    ),
+                ),
+            ),
+            ft.ListView(
+                expand=True,
+                spacing=10,
+                controls=[
+                    ft.Text(
+                        "Profile the running app, including all downloads. "
+                        "Files are saved to the logs folder.",
+                        weight=ft.FontWeight.BOLD,
+                    ),
+                    ft.Row(
+                        [self.profile_duration, self.profile_button],
+                        vertical_alignment=ft.CrossAxisAlignment.CENTER,
+                    ),
+                    self.profile_status,
+                    ft.Text(
+                        f"Code that blocked the event loop for more than "
+                        f"{_ms(loop_monitor.threshold)}, by total time:",
+                        weight=ft.FontWeight.BOLD,
+                    ),
+                    self.sites_view,
+                    ft.Text("Recent blocks:", weight=ft.FontWeight.BOLD),
+                    ft.Container(
+                        self.recent_text,
+                        bgcolor=ft.Colors.SURFACE_CONTAINER,
+                        border_radius=5,
+                        padding=10,
+                    ),
+                    ft.Text(
+                        "Connections by host (opened, reused from the pool, "
+                        "average time to open):",
+                        weight=ft.FontWeight.BOLD,
+                    ),
+                    ft.Container(
+                        self.hosts_text,
+                        bgcolor=ft.Colors.SURFACE_CONTAINER,
+                        border_radius=5,
+                        padding=10,
+                    ),
+                    ft.Text(
+                        "Request limits and circuit breakers by host:",
+                        weight=ft.FontWeight.BOLD,
+                    ),
+                    ft.Container(
+                        self.breakers_text,
+                        bgcolor=ft.Colors.SURFACE_CONTAINER,
+                        border_radius=5,
+                        padding=10,
+                    ),
+                ],
+            ),
+        ]
+        self.upd_task = asyncio.create_task(self.update_task())
+
+    async def go_to_index(self):
+        self.on_destroy()
+        await self.page.push_route("/")
+
+    def will_unmount(self):
+        self.on_destroy()
+
+    def on_destroy(self):
+        self.alive = False
+        self.upd_task.cancel()
+
+    def reset(self):
+        loop_monitor.reset()
+
+    async def capture_profile(self):
+        if profiler.running:
+            return
+        duration = int(self.profile_duration.value)
+        self.profile_button.disabled = True
+        self.profile_status.value = f"Profiling for {duration} s..."
+        self.update()
+        try:
+            result = await profiler.run(duration)
+            self.profile_status.value = "Saved:\n" + "\n".join(
+                str(path) for path in result.files
+            )
+        except Exception as e:
+            self.profile_status.value = f"Profiling failed: {e}"
+        self.profile_button.disabled = False
+        if self.alive:
+            self.update()
+
+    def _site_tile(self, site) -> ft.Control:
+        return ft.ExpansionTile(
+            title=ft.Text(site.site, font_family="monospace"),
+            subtitle=ft.Text(_site_summary(site)),
+            controls=[
+                ft.Container(
+                    ft.Text(
+                        "\n".join(site.stack), selectable=True, font_family="monospace"
+                    ),
+                    bgcolor=ft.Colors.SURFACE_CONTAINER,
+                    border_radius=5,
+                    padding=10,
+                )
+            ],
+        )
+
+    async def update_task(self):
+        while self.alive:
+            if loop_monitor.running:
+                lag = loop_monitor.lag_stats()
+                self.lag_line.title = (
+                    f"Event loop lag: now {_ms(lag['current'])} · p50 {_ms(lag['p50'])}"
+                    f" · p99 {_ms(lag['p99'])} · max {_ms(lag['max'])} (last minute)"
+                )
+            else:
+                self.lag_line.title = "Event loop monitor is not running"
+            sites = loop_monitor.top_sites()
+            # Раскрытые плитки не пересоздаются, пока список мест не изменился
+            if [c.data for c in self.sites_view.controls] != [s.site for s in sites]:
+                self.sites_view.controls = []
+                for site in sites:
+                    tile = self._site_tile(site)
+                    tile.data = site.site
+                    self.sites_view.controls.append(tile)
+            else:
+                for tile, site in zip(self.sites_view.controls, sites):
+                    tile.subtitle.value = _site_summary(site)
+                    tile.controls[0].content.value = "\n".join(site.stack)
+            if not sites:
+                self.sites_view.controls = [ft.Text("Nothing recorded yet")]
+            self.recent_text.value = (
+                "\n".join(
+                    f"{datetime.datetime.fromtimestamp(item['time']):%H:%M:%S} "
+                    f"{_ms(item['duration']):>8} {item['site']}"
+                    for item in reversed(loop_monitor.recent_blocks())
+                )
+                or "-"
+            )
+            self.hosts_text.value = (
+                "\n".join(
+                    f"{item.host:<30} {item.opened:>6} opened {item.reused:>8} reused"
+                    f" {_ms(item.handshake) if item.handshake is not None else '-':>8}"
+                    for item in http_pool.host_stats()
+                )
+                or "-"
+            )
+            self.breakers_text.value = (
+                "\n".join(map(_breaker_line, host_gate.status())) or "-"
+            )
+            self.update()
+            await asyncio.sleep(1)
@@ -8,6 +8,7 @@ from components.paginator import Paginator
 from components.task_item import TaskItem
 from core.defs.tasks import TaskInfo
 from core.downloads_manager import DownloadManager
+from core.progress_counter import format_eta, format_size, format_speed
 
 
 class DownloadsCenterPage(ft.View):
@@ -22,7 +23,11 @@ class DownloadsCenterPage(ft.View):
         self.alive = True
         for i in range(self.count_slots):
             self.slots.append(
-                TaskItem(on_cancel=self.on_task_cancel, on_retry=self.on_task_retry)
+                TaskItem(
+                    on_cancel=self.on_task_cancel,
+                    on_retry=self.on_task_retry,
+                    on_move_top=self.on_task_move_top,
+                )
             )
 
         self.list_view.controls = self.slots
@@ -34,9 +39,11 @@ class DownloadsCenterPage(ft.View):
             bgcolor=ft.Colors.ON_SURFACE_VARIANT,
             on_click=self.on_all_tasks_cancel,
         )
+        self.space_line = ft.Text("", color=ft.Colors.SECONDARY, visible=False)
         self.status_line = ft.ListTile(
             leading=ft.Icon(ft.Icons.DOWNLOADING),
             title="In progress: 0 / 0",
+            subtitle=self.space_line,
             trailing=self.stop_all_button,
         )
 
@@ -99,6 +106,10 @@ class DownloadsCenterPage(ft.View):
         if task_info:
             await self.manager.retry_task(task_info.post_id)
 
+    async def on_task_move_top(self, task_info: Optional[TaskInfo]):
+        if task_info:
+            await self.manager.move_to_top(task_info.post_id)
+
     async def update_task(self):
         while self.alive:
             tasks = await self.manager.get_tasks(
@@ -111,9 +122,24 @@ class DownloadsCenterPage(ft.View):
             active_total = await self.manager.get_active_tasks_count()
             self.status_line.title = f"In progress: {pending} / {active_total}"
             if pending > 0:
+                speed, eta = await self.manager.get_throughput()
+                self.status_line.title += (
+                    f" · {format_speed(speed)} · ETA {format_eta(eta)}"
+                )
                 self.stop_all_button.visible = True
             else:
                 self.stop_all_button.visible = False
+            space = self.manager.get_space_status()
+            self.space_line.visible = bool(space.reserved or space.waiting)
+            if self.space_line.visible:
+                self.space_line.value = f"Disk: {format_size(space.reserved)} reserved"
+                if space.free is not None:
+                    self.space_line.value += f" · {format_size(space.free)} free"
+                if space.waiting:
+                    self.space_line.value += (
+                        f" · {space.waiting} waiting for space"
+                        f" (keeping {format_size(space.margin)} free)"
+                    )
             for slot_no in range(self.count_slots):
                 if slot_no <= len(tasks) - 1:
                     self.slots[slot_no].update_view(tasks[slot_no], visible=True)
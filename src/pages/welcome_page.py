@@ -129,6 +129,15 @@ class WelcomePage(ft.View):
                                     ),
                                     on_click=self.go_to_media_downloader,
                                 ),
+                                ft.PopupMenuItem(
+                                    content=ft.Row(
+                                        [
+                                            ft.Icon(ft.Icons.MONITOR_HEART),
+                                            ft.Text("Diagnostics"),
+                                        ]
+                                    ),
+                                    on_click=self.go_to_diagnostics,
+                                ),
                             ],
                             menu_position=ft.PopupMenuPosition.UNDER,
                         ),
@@ -151,3 +160,6 @@ class WelcomePage(ft.View):
 
     async def go_to_feedback(self):
         await self.page.push_route("/feedback-and-bugs")
+
+    async def go_to_diagnostics(self):
+        await self.page.push_route("/diagnostics")
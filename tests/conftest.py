@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Модули приложения импортируются от src, как при запуске main.py и cli.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
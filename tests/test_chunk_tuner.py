@@ -0,0 +1,68 @@
+from core.chunk_tuner import ChunkTuner
+
+KB = 1024
+
+
+def _tuner() -> ChunkTuner:
+    # Окно по числу чтений: результат не зависит от скорости машины
+    return ChunkTuner(16 * KB, 1024 * KB, 64 * KB, window=3600, window_reads=4)
+
+
+def _fast(tuner: ChunkTuner, windows: int = 1) -> None:
+    for _ in range(4 * windows):
+        tuner.observe(tuner.size)
+
+
+def test_transfers_tune_independently():
+    task = _tuner()
+    fast = task.for_transfer()
+    fast.observe(fast.size)
+    fast.observe(fast.size)
+    # Новая передача той же задачи не сбрасывает окно идущей
+    task.for_transfer()
+    fast.observe(fast.size)
+    fast.observe(fast.size)
+    assert fast.size == 128 * KB
+
+
+def test_transfers_do_not_mix_bytes():
+    task = _tuner()
+    fast, slow = task.for_transfer(), task.for_transfer()
+    for _ in range(4):
+        fast.observe(fast.size)
+        slow.observe(KB)
+    # Недобранные чтения медленной передачи не мешают росту быстрой
+    assert fast.size == 128 * KB
+    assert slow.size == 64 * KB
+
+
+def test_next_transfer_starts_from_last_size():
+    task = _tuner()
+    _fast(task.for_transfer(), windows=2)
+    assert task.for_transfer().size == 256 * KB
+
+
+def test_fast_transfer_grows_up_to_max():
+    tuner = _tuner()
+    _fast(tuner, windows=10)
+    assert tuner.size == 1024 * KB
+
+
+def test_slow_transfer_shrinks_down_to_min(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("core.chunk_tuner.time.monotonic", lambda: now[0])
+    tuner = ChunkTuner(16 * KB, 1024 * KB, 64 * KB, window=1, window_reads=1000)
+    sizes = []
+    for _ in range(3):
+        # 20 KB/s: за target_interval приходит 1 KB, много меньше размера чтения
+        now[0] += 1
+        sizes.append(tuner.observe(20 * KB))
+    assert sizes == [32 * KB, 16 * KB, 16 * KB]
+
+
+def test_short_reads_do_not_grow_size():
+    tuner = _tuner()
+    for _ in range(8):
+        # Данные не ждали в буфере: чтения возвращают меньше запрошенного
+        tuner.observe(tuner.size // 2)
+    assert tuner.size == 64 * KB
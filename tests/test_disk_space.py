@@ -0,0 +1,46 @@
+import asyncio
+from types import SimpleNamespace
+
+import core.task as task_module
+from core.defs.tasks import TaskError
+from core.disk_space import DiskSpaceAdmission
+from core.task import Task
+
+FREE = 100
+MARGIN = 10
+
+
+def _admission(monkeypatch) -> DiskSpaceAdmission:
+    """Допуск задач на томе со FREE свободных байт, вместо общего"""
+    admission = DiskSpaceAdmission(poll_interval=60)
+    monkeypatch.setattr(admission, "_stat_volume", lambda folder: (1, FREE))
+    monkeypatch.setattr(task_module, "disk_space", admission)
+    return admission
+
+
+def test_waiting_task_gets_no_disk_space_when_it_never_fits(tmp_path, monkeypatch):
+    admission = _admission(monkeypatch)
+    task = SimpleNamespace(post_id="post", _waiting_space=False)
+    prepared = SimpleNamespace(
+        downloads_folder=tmp_path,
+        settings=SimpleNamespace(disk_space_margin=MARGIN),
+    )
+
+    async def run():
+        other = await admission.try_reserve(tmp_path, 80, MARGIN)
+        # Вместе с чужим резервом не помещается: задача ждет
+        waiting = asyncio.create_task(
+            Task._reserve_and_transfer(task, prepared, 95, None)
+        )
+        while not admission._waiters:
+            await asyncio.sleep(0.01)
+        assert task._waiting_space
+        assert not waiting.done()
+        # Чужой резерв снят, но и на пустом томе задача не помещается
+        other.release()
+        return await asyncio.wait_for(waiting, 5)
+
+    assert asyncio.run(run()) == TaskError.NO_DISK_SPACE
+    assert not task._waiting_space
+    assert admission.status().waiting == 0
+    assert admission.reserved == 0
@@ -0,0 +1,147 @@
+import asyncio
+import errno
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from core.buffer_pool import BufferPool
+from core.disk_writer import DiskWriter, FileWriter, WriteOptions
+
+CHUNK = 64 * 1024
+
+
+def _data(n: int) -> bytes:
+    return bytes(i % 251 for i in range(n))
+
+
+def test_failed_write_leaves_resumable_part(tmp_path: Path, monkeypatch):
+    path = tmp_path / "video.mp4.part"
+    data = _data(CHUNK * 4)
+    write = FileWriter._write
+    calls = []
+
+    def failing_write(self, chunk):
+        calls.append(len(chunk))
+        if len(calls) == 2:
+            raise OSError(errno.ENOSPC, "No space left on device")
+        return write(self, chunk)
+
+    monkeypatch.setattr(FileWriter, "_write", failing_write)
+    options = WriteOptions(buffer_size=CHUNK, preallocate=True)
+
+    async def run():
+        writer = DiskWriter(workers=2)
+        with pytest.raises(OSError):
+            async with writer.open(path, len(data), options) as f:
+                for offset in range(0, len(data), CHUNK):
+                    await f.write(data[offset : offset + CHUNK])
+        return f.written
+
+    written = asyncio.run(run())
+    # Предвыделенные нули не должны выглядеть как скачанные байты
+    assert written == CHUNK
+    assert path.read_bytes() == data[:CHUNK]
+
+
+def test_cancelled_write_waits_for_thread_before_truncating(
+    tmp_path: Path, monkeypatch
+):
+    path = tmp_path / "video.mp4.part"
+    data = _data(CHUNK * 3)
+    write = FileWriter._write
+    started = threading.Event()
+
+    def slow_write(self, chunk):
+        started.set()
+        time.sleep(0.2)
+        return write(self, chunk)
+
+    monkeypatch.setattr(FileWriter, "_write", slow_write)
+    options = WriteOptions(buffer_size=CHUNK, preallocate=True)
+
+    async def download(f):
+        for offset in range(0, len(data), CHUNK):
+            await f.write(data[offset : offset + CHUNK])
+        await asyncio.sleep(10)
+
+    async def run():
+        writer = DiskWriter(workers=2)
+        f = writer.open(path, len(data), options)
+
+        async def transfer():
+            async with f:
+                await download(f)
+
+        task = asyncio.create_task(transfer())
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return f.written
+
+    written = asyncio.run(run())
+    assert written % CHUNK == 0
+    assert path.stat().st_size == written
+    assert path.read_bytes() == data[:written]
+
+
+def test_resume_appends_after_offset(tmp_path: Path):
+    path = tmp_path / "image.jpg.part"
+    data = _data(CHUNK * 2 + 100)
+    path.write_bytes(data[:CHUNK] + b"\0" * 10)
+
+    async def run():
+        writer = DiskWriter(workers=1)
+        async with writer.open(path, len(data), WriteOptions(), CHUNK) as f:
+            await f.write(data[CHUNK:])
+
+    asyncio.run(run())
+    assert path.read_bytes() == data
+
+
+def test_cancelled_pooled_write_keeps_buffer_until_thread_is_done(
+    tmp_path: Path, monkeypatch
+):
+    path = tmp_path / "video.mp4.part"
+    data = _data(CHUNK * 2)
+    write = FileWriter._write
+    started = threading.Event()
+
+    def slow_write(self, chunk):
+        started.set()
+        time.sleep(0.2)
+        return write(self, chunk)
+
+    monkeypatch.setattr(FileWriter, "_write", slow_write)
+    pool = BufferPool(limit=CHUNK * 2)
+    options = WriteOptions(buffer_size=CHUNK, pool=pool)
+
+    async def run():
+        writer = DiskWriter(workers=2)
+        f = writer.open(path, None, options)
+
+        async def transfer():
+            async with f:
+                await f.write(data[:CHUNK])
+                # Второй буфер ждет записи первого: здесь загрузку и отменяют
+                await f.write(data[CHUNK:])
+
+        task = asyncio.create_task(transfer())
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        # Пока поток пишет, его буфер не должен достаться другой загрузке
+        buffer = await pool.acquire(CHUNK)
+        assert f._io.done()
+        buffer[:] = b"\xff" * CHUNK
+        pool.release(buffer)
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return f.written
+
+    written = asyncio.run(run())
+    assert written == CHUNK
+    assert path.read_bytes() == data[:CHUNK]
@@ -0,0 +1,22 @@
+import json
+
+from core.boosty.defs import BoostyTextDto
+from core.draftjs_converter import DraftJsConverter
+
+BOLD = 0
+ITALIC = 2
+
+
+def _html(text: str, styles: list) -> str:
+    content = json.dumps([text, "unstyled", styles])
+    return DraftJsConverter([BoostyTextDto(content, "")]).to_html()
+
+
+def test_html_nests_overlapping_styles():
+    html = _html("0123456789", [[BOLD, 0, 5], [ITALIC, 3, 5]])
+    assert "<strong>012<em>34</em></strong><em>567</em>89" in html
+
+
+def test_html_keeps_contained_style_inside():
+    html = _html("0123456789", [[BOLD, 0, 10], [ITALIC, 3, 2]])
+    assert "<strong>012<em>34</em>56789</strong>" in html
@@ -0,0 +1,43 @@
+from types import MethodType, SimpleNamespace
+
+from core.progress_counter import ProgressCounter
+from core.task import FileProgress, Task
+
+
+def _task(total: int):
+    """Задача с настоящим _advance и своим счетчиком прогресса"""
+    task = SimpleNamespace(_downloaded_bytes=0, _percent=0)
+    task._advance = MethodType(Task._advance, task)
+    return task, ProgressCounter(total=total)
+
+
+def test_shared_file_counted_once_globally():
+    total = ProgressCounter(total=None)
+    progress = FileProgress(1000, total)
+    first, first_pbar = _task(1000)
+    second, second_pbar = _task(1000)
+
+    first_watcher = progress.watch(first, first_pbar)
+    progress.advance(400)
+    # Вторая задача присоединяется к уже идущей загрузке
+    second_watcher = progress.watch(second, second_pbar)
+    progress.advance(600)
+    progress.unwatch(first_watcher)
+    progress.unwatch(second_watcher)
+
+    assert total.n == 1000
+    assert first_pbar.n == second_pbar.n == 1000
+    assert first._percent == second._percent == 100
+
+
+def test_restarted_file_rolls_back_global_once():
+    total = ProgressCounter(total=None)
+    progress = FileProgress(1000, total)
+    watchers = [progress.watch(*_task(1000)) for _ in range(2)]
+    progress.advance(300)
+    progress.advance(-300)
+    progress.advance(1000)
+    for watcher in watchers:
+        progress.unwatch(watcher)
+
+    assert total.n == 1000
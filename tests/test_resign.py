@@ -0,0 +1,68 @@
+import asyncio
+from pathlib import Path
+from typing import List, Optional
+
+import pytest
+from aiohttp import ClientResponseError, ClientSession, web
+from aiohttp.test_utils import TestServer
+
+from core.pipeline import DownloadPipeline
+from core.task import FileProgress, Task
+
+BODY = b"audio" * 1000
+
+
+async def _download(
+    tmp_path: Path, fresh: Optional[str], requests: List[str], resigned: List[str]
+) -> None:
+    """
+    Качает файл, ссылка которого подписана истекшей подписью: сервер отдает
+    его только с подписью fresh. В requests - подписи запросов, в resigned -
+    вызовы resign.
+    """
+
+    async def audio(request: web.Request) -> web.Response:
+        sign = request.query["sign"]
+        requests.append(sign)
+        if sign != fresh:
+            return web.Response(status=403)
+        return web.Response(body=BODY)
+
+    app = web.Application()
+    app.router.add_get("/audio", audio)
+    async with TestServer(app) as server:
+        url = str(server.make_url("/audio"))
+
+        async def resign() -> Optional[str]:
+            resigned.append(url)
+            return f"{url}?sign={fresh}" if fresh else None
+
+        task = Task(DownloadPipeline.create(), "author", "post")
+        await task._download_file(
+            session=ClientSession(),
+            file_url=f"{url}?sign=stale",
+            save_path=tmp_path / "audio.mp3",
+            progress=FileProgress(len(BODY)),
+            size=len(BODY),
+            resign=resign,
+        )
+
+
+def test_expired_signature_is_refreshed_once(tmp_path: Path):
+    requests: List[str] = []
+    resigned: List[str] = []
+    asyncio.run(_download(tmp_path, "fresh", requests, resigned))
+    assert requests == ["stale", "fresh"]
+    assert len(resigned) == 1
+    assert (tmp_path / "audio.mp3").read_bytes() == BODY
+
+
+def test_refused_refresh_fails_without_retrying(tmp_path: Path):
+    requests: List[str] = []
+    resigned: List[str] = []
+    with pytest.raises(ClientResponseError) as error:
+        asyncio.run(_download(tmp_path, None, requests, resigned))
+    assert error.value.status == 403
+    assert requests == ["stale"]
+    assert len(resigned) == 1
+    assert not (tmp_path / "audio.mp3").exists()
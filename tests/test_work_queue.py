@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+from typing import List, Tuple
+
+from core.work_queue import FileWorkQueue
+
+
+def _transfer_order(policy: str, posts: List[Tuple[str, List[int]]]) -> List[str]:
+    """Порядок, в котором один воркер передает файлы постов (автор, размеры)"""
+    order: List[str] = []
+
+    async def run() -> None:
+        queue = FileWorkQueue(workers=1, pause=0, policy=policy)
+
+        def job(name: str):
+            async def transfer() -> None:
+                order.append(name)
+
+            return transfer
+
+        batches = []
+        for n, (author, sizes) in enumerate(posts):
+            task = SimpleNamespace(author=author, priority=0)
+            batches.append(
+                queue.submit(
+                    task,
+                    [(size, job(f"{author}{n}.{i}")) for i, size in enumerate(sizes)],
+                )
+            )
+        try:
+            for batch in batches:
+                await batch.wait()
+        finally:
+            queue.stop()
+
+    asyncio.run(run())
+    return order
+
+
+def test_fifo_transfers_posts_in_submission_order():
+    order = _transfer_order("fifo", [("a", [1, 1, 1]), ("b", [1, 1])])
+    assert order == ["a0.0", "a0.1", "a0.2", "b1.0", "b1.1"]
+
+
+def test_fair_interleaves_authors_at_transfer_stage():
+    posts = [("a", [1, 1]), ("a", [1, 1]), ("b", [1, 1])]
+    order = _transfer_order("fair", posts)
+    assert [name[0] for name in order] == ["a", "b", "a", "b", "a", "a"]
+
+
+def test_shortest_transfers_post_with_fewest_bytes_left_first():
+    order = _transfer_order("shortest", [("a", [3, 3, 3]), ("b", [2, 2])])
+    assert order == ["b1.0", "b1.1", "a0.0", "a0.1", "a0.2"]